@@ -11,33 +11,39 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import django
 from pathlib import Path
 
 import logging
-import boto3
 # logging.basicConfig(level=logging.DEBUG)
-# boto3.set_stream_logger(name='botocore')
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
-# Quick-start development settings - unsuitable for production
+# Settings profile: 'production' turns off DEBUG, keeps database connections
+# open and trims the middleware; anything else keeps the development defaults.
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
+DJANGO_ENV = os.getenv('DJANGO_ENV', 'development')
+PRODUCTION = DJANGO_ENV == 'production'
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-uily!@muefxe&=ys+7$xe(h^n2-%umy9a1^w_8$9-z_*!$y1sr'
+SECRET_KEY = os.getenv('SECRET_KEY', 'django-insecure-uily!@muefxe&=ys+7$xe(h^n2-%umy9a1^w_8$9-z_*!$y1sr')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# With DEBUG on, Django also keeps every SQL statement in memory
+DEBUG = os.getenv('DEBUG', str(not PRODUCTION)) == 'True'
 
-ALLOWED_HOSTS = ['*']
+ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '*').split(',')
+
+# The admin needs the session, auth and message middleware; an API-only
+# deployment leaves all of them out
+ADMIN_ENABLED = os.getenv('ADMIN_ENABLED', str(not PRODUCTION)) == 'True'
 
 
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -50,10 +56,13 @@ INSTALLED_APPS = [
     'corsheaders',
     'rest_framework_simplejwt',
 ]
+if ADMIN_ENABLED:
+    INSTALLED_APPS.insert(0, 'django.contrib.admin')
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Roles come from the token claims (shop/authentication.py)
+        'shop.authentication.ClaimsJWTAuthentication',
     ),
 }
 
@@ -65,6 +74,9 @@ SIMPLE_JWT = {
 
 AUTH_USER_MODEL = 'shop.User'
 
+# MySQL has no partial indexes; Django skips product_in_stock_idx there
+SILENCED_SYSTEM_CHECKS = ['models.W037']
+
 import logging
 
 # LOGGING = {
@@ -96,16 +108,32 @@ import logging
 
 
 
-MIDDLEWARE = [
-    'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'corsheaders.middleware.CorsMiddleware',
-]
+if ADMIN_ENABLED:
+    MIDDLEWARE = [
+        'django.middleware.security.SecurityMiddleware',
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.common.CommonMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+        'corsheaders.middleware.CorsMiddleware',
+    ]
+else:
+    # The API authenticates with JWTs (DRF), not sessions, and its views
+    # are CSRF exempt
+    MIDDLEWARE = [
+        'corsheaders.middleware.CorsMiddleware',
+        'django.middleware.security.SecurityMiddleware',
+        'django.middleware.common.CommonMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    ]
+
+# Request metrics (shop/metrics.py), served at /api/metrics/: the share of
+# requests timed (0 turns timing off) and the networks allowed to scrape
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', '0.1' if PRODUCTION else '1.0'))
+METRICS_ALLOWED_NETWORKS = os.getenv('METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128').split(',')
+MIDDLEWARE.insert(0, 'shop.metrics.MetricsMiddleware')
 
 # CORS_ALLOWED_ORIGINS = ['*']
 
@@ -117,17 +145,24 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
-                'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Templates (admin, DRF's browsable API) are compiled once per process
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
+if DEBUG:
+    TEMPLATES[0]['OPTIONS']['context_processors'].insert(0, 'django.template.context_processors.debug')
 
 WSGI_APPLICATION = 'electronic.wsgi.application'
 
@@ -136,16 +171,59 @@ WSGI_APPLICATION = 'electronic.wsgi.application'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
 
+# Connections stay open for DB_CONN_MAX_AGE seconds (None: forever) instead
+# of one per request, and are pinged before reuse after an error.
+# DB_POOL_SIZE > 0 pools connections instead: Django's own pool on PostgreSQL
+# (Django 5.1+ with psycopg 3), django-db-connection-pool on MySQL (pip install
+# django-db-connection-pool[mysql]). Other backends, and PostgreSQL on older
+# Django, keep persistent connections (DB_CONN_MAX_AGE). Point DB_ENGINE/DB_NAME
+# at django.db.backends.sqlite3 and a file for a local stand-in.
+DB_ENGINE = os.getenv('DB_ENGINE', 'django.db.backends.mysql')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '0'))
+DB_CONN_MAX_AGE = os.getenv('DB_CONN_MAX_AGE', '60' if PRODUCTION else '0')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'NAME': 'backend',
-        'USER': 'admin',
-        'PASSWORD': 'admin1234',
-        'HOST': 'database-1.c1o42oas4wyp.us-east-1.rds.amazonaws.com',
-        'PORT': '3306',
+        'ENGINE': DB_ENGINE,
+        'NAME': os.getenv('DB_NAME', 'backend'),
+        'USER': os.getenv('DB_USER', 'admin'),
+        'PASSWORD': os.getenv('DB_PASSWORD', 'admin1234'),
+        'HOST': os.getenv('DB_HOST', 'database-1.c1o42oas4wyp.us-east-1.rds.amazonaws.com'),
+        'PORT': os.getenv('DB_PORT', '3306'),
+        'CONN_MAX_AGE': None if DB_CONN_MAX_AGE == 'None' else int(DB_CONN_MAX_AGE),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+if DB_POOL_SIZE and DB_ENGINE == 'django.db.backends.mysql':
+    # The pool keeps the connections; Django must close its own each request
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['ENGINE'] = 'dj_db_conn_pool.backends.mysql'
+    DATABASES['default']['POOL_OPTIONS'] = {'POOL_SIZE': DB_POOL_SIZE, 'MAX_OVERFLOW': DB_POOL_SIZE, 'RECYCLE': 3600}
+elif DB_POOL_SIZE and DB_ENGINE == 'django.db.backends.postgresql' and django.VERSION >= (5, 1):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {'pool': {'min_size': 1, 'max_size': DB_POOL_SIZE}}
+
+# Read replicas (shop/replicas.py): comma-separated hosts sharing the other
+# DB_* values, or database files for SQLite stand-ins. Read-only views use
+# them; run `manage.py replica_heartbeat` so their lag can be measured.
+DB_REPLICAS = [replica for replica in os.getenv('DB_REPLICAS', '').split(',') if replica]
+DATABASE_REPLICAS = []
+for number, replica in enumerate(DB_REPLICAS, 1):
+    alias = f'replica{number}'
+    if DB_ENGINE == 'django.db.backends.sqlite3':
+        DATABASES[alias] = dict(DATABASES['default'], NAME=replica)
+    else:
+        # A real replica cannot host a test database; tests read the primary's
+        DATABASES[alias] = dict(DATABASES['default'], HOST=replica, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['shop.replicas.ReplicaRouter']
+    MIDDLEWARE.append('shop.replicas.PrimaryStickinessMiddleware')
+# Seconds of lag after which a replica leaves the rotation, seconds between
+# lag checks, and seconds a user reads from the primary after writing
+REPLICA_MAX_LAG = 3
+REPLICA_CHECK_INTERVAL = 5
+REPLICA_STICKY_SECONDS = 10
 
 # DATABASES = {
 #     'default': {
@@ -155,6 +233,64 @@ DATABASES = {
 # }
 
 
+# Cache
+# Catalog responses are cached per catalog version (see shop/cache.py).
+# LocMemCache evicts least recently used entries past MAX_ENTRIES; for Redis,
+# run the server with `maxmemory-policy allkeys-lru` to get the same bound.
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'shop-catalog',
+            'OPTIONS': {
+                'MAX_ENTRIES': 5000,
+            },
+        }
+    }
+
+SHOP_CACHE_ALIAS = 'default'
+SHOP_CACHE_TIMEOUT = 300
+# Seconds a User row read for a token-authenticated request stays cached
+USER_CACHE_TIMEOUT = 60
+# Seconds browsers and CDNs may reuse a public catalog response before
+# revalidating it with If-None-Match (shop/conditional.py)
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', '0'))
+
+# Reserve flash-sale products from their StockShard counters (shop/stock.py)
+STOCK_SHARDING = os.getenv('STOCK_SHARDING', 'False') == 'True'
+
+# Product search (shop/search.py): 'auto' uses MySQL FULLTEXT or Postgres
+# tsvector when available, the in-process BM25 index otherwise ('local')
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+
+# Price facet bucket boundaries (shop/facets.py); the last bucket is open-ended
+PRODUCT_PRICE_BUCKETS = [0, 50, 100, 250, 500, 1000]
+
+# Password hashing for login/register (shop/passwords.py): worker processes
+# (0 hashes in the request thread), hashes running or waiting at once, and
+# seconds an attempt waits for a slot before it is answered 503
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_CONCURRENCY = int(os.getenv('PASSWORD_HASH_CONCURRENCY', '8'))
+PASSWORD_HASH_WAIT = 2
+
+# Login/register token buckets (shop/throttle.py) as (burst, tokens per
+# second); None turns a limit off. Behind a proxy that does not set
+# REMOTE_ADDR, set USE_X_FORWARDED_FOR
+LOGIN_IP_BUCKET = (30, 0.5)
+LOGIN_USERNAME_BUCKET = (5, 0.05)
+USE_X_FORWARDED_FOR = os.getenv('USE_X_FORWARDED_FOR', 'False') == 'True'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -202,15 +338,45 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID', 'default-access-key')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY', 'default-secret-key')
-print(os.environ)
 AWS_STORAGE_BUCKET_NAME = 'allproductsimages'
 AWS_REGION_NAME = 'us-east-1'
 SNS_TOPIC_ARN = 'arn:aws:sns:us-east-1:014498666344:SellerNotificationsTopic'
 SQS_QUEUE_URL = 'https://sqs.us-east-1.amazonaws.com/014498666344/OrderQueue'
+# Shared boto3 clients (shop/aws.py)
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '50'))
+AWS_RETRY_MODE = os.getenv('AWS_RETRY_MODE', 'standard')
+AWS_MAX_ATTEMPTS = int(os.getenv('AWS_MAX_ATTEMPTS', '3'))
+AWS_UPLOAD_PART_SIZE = int(os.getenv('AWS_UPLOAD_PART_SIZE', str(8 * 1024 * 1024)))
+AWS_UPLOAD_CONCURRENCY = int(os.getenv('AWS_UPLOAD_CONCURRENCY', '4'))
+
+# Product image variants (shop/images.py), longest side in pixels
+IMAGE_PROCESSING = os.getenv('IMAGE_PROCESSING', 'True') == 'True'
+IMAGE_PROCESS_WORKERS = int(os.getenv('IMAGE_PROCESS_WORKERS', '2'))
+IMAGE_VARIANT_SIZES = {'thumb': 200, 'medium': 800}
+IMAGE_WEBP_VARIANTS = True
+
+# Order receipts (shop/receipts.py): 'lambda' or 'local'
+RECEIPT_RENDERER = os.getenv('RECEIPT_RENDERER', 'lambda')
+RECEIPT_LAMBDA_FUNCTION = 'make_receipt'
+RECEIPT_PREGENERATE = os.getenv('RECEIPT_PREGENERATE', 'True') == 'True'
+RECEIPT_WORKERS = 4
+
+# Serve the hot endpoints from shop/async_views.py (ASGI deployments only)
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+ASYNC_AWS_WORKERS = 16
+
+# Outbox dispatcher (shop/outbox.py)
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF_SECONDS = 2
+OUTBOX_BACKOFF_MAX_SECONDS = 300
+
+# Orders older than this move to the archive table (manage.py archive_orders)
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', '365'))
 AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.{AWS_REGION_NAME}.amazonaws.com'
 MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/media/'
 
-# DEBUG=True
+# Console logging. At DEBUG level, with DEBUG on, every SQL statement is logged
+LOG_LEVEL = os.getenv('DJANGO_LOG_LEVEL', 'DEBUG' if DEBUG else 'WARNING')
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -223,8 +389,13 @@ LOGGING = {
     'loggers': {
         'django': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': True,
         },
+        'shop': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
     },
 }
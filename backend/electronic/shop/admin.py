@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Product, Order
+from .models import User, Product, Order, ArchivedOrder, OutboxMessage
 
 # Register User model
 @admin.register(User)
@@ -37,3 +37,18 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'buyer', 'product', 'quantity', 'total_price', 'created_at')
     list_filter = ('buyer', 'product', 'created_at')
     search_fields = ('buyer__username', 'product__name')
+
+
+# Register ArchivedOrder model
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'buyer', 'product', 'quantity', 'total_price', 'created_at')
+    list_filter = ('created_at',)
+    search_fields = ('buyer__username', 'product__name')
+
+
+# Register Outbox model
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'attempts', 'available_at', 'created_at')
+    search_fields = ('last_error',)
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+    def ready(self):
+        # Keeps the in-process search index current (shop/search.py)
+        from . import search  # noqa: F401
+        # Drops cached users when their row changes (shop/authentication.py)
+        from . import authentication  # noqa: F401
+        # Bumps the catalog version when a product is saved or deleted (shop/cache.py)
+        from . import cache  # noqa: F401
+        # Warns about a per-process catalog cache in `check --deploy` (shop/checks.py)
+        from . import checks  # noqa: F401
+        # Times the queries of sampled requests (shop/metrics.py)
+        from .metrics import instrument_connection
+        connection_created.connect(instrument_connection, dispatch_uid='shop-metrics')
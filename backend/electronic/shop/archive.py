@@ -0,0 +1,184 @@
+'''
+    Order archive: recent orders in Order, old ones in ArchivedOrder
+
+    Every hot query (placing orders, validators, the first pages of the
+    order feeds, the admin) reads Order, which only holds the last
+    ORDER_ARCHIVE_AFTER_DAYS of orders. `manage.py archive_orders` moves
+    older ones, oldest first, so each archived order is older than any
+    left in Order: a newest-first history reads Order, then the archive.
+    `Order.history` does that behind the QuerySet API; `Order.objects`
+    still reads recent orders only. Stored receipts move with their
+    orders, to ArchivedReceipt.
+
+    Native partitioning is not used because MySQL cannot partition a table
+    with foreign keys, and Order has several.
+'''
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Order, ArchivedOrder, Receipt, ArchivedReceipt
+
+ARCHIVED_FIELDS = (
+    'id', 'buyer_id', 'product_id', 'seller_id', 'quantity', 'address', 'total_price', 'created_at', 'updated_at',
+)
+
+
+def archive_cutoff():
+    """Orders created before this are due for the archive."""
+    return timezone.now() - timedelta(days=getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 365))
+
+
+def archive_orders_batch(cutoff, batch_size):
+    """
+    Move up to `batch_size` orders created before `cutoff` to the archive,
+    oldest first, in one transaction, with their stored receipts.
+
+    :return: Number of orders moved
+    """
+    with transaction.atomic():
+        rows = list(
+            Order.objects.filter(created_at__lt=cutoff)
+            .order_by('created_at', 'id')
+            .values(*ARCHIVED_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        ids = [row['id'] for row in rows]
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**row) for row in rows])
+        ArchivedReceipt.objects.bulk_create([
+            ArchivedReceipt(**receipt)
+            for receipt in Receipt.objects.filter(order_id__in=ids).values('order_id', 'body', 'etag', 'created_at')
+        ])
+        # Deletes the receipts copied above too
+        Order.objects.filter(id__in=ids).delete()
+    return len(rows)
+
+
+class OrderHistoryQuerySet:
+    """
+    Order and the archive read as one queryset, Order's rows first; what
+    `Order.history` returns:
+
+        Order.history.filter(buyer_id=1).order_by('-created_at', '-id')[:20]
+
+    It has the QuerySet methods histories and exports use. Each is applied
+    to both tables, and a slice only reads the archive when Order cannot
+    fill it. Rows are in order across the two for newest-first orderings
+    on created_at, since every archived order is older than any left in
+    Order; other orderings are kept within each table only.
+    """
+
+    def __init__(self, querysets, start=0, stop=None):
+        self.querysets = tuple(querysets)
+        self.start, self.stop = start, stop
+        self._result_cache = None
+
+    @property
+    def model(self):
+        return self.querysets[0].model
+
+    def _chain(self, method, *args, **kwargs):
+        querysets = (getattr(queryset, method)(*args, **kwargs) for queryset in self.querysets)
+        return OrderHistoryQuerySet(querysets, self.start, self.stop)
+
+    def _not_sliced(self):
+        if self.start or self.stop is not None:
+            raise TypeError('Cannot filter a query once a slice has been taken.')
+
+    def all(self):
+        return self._chain('all')
+
+    def filter(self, *args, **kwargs):
+        self._not_sliced()
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        self._not_sliced()
+        return self._chain('exclude', *args, **kwargs)
+
+    def order_by(self, *fields):
+        self._not_sliced()
+        return self._chain('order_by', *fields)
+
+    def select_related(self, *fields):
+        return self._chain('select_related', *fields)
+
+    def values(self, *fields):
+        return self._chain('values', *fields)
+
+    def values_list(self, *fields, **kwargs):
+        return self._chain('values_list', *fields, **kwargs)
+
+    def using(self, alias):
+        return self._chain('using', alias)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self[key:key + 1])[0]
+        if key.step is not None or (key.start or 0) < 0 or (key.stop is not None and key.stop < 0):
+            raise ValueError('Only forward slices without a step are supported.')
+        start = self.start + (key.start or 0)
+        stop = self.stop
+        if key.stop is not None:
+            stop = self.start + key.stop if stop is None else min(stop, self.start + key.stop)
+        return OrderHistoryQuerySet(self.querysets, start, stop)
+
+    def _rows(self):
+        skip = self.start
+        remaining = None if self.stop is None else max(0, self.stop - self.start)
+        for queryset in self.querysets:
+            if remaining == 0:
+                return
+            if skip:
+                size = queryset.count()
+                if skip >= size:
+                    skip -= size
+                    continue
+            rows = list(queryset[skip:] if remaining is None else queryset[skip:skip + remaining])
+            skip = 0
+            if remaining is not None:
+                remaining -= len(rows)
+            yield from rows
+
+    def _fetch(self):
+        if self._result_cache is None:
+            self._result_cache = list(self._rows())
+        return self._result_cache
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    def __len__(self):
+        return len(self._fetch())
+
+    def __bool__(self):
+        return bool(self._fetch())
+
+    def count(self):
+        if self._result_cache is not None or self.start or self.stop is not None:
+            return len(self._fetch())
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def exists(self):
+        if self._result_cache is not None or self.start or self.stop is not None:
+            return bool(self._fetch())
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def first(self):
+        rows = list(self[:1])
+        return rows[0] if rows else None
+
+    def get(self, *args, **kwargs):
+        """
+        The one matching row, from Order or the archive.
+
+        :raises Order.DoesNotExist: If neither has it
+        """
+        for queryset in self.filter(*args, **kwargs).querysets:
+            try:
+                return queryset.get()
+            except queryset.model.DoesNotExist:
+                pass
+        raise self.model.DoesNotExist('Order matching query does not exist.')
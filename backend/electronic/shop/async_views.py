@@ -0,0 +1,215 @@
+'''
+    Async (ASGI) versions of the hot read and checkout endpoints
+
+    DRF's @api_view is sync-only, so these are plain Django async views that
+    authenticate the JWT themselves. shop/urls.py routes to them instead of
+    the sync views when ASYNC_VIEWS is on; run them under an ASGI server
+    (e.g. `uvicorn electronic.asgi:application`).
+'''
+
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.http import JsonResponse, HttpResponseNotModified
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from .authentication import ClaimsJWTAuthentication
+from .cache import acached_payload, acatalog_stamp
+from .conditional import (
+    catalog_etag_for, product_etag_for, product_last_modified_for, from_timestamp, not_modified, add_validators,
+    etag_matches,
+)
+from .exports import export_response
+from .models import Product, Order, ArchivedOrder
+from .orders import create_order, order_data
+from .receipts import render_receipt, make_etag, receipt_model, stored_receipt
+from .replicas import read_replica
+from .serializers import FastJsonResponse, Schema
+from .stock import OutOfStock, add_shard_stock
+from .facets import cached_facets
+from .views import (
+    parse_product_fields, parse_product_filters, parse_page_params, parse_product_id, parse_export_format,
+    filter_products, sorted_page_queryset, page_fields, trim_page, product_export_transform,
+)
+
+logger = logging.getLogger(__name__)
+
+# Blocking AWS calls (boto3 has no asyncio API) run here, so a slow Lambda
+# can occupy at most this many threads however many requests wait on it.
+_aws_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_AWS_WORKERS', 16), thread_name_prefix='aws',
+)
+
+
+async def authenticate(request):
+    """
+    Resolve the Bearer token of a request.
+
+    :return: The user, or None if no valid token was sent
+    """
+    try:
+        result = await sync_to_async(ClaimsJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def unauthenticated():
+    return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+# Home Page (Product List)
+@read_replica
+async def home(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid method'}, status=405)
+    try:
+        fields = parse_product_fields(request.GET.get('fields'))
+        filters, sort = parse_product_filters(request)
+        cursor, limit = parse_page_params(request, sort)
+        export_format = parse_export_format(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    version, bumped_at = await acatalog_stamp()
+    etag, last_modified = catalog_etag_for(request, version), from_timestamp(bumped_at)
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    if export_format:
+        # Django iterates the (sync) chunk generator in a worker thread
+        fields = page_fields(fields, sort)
+        ordering = ('id',) if sort == 'id' else (sort, '-id' if sort.startswith('-') else 'id')
+        return export_response(
+            filter_products(Product.objects.all(), filters),
+            Schema({field: field for field in fields}), ordering, export_format, 'products',
+            transform=product_export_transform(fields),
+        )
+
+    async def build():
+        queryset = sorted_page_queryset(filter_products(Product.objects.all(), filters), sort, cursor)
+        rows = [row async for row in queryset.values(*page_fields(fields, sort))[:limit + 1]]
+        rows, next_cursor = trim_page(rows, fields, sort, limit)
+        return {'products': await sync_to_async(add_shard_stock)(rows), 'next_cursor': next_cursor}
+
+    params = dict(filters, fields=','.join(fields), sort=sort, cursor=request.GET.get('cursor'), limit=limit)
+    payload = await acached_payload('home', build, params)
+    if request.GET.get('facets', '').lower() in ('1', 'true'):
+        queryset = filter_products(Product.objects.all(), filters)
+        payload = dict(payload, facets=await sync_to_async(cached_facets)(queryset, filters))
+    return add_validators(FastJsonResponse(payload), etag, last_modified)
+
+
+# Product Detail API
+@read_replica
+async def product_detail(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid method'}, status=405)
+    try:
+        product_id = parse_product_id(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    updated_at = await Product.objects.filter(id=product_id).values_list('updated_at', flat=True).afirst()
+    version, bumped_at = await acatalog_stamp()
+    etag = product_etag_for(request, updated_at, version)
+    last_modified = product_last_modified_for(updated_at, bumped_at)
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    async def build():
+        product = await Product.objects.filter(id=product_id).values(
+            'id', 'name', 'description', 'price', 'stock', 'image_url', 'image_variants', 'seller_id',
+        ).afirst()
+        if product is None:
+            raise Product.DoesNotExist
+        await sync_to_async(add_shard_stock)([product])
+        return {'product': product}
+
+    try:
+        payload = await acached_payload('product_detail', build, {'product_id': product_id})
+        return add_validators(FastJsonResponse(payload), etag, last_modified)
+    except Product.DoesNotExist:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+
+
+# Place Order API (Protected)
+@csrf_exempt
+async def place_order(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid method'}, status=405)
+    user = await authenticate(request)
+    if user is None:
+        return unauthenticated()
+    if not user.is_buyer:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+
+    try:
+        data = json.loads(request.body)
+        product_id = data.get('product_id')
+        quantity = int(data.get('quantity'))
+        address = data.get('address')
+
+        if quantity <= 0:
+            return JsonResponse({'error': 'Quantity must be positive'}, status=400)
+
+        product = await Product.objects.select_related('seller').filter(id=product_id).afirst()
+        if product is None:
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+
+        # Transactions are sync-only in Django
+        order = await sync_to_async(create_order)(user, product, quantity, address)
+        return FastJsonResponse({'order': order_data(order, product)}, status=201)
+
+    except OutOfStock as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except KeyError as e:
+        return JsonResponse({'error': f'Missing field: {str(e)}'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def get_order_receipt(request, order_id):
+    """Fetch and generate a receipt for a specific order."""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid method'}, status=405)
+    user = await authenticate(request)
+    if user is None:
+        return unauthenticated()
+
+    try:
+        receipt = await sync_to_async(stored_receipt)(order_id, user.id)
+        if receipt:
+            body, etag = receipt['body'], receipt['etag']
+        else:
+            order = await Order.objects.select_related('product').filter(id=order_id, buyer_id=user.id).afirst()
+            if order is None:
+                order = await ArchivedOrder.objects.select_related('product').aget(id=order_id, buyer_id=user.id)
+            loop = asyncio.get_running_loop()
+            body, cacheable = await loop.run_in_executor(_aws_executor, render_receipt, order)
+            etag = make_etag(body)
+            if cacheable:
+                try:
+                    await receipt_model(order).objects.acreate(order_id=order.id, body=body, etag=etag)
+                except IntegrityError:
+                    pass
+
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = FastJsonResponse(body)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=86400'
+        return response
+
+    except ArchivedOrder.DoesNotExist:
+        return JsonResponse({'error': 'Order not found'}, status=404)
+    except Exception as e:
+        logger.exception('Receipt of order %s failed', order_id)
+        return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,138 @@
+'''
+    JWT authentication that reads the user's roles from the token
+
+    `login_user` writes `username`, `is_seller` and `is_buyer` into the
+    token, so an authenticated request needs no query on the user table.
+    Views get a `ClaimsUser` and filter on `request.user.id`; the rare
+    attribute that is not a claim loads the full row through a short-lived
+    cache.
+
+    Tokens are trusted for their lifetime (SIMPLE_JWT ACCESS_TOKEN_LIFETIME):
+    a user deactivated or given other roles keeps the old claims until the
+    access token expires. Tokens issued without the claims are resolved
+    from the database, as before.
+'''
+
+import threading
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import RefreshToken
+from .cache import get_cache
+
+User = get_user_model()
+
+# Claims written at login; a token carrying all of them is served statelessly
+USER_CLAIMS = ('username', 'is_seller', 'is_buyer')
+USER_CACHE_KEY = 'shop:user:{}'
+
+_stats_lock = threading.Lock()
+_stats = {'stateless': 0, 'database': 0, 'hits': 0, 'misses': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def auth_stats():
+    """
+    Return the counters of this process: requests authenticated from claims
+    alone ('stateless') or with a user query ('database'), and the hits and
+    misses of the user cache.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    requests = stats['stateless'] + stats['database']
+    stats['stateless_rate'] = stats['stateless'] / requests if requests else 0.0
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def tokens_for(user):
+    """
+    Refresh token of `user` with the role claims; its access tokens inherit them.
+    """
+    refresh = RefreshToken.for_user(user)
+    for claim in USER_CLAIMS:
+        refresh[claim] = getattr(user, claim)
+    return refresh
+
+
+def get_cached_user(user_id):
+    """
+    The User row, cached for USER_CACHE_TIMEOUT seconds.
+
+    :return: The User, or None if it does not exist
+    """
+    cache = get_cache()
+    key = USER_CACHE_KEY.format(user_id)
+    user = cache.get(key)
+    if user is not None:
+        _count('hits')
+        return user
+
+    _count('misses')
+    user = User.objects.filter(id=user_id).first()
+    if user is not None:
+        cache.set(key, user, timeout=getattr(settings, 'USER_CACHE_TIMEOUT', 60))
+    return user
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    get_cache().delete(USER_CACHE_KEY.format(instance.id))
+
+
+class ClaimsUser(TokenUser):
+    """
+    The authenticated user as described by its access token.
+
+    Claims are read from the token; any other attribute (e.g. `email`) comes
+    from the cached User row. It is not a model instance, so filter on
+    `buyer_id=request.user.id` rather than `buyer=request.user`.
+    """
+
+    def __str__(self):
+        return self.username
+
+    @cached_property
+    def is_seller(self):
+        return self.token['is_seller']
+
+    @cached_property
+    def is_buyer(self):
+        return self.token['is_buyer']
+
+    @cached_property
+    def user(self):
+        """The full User row, for attributes that are not claims."""
+        return get_cached_user(self.id)
+
+    def __getattr__(self, attr):
+        # Only reached for names the class does not define
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        if attr in self.token:
+            return self.token[attr]
+        return getattr(self.user, attr)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that returns a ClaimsUser for tokens issued by
+    `tokens_for`, and the User row for older tokens.
+    """
+
+    def get_user(self, validated_token):
+        if all(claim in validated_token for claim in USER_CLAIMS):
+            _count('stateless')
+            return ClaimsUser(validated_token)
+        _count('database')
+        return super().get_user(validated_token)
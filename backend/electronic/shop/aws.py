@@ -2,12 +2,128 @@
     This is a custom library
 '''
 
-from decimal import Decimal
-import json
+import logging
+import os
+import threading
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
 from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
 from electronic.settings import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_STORAGE_BUCKET_NAME, AWS_REGION_NAME, SNS_TOPIC_ARN, SQS_QUEUE_URL
+from .serializers import dumps
+from .metrics import instrument_client
+
+logger = logging.getLogger(__name__)
+
+# Client registry
+#
+# boto3 clients are thread-safe but expensive to build (endpoint resolution,
+# a new connection pool), so one client per (service, region) is shared by
+# every thread of the process. Sessions are not thread-safe, so clients are
+# created under a lock. After a fork (gunicorn/uvicorn workers) the child
+# drops the inherited clients, whose sockets belong to the parent.
+
+_clients = {}
+_clients_lock = threading.Lock()
+_clients_pid = os.getpid()
+_session = None
+_client_stats = {'created': 0, 'reused': 0}
+
+
+def client_config():
+    return Config(
+        max_pool_connections=getattr(settings, 'AWS_MAX_POOL_CONNECTIONS', 50),
+        tcp_keepalive=True,
+        retries={
+            'mode': getattr(settings, 'AWS_RETRY_MODE', 'standard'),
+            'total_max_attempts': getattr(settings, 'AWS_MAX_ATTEMPTS', 3),
+        },
+    )
+
+
+def reset_clients():
+    """
+    Forget every cached client and the session; called in forked children.
+    """
+    global _session, _clients_pid, _clients_lock
+    # The lock may have been held by another thread at fork time
+    _clients_lock = threading.Lock()
+    _clients.clear()
+    _session = None
+    _clients_pid = os.getpid()
+    _client_stats.update(created=0, reused=0)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_clients)
+
+
+def get_client(service, region_name=AWS_REGION_NAME):
+    """
+    Return the shared boto3 client for a service and region.
+
+    :param service: AWS service name, e.g. "s3" or "sqs"
+    :param region_name: AWS region of the client
+    :return: A boto3 client, created on first use
+    """
+    global _session
+    if _clients_pid != os.getpid():
+        reset_clients()
+
+    key = (service, region_name)
+    client = _clients.get(key)
+    if client is not None:
+        _client_stats['reused'] += 1
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            if _session is None:
+                _session = boto3.session.Session(
+                    aws_access_key_id=AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                )
+            client = _session.client(service, region_name=region_name, config=client_config())
+            instrument_client(client)
+            _clients[key] = client
+            _client_stats['created'] += 1
+        else:
+            _client_stats['reused'] += 1
+    return client
+
+
+def client_stats():
+    """
+    Return how many clients this process created and how often they were reused.
+    """
+    return dict(_client_stats, cached=len(_clients))
+
+
+def object_url(object_name):
+    """Public URL of an object in the product bucket."""
+    return f"https://{AWS_STORAGE_BUCKET_NAME}.s3.{AWS_REGION_NAME}.amazonaws.com/{object_name}"
+
+
+def object_key_from_url(file_url):
+    """Inverse of `object_url`: the S3 key of a product bucket URL."""
+    return file_url.split(".amazonaws.com/", 1)[-1]
+
+
+def s3_object_exists(object_name):
+    """
+    Check whether a key exists in the product bucket.
+    """
+    try:
+        get_client("s3").head_object(Bucket=AWS_STORAGE_BUCKET_NAME, Key=object_name)
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
 
 def upload_to_s3(file_path, object_name):
     """
@@ -18,19 +134,13 @@ def upload_to_s3(file_path, object_name):
     :return: URL of the uploaded file or None if failed
     """
     try:
-        # Initialize the S3 client with credentials from settings
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            region_name=AWS_REGION_NAME,
-        )
+        s3 = get_client("s3")
 
         # Upload the file
         s3.upload_file(file_path, AWS_STORAGE_BUCKET_NAME, object_name)
 
         # Generate the file URL
-        file_url = f"https://{AWS_STORAGE_BUCKET_NAME}.s3.{AWS_REGION_NAME}.amazonaws.com/{object_name}"
+        file_url = object_url(object_name)
         print(f"File uploaded successfully: {file_url}")
         return file_url
 
@@ -48,13 +158,55 @@ def upload_to_s3(file_path, object_name):
         return None
 
 
-def delete_from_s3(object_name, region_name="us-east-1"):
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-        region_name=AWS_REGION_NAME,
+def transfer_config():
+    """
+    Multipart settings for streamed uploads. Memory used by one upload is
+    bounded by part size x concurrency, whatever the file size.
+    """
+    concurrency = getattr(settings, 'AWS_UPLOAD_CONCURRENCY', 4)
+    config = TransferConfig(
+        multipart_threshold=getattr(settings, 'AWS_UPLOAD_PART_SIZE', 8 * 1024 * 1024),
+        multipart_chunksize=getattr(settings, 'AWS_UPLOAD_PART_SIZE', 8 * 1024 * 1024),
+        max_concurrency=concurrency,
     )
+    # s3transfer buffers 10 parts by default; keep no more than are in flight
+    config.max_in_memory_upload_chunks = concurrency
+    return config
+
+
+def upload_fileobj_to_s3(fileobj, object_name, content_type=None):
+    """
+    Stream a file-like object (e.g. an UploadedFile) to S3 without a temp file.
+
+    :param fileobj: Readable binary file object, read once in parts
+    :param object_name: S3 object name (key)
+    :param content_type: Content-Type to store on the object
+    :return: URL of the uploaded file or None if failed
+    """
+    try:
+        s3 = get_client("s3")
+
+        extra_args = {'ContentType': content_type} if content_type else None
+        s3.upload_fileobj(fileobj, AWS_STORAGE_BUCKET_NAME, object_name,
+                          ExtraArgs=extra_args, Config=transfer_config())
+
+        file_url = object_url(object_name)
+        logger.info('File uploaded successfully: %s', file_url)
+        return file_url
+
+    except NoCredentialsError:
+        logger.error('AWS credentials not available.')
+        return None
+    except PartialCredentialsError:
+        logger.error('Incomplete AWS credentials configuration.')
+        return None
+    except Exception:
+        logger.exception('Upload of %s failed', object_name)
+        return None
+
+
+def delete_from_s3(object_name, region_name="us-east-1"):
+    s3 = get_client("s3")
     try:
         s3.delete_object(Bucket=AWS_STORAGE_BUCKET_NAME, Key=object_name)
         return True
@@ -66,11 +218,7 @@ def subscribe_seller_to_sns(seller_email):
     """
     Subscribe a seller's email to the SNS topic.
     """
-    sns_client = boto3.client('sns',
-                              aws_access_key_id=AWS_ACCESS_KEY_ID,
-                              aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-                              region_name=AWS_REGION_NAME
-                              )
+    sns_client = get_client('sns')
     topic_arn = SNS_TOPIC_ARN
 
     try:
@@ -87,26 +235,21 @@ def subscribe_seller_to_sns(seller_email):
         return None
 
 
+def serialize_message(message_body):
+    """
+    Serialize a notification body for SQS, with Decimals as numbers.
+    """
+    return dumps(message_body, numeric_decimals=True).decode('utf-8')
+
+
 def send_seller_notification(message_body):
     """
     Send a notification to a seller via SQS.
     """
     try:
-        # Serialize message body, converting Decimal to float
-        def decimal_converter(obj):
-            if isinstance(obj, Decimal):
-                return float(obj)
-            raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
-
-        serialized_message = json.dumps(message_body, default=decimal_converter)
-
-        # Initialize the SQS client
-        sqs_client = boto3.client(
-            'sqs',
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            region_name=AWS_REGION_NAME,
-        )
+        serialized_message = serialize_message(message_body)
+
+        sqs_client = get_client('sqs')
 
         # Send the message
         response = sqs_client.send_message(
@@ -126,3 +269,23 @@ def send_seller_notification(message_body):
     except Exception as e:
         print(f"Unexpected Error: {e}")
         raise
+
+
+def send_seller_notification_batch(messages, sqs_client=None):
+    """
+    Send up to 10 already serialized notifications in one SQS call.
+
+    :param messages: Mapping of entry id to serialized message body
+    :param sqs_client: Client to use instead of the shared one
+    :return: Tuple of (ids sent, {id: error message} for ids that failed)
+    """
+    if sqs_client is None:
+        sqs_client = get_client('sqs')
+
+    response = sqs_client.send_message_batch(
+        QueueUrl=SQS_QUEUE_URL,
+        Entries=[{'Id': str(entry_id), 'MessageBody': body} for entry_id, body in messages.items()],
+    )
+    sent = [entry['Id'] for entry in response.get('Successful', [])]
+    failed = {entry['Id']: entry.get('Message', entry.get('Code', '')) for entry in response.get('Failed', [])}
+    return sent, failed
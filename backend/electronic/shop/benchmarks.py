@@ -0,0 +1,477 @@
+'''
+    Endpoint benchmarks: a seeded dataset, one scenario per URL name and
+    a comparison against a stored baseline
+
+    `manage.py seed_dataset` fills User, Product and Order with a
+    reproducible dataset (10k, 100k or 1M orders); `manage.py
+    bench_endpoints` drives every route of shop/urls.py against it, through
+    Django's test client or over HTTP with concurrency, and reports
+    latency percentiles, throughput and queries per request as JSON.
+
+    For a run, AWS is replaced by StubAWSClient, so the numbers are the
+    application's own, and every request is sampled by MetricsMiddleware
+    (shop/metrics.py), which gives the query counts. Both only apply to
+    the test client and to the server the command starts itself, not to a
+    deployment given by URL.
+'''
+
+import io
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+from decimal import Decimal
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.test import Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.utils import timezone
+from . import aws
+from .authentication import tokens_for
+from .metrics import reset_metrics, view_stats
+from .models import User, Product, Order, ArchivedOrder
+from .passwords import hash_password
+from .receipts import render_receipt_locally
+from .sales import rebuild_daily_sales
+
+DATASET_SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+# Every bench user's name starts with it, so the dataset can be dropped
+BENCH_PREFIX = 'bench_'
+BENCH_PASSWORD = 'bench-password'
+AWS_SERVICES = ('s3', 'sqs', 'sns', 'lambda')
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# Dataset
+
+@contextmanager
+def explicit_timestamps(model):
+    """Let bulk_create keep the created_at/updated_at values it is given."""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def dataset_counts():
+    return {
+        'users': User.objects.count(),
+        'products': Product.objects.count(),
+        'orders': Order.objects.count(),
+        'archived_orders': ArchivedOrder.objects.count(),
+    }
+
+
+def clear_dataset(batch_size=5000):
+    """Delete every bench user with their products and orders, orders in batches."""
+    buyers = User.objects.filter(username__startswith=BENCH_PREFIX)
+    for model in (Order, ArchivedOrder):
+        while True:
+            ids = list(model.objects.filter(buyer__in=buyers).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            model.objects.filter(id__in=ids).delete()
+    buyers.delete()
+
+
+def seed_dataset(orders, seed=0, days=90, batch_size=5000, log=None):
+    """
+    Create `orders` orders, with a tenth as many products, a twentieth as
+    many buyers and a thousandth as many sellers, spread over the last
+    `days` days, then rebuild the sales aggregates of those days.
+
+    The same `orders` and `seed` always give the same rows, up to ids.
+
+    :param log: Called with progress messages
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    sellers = max(2, orders // 1000)
+    products = max(10, orders // 10)
+    buyers = max(10, orders // 20)
+
+    # One hash for everyone: hashing a million times would be the benchmark
+    password = hash_password(BENCH_PASSWORD)
+    User.objects.bulk_create([
+        User(username=f'{BENCH_PREFIX}seller_{i}', email=f'seller_{i}@bench.example', password=password, is_seller=True)
+        for i in range(sellers)
+    ], batch_size=batch_size)
+    User.objects.bulk_create([
+        User(username=f'{BENCH_PREFIX}buyer_{i}', password=password, is_buyer=True)
+        for i in range(buyers)
+    ], batch_size=batch_size)
+    # MySQL does not return the ids of bulk inserts
+    seller_ids = list(User.objects.filter(username__startswith=f'{BENCH_PREFIX}seller_').values_list('id', flat=True))
+    buyer_ids = list(User.objects.filter(username__startswith=f'{BENCH_PREFIX}buyer_').values_list('id', flat=True))
+    log(f'{len(seller_ids)} sellers, {len(buyer_ids)} buyers')
+
+    for start in range(0, products, batch_size):
+        Product.objects.bulk_create([
+            Product(
+                seller_id=seller_ids[i % len(seller_ids)], name=f'Bench product {i}',
+                description=f'Seeded product {i} for benchmarks',
+                price=Decimal(rng.randint(100, 100_000)) / 100, stock=rng.randint(0, 1000),
+            )
+            for i in range(start, min(products, start + batch_size))
+        ])
+    catalog = list(Product.objects.filter(seller_id__in=seller_ids).values_list('id', 'seller_id', 'price'))
+    log(f'{len(catalog)} products')
+
+    now = timezone.now()
+    window = days * 24 * 3600
+    created = 0
+    with explicit_timestamps(Order):
+        while created < orders:
+            batch = []
+            for _ in range(min(batch_size, orders - created)):
+                product_id, seller_id, price = catalog[rng.randrange(len(catalog))]
+                quantity = rng.randint(1, 3)
+                created_at = now - timedelta(seconds=rng.randrange(window))
+                batch.append(Order(
+                    buyer_id=buyer_ids[rng.randrange(len(buyer_ids))], product_id=product_id, seller_id=seller_id,
+                    quantity=quantity, address=f'{rng.randint(1, 999)} Bench Street',
+                    total_price=price * quantity, created_at=created_at, updated_at=created_at,
+                ))
+            Order.objects.bulk_create(batch)
+            created += len(batch)
+            log(f'{created} orders')
+
+    today = timezone.localdate()
+    start = today - timedelta(days=days)
+    while start <= today:
+        end = min(start + timedelta(days=7), today + timedelta(days=1))
+        rebuild_daily_sales(start, end)
+        start = end
+    log('Sales aggregates rebuilt')
+
+
+# AWS stand-in
+
+class StubAWSClient:
+    """
+    Answers the calls shop/aws.py makes at once, without the network.
+    Uploads are read to the end, as the real transfer would.
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    def head_object(self, **kwargs):
+        raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+
+    def upload_fileobj(self, fileobj, *args, **kwargs):
+        while fileobj.read(1024 * 1024):
+            pass
+
+    def subscribe(self, **kwargs):
+        return {'SubscriptionArn': f"arn:aws:sns:bench:{kwargs.get('Endpoint', '')}"}
+
+    def send_message(self, **kwargs):
+        return {'MessageId': 'bench'}
+
+    def send_message_batch(self, Entries, **kwargs):
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries], 'Failed': []}
+
+    def invoke(self, Payload, **kwargs):
+        body = render_receipt_locally(json.loads(Payload))
+        return {'Payload': io.BytesIO(json.dumps({'statusCode': 200, 'body': json.dumps(body)}).encode('utf-8'))}
+
+    def __getattr__(self, name):
+        # delete_object, upload_file, ...
+        return lambda *args, **kwargs: {}
+
+
+@contextmanager
+def stub_aws():
+    """Serve every `shop.aws.get_client` call from StubAWSClient."""
+    aws.reset_clients()
+    for service in AWS_SERVICES:
+        aws._clients[(service, aws.AWS_REGION_NAME)] = StubAWSClient(service)
+    try:
+        yield
+    finally:
+        aws.reset_clients()
+
+
+# Scenarios
+
+class Route:
+    """
+    How to call one URL name: `request(i)` gives the (method, path, body,
+    content type) of the i-th call, and `token` its Bearer token.
+    """
+
+    def __init__(self, name, method, path, token=None, body=None, content_type='application/json'):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.token = token
+        self.body = body
+        self.content_type = content_type
+
+    def request(self, i):
+        body = self.body(i) if callable(self.body) else self.body
+        path = self.path(i) if callable(self.path) else self.path
+        if body is None:
+            return self.method, path, b'', self.content_type
+        if self.content_type == MULTIPART_CONTENT:
+            return self.method, path, encode_multipart(BOUNDARY, body), self.content_type
+        return self.method, path, json.dumps(body).encode('utf-8'), self.content_type
+
+
+def url_names():
+    """Every named route of shop/urls.py."""
+    from . import urls
+    return {pattern.name for pattern in urls.urlpatterns if pattern.name}
+
+
+def build_routes(count):
+    """
+    A Route per URL name, on the seeded dataset, for `count` calls each.
+
+    Rows the calls use up (products to delete, stock to order) are created
+    here, before any timing.
+    """
+    seller = User.objects.filter(username__startswith=f'{BENCH_PREFIX}seller_').order_by('id').first()
+    buyer = (
+        User.objects.filter(username__startswith=f'{BENCH_PREFIX}buyer_', orders__isnull=False)
+        .order_by('id').first()
+    )
+    if seller is None or buyer is None:
+        raise ValueError('No bench dataset: run `manage.py seed_dataset` first')
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:50])
+    order_id = Order.objects.filter(buyer=buyer).order_by('-created_at', '-id').values_list('id', flat=True).first()
+    # Enough stock for every order placed
+    hot, other = [
+        Product.objects.create(seller=seller, name=name, description='', price='19.99', stock=count * 4 + 100)
+        for name in ('Bench hot product', 'Bench cart product')
+    ]
+    doomed = Product.objects.bulk_create([
+        Product(seller=seller, name=f'Bench delete {i}', description='', price='1.00', stock=1)
+        for i in range(count)
+    ])
+    if doomed and doomed[0].id is None:
+        doomed = Product.objects.filter(seller=seller, name__startswith='Bench delete ').order_by('id')
+    doomed_ids = [row.id for row in doomed]
+    run = int(time.time())
+    seller_token = str(tokens_for(seller).access_token)
+    buyer_token = str(tokens_for(buyer).access_token)
+
+    def new_product(i):
+        # Distinct content, so each one is uploaded rather than found in S3
+        upload = io.BytesIO(f'bench image {run} {i}'.encode('utf-8'))
+        upload.name = f'bench_{i}.png'
+        return {'name': f'Bench new {i}', 'description': '', 'price': '5.00', 'stock': '10', 'image': upload}
+
+    return [
+        Route('home', 'GET', '/api/products/'),
+        Route('product_detail', 'GET', lambda i: f'/api/product/?product_id={product_ids[i % len(product_ids)]}'),
+        Route('search', 'GET', '/api/products/search/?q=bench+product'),
+        Route('autocomplete', 'GET', '/api/products/autocomplete/?q=bench'),
+        Route('seller_products', 'GET', '/api/seller/products/', seller_token),
+        Route('add_product', 'POST', '/api/seller/add/', seller_token, new_product, MULTIPART_CONTENT),
+        Route('delete_product', 'DELETE', '/api/seller/delete/', seller_token,
+              lambda i: {'product_id': doomed_ids[i]}),
+        Route('place_order', 'POST', '/api/order/', buyer_token,
+              {'product_id': hot.id, 'quantity': 1, 'address': '1 Bench Street'}),
+        Route('place_bulk_order', 'POST', '/api/order/batch/', buyer_token,
+              {'items': [{'product_id': hot.id, 'quantity': 1}, {'product_id': other.id, 'quantity': 1}],
+               'address': '1 Bench Street'}),
+        Route('order_history', 'GET', '/api/orders/', buyer_token),
+        Route('register', 'POST', '/api/register/', None,
+              lambda i: {'username': f'{BENCH_PREFIX}reg_{run}_{i}', 'password': BENCH_PASSWORD, 'is_buyer': True}),
+        Route('get_user_info', 'GET', '/api/user/', buyer_token),
+        Route('login', 'POST', '/api/login/', None, {'username': buyer.username, 'password': BENCH_PASSWORD}),
+        Route('edit_product', 'PUT', '/api/seller/edit/', seller_token,
+              lambda i: {'product_id': hot.id, 'description': f'Edited {i}'}),
+        Route('seller_order', 'GET', '/api/seller/orders/', seller_token),
+        Route('seller_dashboard', 'GET', '/api/seller/dashboard/', seller_token),
+        Route('order-receipt', 'GET', f'/api/orders/{order_id}/receipt/', buyer_token),
+        Route('metrics', 'GET', '/api/metrics/'),
+    ]
+
+
+# Drivers
+
+def summarize(latencies, errors, wall):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / wall if wall else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def run_in_process(route, count):
+    """`count` sequential calls through Django's test client."""
+    client = Client(raise_request_exception=False)
+    headers = {'Authorization': f'Bearer {route.token}'} if route.token else {}
+    requests = [route.request(i) for i in range(count)]
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for method, path, body, content_type in requests:
+        request_started = time.perf_counter()
+        response = client.generic(method, path, body, content_type, headers=headers)
+        latencies.append(time.perf_counter() - request_started)
+        errors += response.status_code >= 400
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def run_over_http(route, count, base_url, concurrency):
+    """`count` calls from `concurrency` threads to `base_url`."""
+    headers = {'Authorization': f'Bearer {route.token}'} if route.token else {}
+    requests = []
+    for i in range(count):
+        method, path, body, content_type = route.request(i)
+        requests.append(urllib.request.Request(
+            base_url + path, data=body or None, method=method, headers=dict(headers, **{'Content-Type': content_type}),
+        ))
+    latencies = []
+    errors = [0]
+    pending = iter(requests)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                request = next(pending, None)
+            if request is None:
+                return
+            request_started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    response.read()
+                failed = False
+            except urllib.error.HTTPError:
+                failed = True
+            except OSError:
+                failed = True
+            elapsed = time.perf_counter() - request_started
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_in_thread():
+    """Run the project on an ephemeral port with runserver's threaded server; yields its URL."""
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+    server.set_app(get_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def bench_settings():
+    """
+    Settings for a run: every request sampled and no login throttling.
+    Image variants and receipt pre-generation are off: they run after the
+    response, possibly after the AWS stub is gone (variants in other
+    processes), and would only add noise to the next route's numbers.
+    """
+    with override_settings(
+        METRICS_SAMPLE_RATE=1.0, LOGIN_IP_BUCKET=None, LOGIN_USERNAME_BUCKET=None,
+        IMAGE_PROCESSING=False, RECEIPT_PREGENERATE=False, ALLOWED_HOSTS=['*'],
+    ):
+        yield
+
+
+def run_benchmark(mode='inprocess', count=100, concurrency=8, base_url=None, routes=None):
+    """
+    Call every route `count` times.
+
+    :param mode: 'inprocess' (test client, one at a time) or 'http'
+    :param base_url: Server to load for 'http'; default one started here
+    :param routes: URL names to run; default all
+    :return: The JSON-ready report
+    """
+    report = {
+        'mode': mode,
+        'vendor': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+        'requests_per_route': count,
+        'concurrency': concurrency if mode == 'http' else 1,
+        'dataset': dataset_counts(),
+        'routes': {},
+    }
+    with bench_settings(), stub_aws():
+        scenario = [route for route in build_routes(count) if not routes or route.name in routes]
+        server = serve_in_thread() if mode == 'http' and not base_url else nullcontext(base_url)
+        with server as url:
+            for route in scenario:
+                reset_metrics()
+                if mode == 'http':
+                    result = run_over_http(route, count, url.rstrip('/'), concurrency)
+                else:
+                    result = run_in_process(route, count)
+                stats = view_stats().get(route.name)
+                # Unknown when the server is another process
+                result['queries_per_request'] = stats['queries'] / stats['requests'] if stats else None
+                report['routes'][route.name] = result
+    return report
+
+
+def compare(report, baseline, tolerance=0.25, floor_ms=1.0):
+    """
+    Regressions of `report` against `baseline`: a p95 more than `tolerance`
+    (and `floor_ms`) slower, throughput down by more than `tolerance`,
+    half a query or more per request added, or new errors. Cache races
+    make query counts of concurrent runs vary by less than that.
+
+    :return: One message per regression
+    """
+    regressions = []
+    for name, result in report['routes'].items():
+        before = baseline.get('routes', {}).get(name)
+        if before is None:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + tolerance) and result['p95_ms'] - before['p95_ms'] > floor_ms:
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if result['throughput'] * (1 + tolerance) < before['throughput']:
+            regressions.append(f"{name}: throughput {before['throughput']:.1f} -> {result['throughput']:.1f} req/s")
+        if None not in (result['queries_per_request'], before['queries_per_request']) \
+                and result['queries_per_request'] >= before['queries_per_request'] + 0.5:
+            regressions.append(
+                f"{name}: queries/request {before['queries_per_request']:g} -> {result['queries_per_request']:g}"
+            )
+        if result['errors'] > before['errors']:
+            regressions.append(f"{name}: errors {before['errors']} -> {result['errors']}")
+    return regressions
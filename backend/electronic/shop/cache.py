@@ -0,0 +1,213 @@
+'''
+    Versioned read-through cache for serialized catalog responses
+'''
+
+import hashlib
+import secrets
+import threading
+import time
+from functools import partial
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Product
+
+GLOBAL_VERSION_KEY = 'shop:catalog:v'
+SELLER_VERSION_KEY = 'shop:catalog:seller:{}:v'
+# When a version key was last bumped, as a Unix timestamp (Last-Modified)
+BUMPED_AT_SUFFIX = ':at'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'bumps': 0}
+
+
+def get_cache():
+    return caches[getattr(settings, 'SHOP_CACHE_ALIAS', 'default')]
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    """
+    Return the hit/miss counters of this process.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def _seed():
+    # A version key that was evicted starts again from a random value, not
+    # from 1: counting up from 1 again would reach versions that entries
+    # (and ETags) from before the eviction are still stored under. 62 bits
+    # leave room for incr() below the backends' 64-bit signed limit.
+    return secrets.randbits(62)
+
+
+def _version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        # add() keeps concurrent first readers from seeding it twice
+        seed = _seed()
+        cache.add(key, seed, timeout=None)
+        version = cache.get(key, seed)
+    return version
+
+
+def _bump(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted or never written: a fresh seed is as good as an increment
+        cache.set(key, _seed(), timeout=None)
+    cache.set(key + BUMPED_AT_SUFFIX, time.time(), timeout=None)
+    _count('bumps')
+
+
+def catalog_version():
+    return _version(GLOBAL_VERSION_KEY)
+
+
+def seller_version(seller_id):
+    return _version(SELLER_VERSION_KEY.format(seller_id))
+
+
+def catalog_stamp(seller_id=None):
+    """
+    Version and last bump time of the catalog, or of one seller's products.
+
+    Both come from the cache, so HTTP validators cost no query.
+
+    :return: Tuple of (version, bumped at as a Unix timestamp or None)
+    """
+    key = GLOBAL_VERSION_KEY if seller_id is None else SELLER_VERSION_KEY.format(seller_id)
+    return _version(key), get_cache().get(key + BUMPED_AT_SUFFIX)
+
+
+def bump_catalog_version(seller_id=None):
+    """
+    Invalidate cached catalog responses after a product write.
+
+    Entries are not deleted; the key they were stored under simply stops
+    being generated, and the cache backend evicts them as least recently used.
+
+    :param seller_id: Also invalidate this seller's own product list
+    """
+    _bump(GLOBAL_VERSION_KEY)
+    if seller_id is not None:
+        _bump(SELLER_VERSION_KEY.format(seller_id))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def _product_changed(sender, instance, **kwargs):
+    # Every save, the admin's included. After the commit, or a reader could
+    # cache the old row under the new version. QuerySet.update() sends no
+    # signal: callers that update bump themselves.
+    transaction.on_commit(partial(bump_catalog_version, instance.seller_id))
+
+
+def make_key(name, version, params=None):
+    digest = ''
+    if params:
+        raw = '&'.join(f"{k}={v}" for k, v in sorted(params.items()))
+        digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f"shop:{name}:{version}:{digest}"
+
+
+def cached_payload(name, build, params=None, seller_id=None):
+    """
+    Return the payload for `name`, building and storing it on a miss.
+
+    :param name: Name of the response, e.g. the view name
+    :param build: Callable that produces the payload from the database
+    :param params: Request parameters that change the payload
+    :param seller_id: Key on this seller's version instead of the global one
+    :return: The (possibly cached) payload
+    """
+    if seller_id is None:
+        version_key = GLOBAL_VERSION_KEY
+        version = _version(version_key)
+    else:
+        version_key = SELLER_VERSION_KEY.format(seller_id)
+        version = f"s{seller_id}.{_version(version_key)}"
+    key = make_key(name, version, params)
+
+    cache = get_cache()
+    payload = cache.get(key)
+    if payload is not None:
+        _count('hits')
+        return payload
+
+    _count('misses')
+    bumped_at = cache.get(version_key + BUMPED_AT_SUFFIX)
+    if bumped_at and time.time() - bumped_at < getattr(settings, 'REPLICA_MAX_LAG', 3):
+        # A replica may not have the write yet, and this entry would keep
+        # its view of the catalog until the next write
+        from .replicas import read_from_primary
+        with read_from_primary():
+            payload = build()
+    else:
+        payload = build()
+    cache.set(key, payload, timeout=getattr(settings, 'SHOP_CACHE_TIMEOUT', 300))
+    return payload
+
+
+# Async variants for the ASGI views (shop/async_views.py)
+
+async def _aversion(key):
+    cache = get_cache()
+    version = await cache.aget(key)
+    if version is None:
+        seed = _seed()
+        await cache.aadd(key, seed, timeout=None)
+        version = await cache.aget(key, seed)
+    return version
+
+
+async def acatalog_stamp(seller_id=None):
+    """
+    Async `catalog_stamp`.
+    """
+    key = GLOBAL_VERSION_KEY if seller_id is None else SELLER_VERSION_KEY.format(seller_id)
+    return await _aversion(key), await get_cache().aget(key + BUMPED_AT_SUFFIX)
+
+
+async def acached_payload(name, build, params=None, seller_id=None):
+    """
+    Async `cached_payload`; `build` is a coroutine function.
+    """
+    if seller_id is None:
+        version_key = GLOBAL_VERSION_KEY
+        version = await _aversion(version_key)
+    else:
+        version_key = SELLER_VERSION_KEY.format(seller_id)
+        version = f"s{seller_id}.{await _aversion(version_key)}"
+    key = make_key(name, version, params)
+
+    cache = get_cache()
+    payload = await cache.aget(key)
+    if payload is not None:
+        _count('hits')
+        return payload
+
+    _count('misses')
+    bumped_at = await cache.aget(version_key + BUMPED_AT_SUFFIX)
+    if bumped_at and time.time() - bumped_at < getattr(settings, 'REPLICA_MAX_LAG', 3):
+        # As in cached_payload
+        from .replicas import read_from_primary
+        with read_from_primary():
+            payload = await build()
+    else:
+        payload = await build()
+    await cache.aset(key, payload, timeout=getattr(settings, 'SHOP_CACHE_TIMEOUT', 300))
+    return payload
@@ -0,0 +1,22 @@
+'''
+    System checks for deployments (`manage.py check --deploy`)
+'''
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_catalog_cache(app_configs, **kwargs):
+    """The catalog versions must be seen by every worker process."""
+    from .cache import get_cache
+    if not isinstance(get_cache(), LocMemCache):
+        return []
+    return [Warning(
+        'The catalog cache (shop/cache.py) is per process.',
+        hint=(
+            'Each worker keeps its own catalog versions, so a write in one leaves the others '
+            'serving stale pages and 304s. Set REDIS_URL to share them.'
+        ),
+        id='shop.W001',
+    )]
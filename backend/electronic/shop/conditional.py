@@ -0,0 +1,194 @@
+'''
+    HTTP validators (ETag / Last-Modified) for the read endpoints
+
+    Every validator comes from a cheap stamp: the catalog version counters
+    in the cache, a product's `updated_at`, or the count and latest
+    `updated_at` of a buyer's orders. A request carrying a matching
+    If-None-Match / If-Modified-Since is answered 304 before the view
+    builds or serializes anything.
+'''
+
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import condition
+from .cache import catalog_stamp
+from .models import Product, Order
+
+
+def make_etag(*parts):
+    """Strong ETag over the stamp parts."""
+    raw = '|'.join(str(part) for part in parts)
+    return '"' + hashlib.sha1(raw.encode('utf-8')).hexdigest() + '"'
+
+
+def query_key(request):
+    """The query string in a canonical order, so equal requests share an ETag."""
+    return '&'.join(f'{key}={value}' for key, value in sorted(request.GET.items()))
+
+
+def from_timestamp(timestamp):
+    return datetime.fromtimestamp(timestamp, dt_timezone.utc) if timestamp else None
+
+
+def _memo(request, name, compute):
+    # The ETag and Last-Modified functions share one lookup per request
+    stamps = request.__dict__.setdefault('_shop_stamps', {})
+    if name not in stamps:
+        stamps[name] = compute()
+    return stamps[name]
+
+
+# Stamps of the individual endpoints
+
+def catalog_etag_for(request, version):
+    return make_etag('catalog', version, request.path, query_key(request))
+
+
+def catalog_etag(request, *args, **kwargs):
+    version, _ = _memo(request, 'catalog', catalog_stamp)
+    return catalog_etag_for(request, version)
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    _, bumped_at = _memo(request, 'catalog', catalog_stamp)
+    return from_timestamp(bumped_at)
+
+
+def seller_catalog_etag(request, *args, **kwargs):
+    version, _ = _memo(request, 'seller', lambda: catalog_stamp(request.user.id))
+    return make_etag('seller', request.user.id, version, request.path, query_key(request))
+
+
+def seller_catalog_last_modified(request, *args, **kwargs):
+    _, bumped_at = _memo(request, 'seller', lambda: catalog_stamp(request.user.id))
+    return from_timestamp(bumped_at)
+
+
+def _product_updated_at(request):
+    try:
+        return Product.objects.filter(id=request.GET.get('product_id')).values_list('updated_at', flat=True).first()
+    except (TypeError, ValueError):
+        # Malformed id: no validators, the view answers it
+        return None
+
+
+def product_etag_for(request, updated_at, version):
+    # The catalog version too: its payload is cached under it, and sharded
+    # stock (shop/stock.py) changes without touching updated_at
+    if updated_at is None:
+        return None
+    return make_etag('product', request.GET.get('product_id'), updated_at.isoformat(), version)
+
+
+def product_etag(request, *args, **kwargs):
+    version, _ = _memo(request, 'catalog', catalog_stamp)
+    return product_etag_for(request, _memo(request, 'product', lambda: _product_updated_at(request)), version)
+
+
+def product_last_modified_for(updated_at, bumped_at):
+    # The later of the row's and the catalog's last change, like the ETag
+    if updated_at is None:
+        return None
+    bumped_at = from_timestamp(bumped_at)
+    return max(updated_at, bumped_at) if bumped_at else updated_at
+
+
+def product_last_modified(request, *args, **kwargs):
+    _, bumped_at = _memo(request, 'catalog', catalog_stamp)
+    return product_last_modified_for(_memo(request, 'product', lambda: _product_updated_at(request)), bumped_at)
+
+
+def _buyer_orders_stamp(request):
+    # Count and Max are both read from order_buyer_updated_idx; the count
+    # catches deletions, which leave the latest updated_at unchanged
+    return Order.objects.filter(buyer_id=request.user.id).aggregate(count=Count('id'), updated_at=Max('updated_at'))
+
+
+def order_history_etag(request, *args, **kwargs):
+    stamp = _memo(request, 'orders', lambda: _buyer_orders_stamp(request))
+    updated_at = stamp['updated_at'].isoformat() if stamp['updated_at'] else ''
+    return make_etag('orders', request.user.id, stamp['count'], updated_at, query_key(request))
+
+
+def order_history_last_modified(request, *args, **kwargs):
+    return _memo(request, 'orders', lambda: _buyer_orders_stamp(request))['updated_at']
+
+
+def _opaque(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(request, etag):
+    """
+    Whether the request's If-None-Match lists `etag` or is `*`. Tags are
+    compared whole, and weakly, as RFC 9110 asks for If-None-Match.
+    """
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in etags or _opaque(etag) in {_opaque(candidate) for candidate in etags}
+
+
+def add_cache_headers(response, private):
+    """
+    Cache-Control for a validated response: shared caches may keep public
+    responses, and everything is revalidated after HTTP_CACHE_MAX_AGE.
+    """
+    if private:
+        patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+        patch_vary_headers(response, ['Authorization'])
+    else:
+        patch_cache_control(
+            response, public=True, max_age=getattr(settings, 'HTTP_CACHE_MAX_AGE', 0), must_revalidate=True,
+        )
+    return response
+
+
+def conditional(etag_func=None, last_modified_func=None, private=False):
+    """
+    Django's `condition` plus Cache-Control, for (DRF) function views.
+
+    Place it below @api_view/@permission_classes, so the stamp functions
+    see the authenticated user.
+    """
+    def decorator(view):
+        conditioned = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditioned(request, *args, **kwargs)
+            if response.status_code >= 400:
+                # Validators describe the resource, not an error about it
+                del response['ETag']
+                del response['Last-Modified']
+                return response
+            return add_cache_headers(response, private)
+        return wrapper
+    return decorator
+
+
+def not_modified(request, etag=None, last_modified=None, private=False):
+    """
+    For async views: the 304 response if the client's copy is current,
+    else None. Put the same validators on the full response with
+    `add_validators`.
+    """
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified and int(last_modified.timestamp()),
+    )
+    if response is None:
+        return None
+    return add_validators(response, etag, last_modified, private)
+
+
+def add_validators(response, etag=None, last_modified=None, private=False):
+    if response.status_code >= 400:
+        return response
+    if etag:
+        response.headers.setdefault('ETag', etag)
+    if last_modified:
+        response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+    return add_cache_headers(response, private)
@@ -0,0 +1,116 @@
+'''
+    Streaming NDJSON / CSV exports of order and product lists
+'''
+
+import csv
+import datetime
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from .serializers import dumps, encode_datetime
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+
+def keyset_chunks(queryset, lookups, ordering, chunk_size):
+    """
+    Yield the `.values_list(*lookups)` rows of `queryset` in chunks.
+
+    Each chunk is its own query that continues after the last row of the
+    previous one, so memory stays at one chunk whatever the table size.
+    `QuerySet.iterator()` does not give that on MySQL, whose driver reads
+    the whole result into memory.
+
+    :param ordering: Columns the rows are ordered by, all ascending or all
+        descending (e.g. ('-created_at', '-id')); the last one must be unique
+        and every one must be in `lookups`
+    """
+    descending = ordering[0].startswith('-')
+    columns = [name.lstrip('-') for name in ordering]
+    positions = [lookups.index(column) for column in columns]
+    queryset = queryset.order_by(*ordering).values_list(*lookups)
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            chunk = chunk.filter(keyset_after(columns, last, descending))
+        rows = list(chunk[:chunk_size])
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last = [rows[-1][position] for position in positions]
+
+
+def keyset_after(columns, values, descending=False):
+    """
+    Q for rows after `values` in (columns) order: (columns) > (values), or
+    < when descending.
+
+    The leading column is also bounded on its own (e.g. created_at <= X),
+    so the database can start an index range scan there instead of
+    filtering the whole table.
+    """
+    operator = 'lt' if descending else 'gt'
+    condition = Q(**{f'{columns[-1]}__{operator}': values[-1]})
+    for column, value in zip(reversed(columns[:-1]), reversed(values[:-1])):
+        condition = Q(**{f'{column}__{operator}': value}) | (Q(**{column: value}) & condition)
+    if len(columns) > 1:
+        condition &= Q(**{f'{columns[0]}__{operator}e': values[0]})
+    return condition
+
+
+def ndjson_lines(schema, chunks):
+    build = schema.build
+    for rows in chunks:
+        yield b''.join(dumps(build(row)) + b'\n' for row in rows)
+
+
+class _Echo:
+    """File-like object for csv.writer that hands back what is written."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return encode_datetime(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        # JSON columns, e.g. Product.image_variants
+        return dumps(value).decode('utf-8')
+    return value
+
+
+def csv_lines(schema, chunks):
+    writer = csv.writer(_Echo())
+    # Dotted schema keys, e.g. "product.name", are the column names
+    yield writer.writerow(schema.keys)
+    for rows in chunks:
+        yield ''.join(writer.writerow([_csv_value(value) for value in row]) for row in rows)
+
+
+def export_response(queryset, schema, ordering, export_format, filename, transform=None):
+    """
+    Stream every row of `queryset` through `schema` as NDJSON or CSV.
+
+    :param ordering: See `keyset_chunks`
+    :param export_format: One of EXPORT_FORMATS
+    :param filename: Download name for CSV, without extension
+    :param transform: Called with each chunk of rows, returns the rows to write
+    """
+    chunks = keyset_chunks(
+        queryset, schema.lookups, ordering, getattr(settings, 'EXPORT_CHUNK_SIZE', 2000),
+    )
+    if transform is not None:
+        chunks = map(transform, chunks)
+    if export_format == 'csv':
+        response = StreamingHttpResponse(csv_lines(schema, chunks), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    else:
+        response = StreamingHttpResponse(ndjson_lines(schema, chunks), content_type='application/x-ndjson')
+    # Keep proxies (nginx) from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,74 @@
+'''
+    Facet counts for the filtered product list
+'''
+
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import Count, Q
+from .cache import cached_payload
+from .stock import in_stock_condition
+
+# Sellers listed in the seller facet, biggest first
+FACET_SELLERS = 20
+
+
+def price_buckets():
+    """
+    (label, low, high) price ranges from PRODUCT_PRICE_BUCKETS; the last
+    one is open-ended.
+    """
+    bounds = [Decimal(str(bound)) for bound in getattr(settings, 'PRODUCT_PRICE_BUCKETS', [0, 50, 100, 250, 500, 1000])]
+    buckets = [(f"{low}-{high}", low, high) for low, high in zip(bounds, bounds[1:])]
+    buckets.append((f"{bounds[-1]}+", bounds[-1], None))
+    return buckets
+
+
+def product_facets(queryset):
+    """
+    Count the products of `queryset` per price bucket, in stock and per seller.
+
+    The totals and buckets come from one aggregate query with conditional
+    counts; the seller facet needs a second, grouped, query.
+    """
+    buckets = price_buckets()
+    aggregates = {
+        'total': Count('id'),
+        'in_stock': Count('id', filter=in_stock_condition()),
+    }
+    for i, (label, low, high) in enumerate(buckets):
+        condition = Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        aggregates[f'price_{i}'] = Count('id', filter=condition)
+    counts = queryset.aggregate(**aggregates)
+
+    sellers = (
+        queryset.values('seller_id', 'seller__username')
+        .annotate(count=Count('id'))
+        .order_by('-count', 'seller_id')[:FACET_SELLERS]
+    )
+    return {
+        'total': counts['total'],
+        'in_stock': counts['in_stock'],
+        'price': [
+            {'range': label, 'min': low, 'max': high, 'count': counts[f'price_{i}']}
+            for i, (label, low, high) in enumerate(buckets)
+        ],
+        'sellers': [
+            {'id': row['seller_id'], 'username': row['seller__username'], 'count': row['count']}
+            for row in sellers
+        ],
+    }
+
+
+def cached_facets(queryset, filters):
+    """
+    Facet counts of a filtered queryset, cached until the next catalog write.
+
+    They do not depend on the sort or the page, so every page of a listing
+    shares one entry.
+
+    :param queryset: The filtered products; only evaluated on a cache miss
+    :param filters: The filters applied to it, as cache params
+    """
+    return cached_payload('facets', lambda: product_facets(queryset), filters)
@@ -0,0 +1,206 @@
+'''
+    Product image pipeline: content-addressed originals and resized variants
+'''
+
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import django
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from electronic.settings import AWS_STORAGE_BUCKET_NAME
+from .aws import get_client, object_url, object_key_from_url, s3_object_exists, transfer_config, upload_fileobj_to_s3
+from .cache import bump_catalog_version
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# Variants are immutable: their key changes whenever the original does
+VARIANT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+class HashingReader:
+    """
+    Read-only, unseekable view of a file that hashes what is read through
+    it. Being unseekable, s3transfer reads it once, front to back.
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self._digest.update(data)
+        return data
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+def original_key(digest, filename):
+    extension = os.path.splitext(filename)[1].lower() or '.bin'
+    return f"media/products/{digest}{extension}"
+
+
+def variant_key(digest, variant, extension):
+    return f"media/products/variants/{digest}/{variant}.{extension}"
+
+
+def store_original(image):
+    """
+    Upload an UploadedFile under a key derived from its content.
+
+    Identical files share one object, so two sellers uploading
+    `photo.jpg` no longer overwrite each other. The file is read once: it
+    is hashed while it streams to a staging key, which is then copied
+    within S3 to its content key, or dropped if that already exists. Give
+    media/uploads/ a lifecycle rule expiring objects after a day, for
+    staging objects a crash left behind.
+
+    :return: Tuple of (URL or None if the upload failed, content digest)
+    """
+    image.seek(0)
+    reader = HashingReader(image)
+    staging_name = f"media/uploads/{uuid.uuid4().hex}"
+    if upload_fileobj_to_s3(reader, staging_name, image.content_type) is None:
+        return None, reader.hexdigest()
+    digest = reader.hexdigest()
+    object_name = original_key(digest, image.name)
+    s3 = get_client('s3')
+    try:
+        if not s3_object_exists(object_name):
+            s3.copy(
+                {'Bucket': AWS_STORAGE_BUCKET_NAME, 'Key': staging_name}, AWS_STORAGE_BUCKET_NAME, object_name,
+                Config=transfer_config(),
+            )
+        return object_url(object_name), digest
+    except Exception:
+        logger.exception('Storing %s failed', object_name)
+        return None, digest
+    finally:
+        s3.delete_object(Bucket=AWS_STORAGE_BUCKET_NAME, Key=staging_name)
+
+
+def variant_formats(image, webp):
+    """Formats each variant is written in, as (suffix, PIL format, extension, content type)."""
+    if image.mode == 'RGBA':
+        formats = [('', 'PNG', 'png', 'image/png')]
+    else:
+        formats = [('', 'JPEG', 'jpg', 'image/jpeg')]
+    if webp:
+        formats.append(('_webp', 'WEBP', 'webp', 'image/webp'))
+    return formats
+
+
+def render_variants(object_name, digest, sizes, webp):
+    """
+    Build and upload the resized variants of an original. Runs in a worker
+    process, so the request that uploaded the image never waits on it.
+
+    :param object_name: S3 key of the original
+    :param digest: Content hash of the original, used in the variant keys
+    :param sizes: Mapping of variant name to maximum width/height in pixels
+    :param webp: Also write a WebP copy of every variant
+    :return: Mapping of variant name to URL
+    """
+    from PIL import Image
+
+    s3 = get_client('s3')
+    body = s3.get_object(Bucket=AWS_STORAGE_BUCKET_NAME, Key=object_name)['Body'].read()
+    original = Image.open(io.BytesIO(body))
+    original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        has_alpha = 'A' in original.getbands() or 'transparency' in original.info
+        original = original.convert('RGBA' if has_alpha else 'RGB')
+
+    formats = variant_formats(original, webp)
+    urls = {}
+    for name, size in sizes.items():
+        variant = original.copy()
+        variant.thumbnail((size, size))
+        for suffix, image_format, extension, content_type in formats:
+            key = variant_key(digest, name, extension)
+            urls[name + suffix] = object_url(key)
+            if s3_object_exists(key):
+                continue
+            buffer = io.BytesIO()
+            variant.save(buffer, image_format, quality=85, optimize=True)
+            s3.put_object(
+                Bucket=AWS_STORAGE_BUCKET_NAME, Key=key, Body=buffer.getvalue(),
+                ContentType=content_type, CacheControl=VARIANT_CACHE_CONTROL,
+            )
+    return urls
+
+
+def get_executor():
+    """
+    Process pool for image work, created lazily in each worker process.
+
+    Children are started from a fork server (spawned where there is none),
+    not forked from the web worker: a fork copies locks other request
+    threads hold at that moment, and the child would wait on them forever.
+    They set Django up from DJANGO_SETTINGS_MODULE, which they inherit.
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            methods = multiprocessing.get_all_start_methods()
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_PROCESS_WORKERS', 2),
+                mp_context=multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn'),
+                initializer=django.setup,
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _store_variants(product_id, seller_id, image_url, scheduled_by, future):
+    try:
+        urls = future.result()
+    except Exception:
+        logger.exception('Image processing failed for product %s', product_id)
+        return
+    try:
+        # Skip the write if the product got another image meanwhile
+        updated = Product.objects.filter(id=product_id, image_url=image_url).update(
+            image_variants=urls, updated_at=timezone.now(),
+        )
+        if updated:
+            bump_catalog_version(seller_id)
+    finally:
+        # Callbacks normally run on the pool's management thread, which
+        # would otherwise keep its own database connection open.
+        if threading.get_ident() != scheduled_by:
+            connection.close()
+
+
+def schedule_variants(product, digest):
+    """
+    Queue variant generation for a product whose image was just stored.
+    The variant URLs are written to `Product.image_variants` when ready.
+    """
+    if not getattr(settings, 'IMAGE_PROCESSING', True):
+        return None
+    future = get_executor().submit(
+        render_variants,
+        object_key_from_url(product.image_url),
+        digest,
+        getattr(settings, 'IMAGE_VARIANT_SIZES', {'thumb': 200, 'medium': 800}),
+        getattr(settings, 'IMAGE_WEBP_VARIANTS', True),
+    )
+    future.add_done_callback(partial(
+        _store_variants, product.id, product.seller_id, product.image_url, threading.get_ident(),
+    ))
+    return future
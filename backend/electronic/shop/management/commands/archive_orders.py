@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from shop.archive import archive_cutoff, archive_orders_batch
+
+
+class Command(BaseCommand):
+    help = 'Move orders older than ORDER_ARCHIVE_AFTER_DAYS to the archive table, oldest first, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, help='Override ORDER_ARCHIVE_AFTER_DAYS')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.05,
+                            help='Seconds to pause between batches, to leave room for live traffic')
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] is None:
+            cutoff = archive_cutoff()
+        else:
+            cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+
+        total = 0
+        while True:
+            moved = archive_orders_batch(cutoff, options['batch_size'])
+            if not moved:
+                break
+            total += moved
+            self.stdout.write(f'Archived {total} order(s)')
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {total} order(s) archived before {cutoff:%Y-%m-%d}'))
@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+from shop.models import Order, Product
+
+
+class Command(BaseCommand):
+    help = 'Copy product.seller onto orders written before Order.seller existed, in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.05,
+                            help='Seconds to pause between batches, to leave room for live traffic')
+
+    def handle(self, *args, **options):
+        seller_of_product = Subquery(Product.objects.filter(id=OuterRef('product_id')).values('seller_id')[:1])
+        last_id = 0
+        total = 0
+        while True:
+            # Walk the primary key so each batch is a short range lock
+            ids = list(
+                Order.objects.filter(id__gt=last_id, seller__isnull=True)
+                .order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            total += Order.objects.filter(id__in=ids).update(seller_id=seller_of_product)
+            last_id = ids[-1]
+            self.stdout.write(f'Backfilled {total} order(s), up to id {last_id}')
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {total} order(s) updated'))
@@ -0,0 +1,63 @@
+import json
+import sys
+from contextlib import redirect_stdout
+from django.core.management.base import BaseCommand, CommandError
+from shop.benchmarks import compare, run_benchmark, url_names
+
+
+class Command(BaseCommand):
+    help = ('Call every route of shop/urls.py on the seeded dataset (manage.py seed_dataset), in-process or '
+            'over HTTP, and report p50/p95/p99 latency, throughput and queries per request as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=('inprocess', 'http'), default='inprocess',
+                            help="'inprocess': Django's test client, one request at a time; "
+                                 "'http': concurrent requests to a server started here or --base-url")
+        parser.add_argument('--base-url', help='Load this deployment instead (http mode; AWS is not stubbed there)')
+        parser.add_argument('--route', action='append', help='URL name to run (repeatable); default all')
+        parser.add_argument('--requests', type=int, default=100, help='Requests per route')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--output', help='Write the report to this file, e.g. to keep as a baseline')
+        parser.add_argument('--baseline', help='Report to compare against; regressions fail the command')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 / throughput change against the baseline, as a fraction')
+
+    def handle(self, *args, **options):
+        unknown = set(options['route'] or []) - url_names()
+        if unknown:
+            raise CommandError(f"Unknown route(s): {', '.join(sorted(unknown))}")
+        if options['base_url'] and options['mode'] != 'http':
+            raise CommandError('--base-url needs --mode http')
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        try:
+            # Views print; stdout is kept for the report
+            with redirect_stdout(sys.stderr):
+                report = run_benchmark(
+                    options['mode'], options['requests'], options['concurrency'], options['base_url'], options['route'],
+                )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        text = json.dumps(report, indent=2)
+        self.stdout.write(text)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(text + '\n')
+
+        if baseline:
+            if (baseline['mode'], baseline['concurrency']) != (report['mode'], report['concurrency']):
+                raise CommandError(
+                    f"The baseline ran {baseline['mode']} with concurrency {baseline['concurrency']}, "
+                    f"this run {report['mode']} with concurrency {report['concurrency']}"
+                )
+            regressions = compare(report, baseline, options['tolerance'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}')
+            self.stderr.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,106 @@
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from django.core.management.base import BaseCommand, CommandError
+from shop.benchmarks import percentile
+
+
+class Command(BaseCommand):
+    help = ('Load-test running deployments over HTTP, e.g. the WSGI (gunicorn) and '
+            'ASGI (uvicorn, ASYNC_VIEWS=True) servers side by side.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help='name=base_url, e.g. wsgi=http://127.0.0.1:8000; repeat to compare')
+        parser.add_argument('--path', action='append',
+                            help='GET path to request (repeatable); default /api/products/')
+        parser.add_argument('--token', help='JWT access token sent as a Bearer header')
+        parser.add_argument('--checkout', type=int, metavar='PRODUCT_ID',
+                            help='Also POST one-unit orders for this product (needs --token)')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per target')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        if options['checkout'] and not options['token']:
+            raise CommandError('--checkout needs --token')
+
+        results = {}
+        for target in options['target']:
+            name, _, base_url = target.partition('=')
+            if not base_url:
+                raise CommandError(f'Expected name=url, got {target!r}')
+            results[name] = self.run_target(base_url.rstrip('/'), options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:>8}: {result['throughput']:8.1f} req/s  p50 {result['p50_ms']:7.1f} ms  "
+                f"p95 {result['p95_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  errors {result['errors']}"
+            )
+
+    def build_requests(self, base_url, options):
+        headers = {'Content-Type': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f"Bearer {options['token']}"
+        requests = [
+            urllib.request.Request(base_url + path, headers=headers)
+            for path in options['path'] or ['/api/products/']
+        ]
+        if options['checkout']:
+            body = json.dumps({'product_id': options['checkout'], 'quantity': 1, 'address': 'bench'}).encode()
+            requests.append(urllib.request.Request(base_url + '/api/order/', data=body, headers=headers, method='POST'))
+        return requests
+
+    def run_target(self, base_url, options):
+        requests = self.build_requests(base_url, options)
+        total = options['requests']
+        latencies = []
+        errors = [0]
+        counter = iter(range(total))
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    index = next(counter, None)
+                if index is None:
+                    return
+                request = requests[index % len(requests)]
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request, timeout=30) as response:
+                        response.read()
+                    failed = False
+                except urllib.error.HTTPError as e:
+                    # 304/409 are answers, not failures
+                    failed = e.code >= 500
+                except OSError:
+                    failed = True
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    errors[0] += failed
+
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        return {
+            'requests': total,
+            'throughput': total / wall,
+            'mean_ms': statistics.mean(latencies) * 1000,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'errors': errors[0],
+        }
@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from shop import views
+from shop.models import User
+from shop.passwords import hash_password, reset_executor
+from .bench_http import percentile
+
+BENCH_PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    help = ('Logins per second per hashing core while catalog reads run alongside, '
+            'with hashes in the request threads and in the process pool.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default=f'0,{os.cpu_count()}',
+                            help='Comma-separated PASSWORD_HASH_WORKERS values to compare; 0 hashes inline')
+        parser.add_argument('--logins', type=int, default=8, help='Threads logging in')
+        parser.add_argument('--readers', type=int, default=8, help='Threads reading /api/products/')
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--seconds', type=float, default=10.0, help='Duration of each run')
+
+    def handle(self, *args, **options):
+        usernames = self.ensure_users(options['users'])
+        for workers in [int(value) for value in options['workers'].split(',')]:
+            # Hashing slots stay out of the way: the pool size is what is measured
+            with override_settings(
+                PASSWORD_HASH_WORKERS=workers, PASSWORD_HASH_CONCURRENCY=options['logins'],
+                LOGIN_IP_BUCKET=None, LOGIN_USERNAME_BUCKET=None,
+            ):
+                reset_executor()
+                result = self.run(usernames, options)
+                reset_executor()
+            cores = workers or min(options['logins'], os.cpu_count())
+            self.stdout.write(
+                f"{'inline' if not workers else f'{workers} workers':>10}: "
+                f"{result['logins'] / result['wall']:7.1f} logins/s "
+                f"({result['logins'] / result['wall'] / cores:6.1f}/core)  "
+                f"{result['reads'] / result['wall']:8.1f} reads/s  "
+                f"read p50 {result['p50_ms']:6.1f} ms  p99 {result['p99_ms']:7.1f} ms  errors {result['errors']}"
+            )
+
+    def ensure_users(self, count):
+        usernames = [f'bench_login_{i}' for i in range(count)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        User.objects.bulk_create([
+            User(username=username, password=hash_password(BENCH_PASSWORD), is_buyer=True)
+            for username in usernames if username not in existing
+        ])
+        return usernames
+
+    def run(self, usernames, options):
+        factory = RequestFactory()
+        stop = threading.Event()
+        lock = threading.Lock()
+        counts = {'logins': 0, 'reads': 0, 'errors': 0}
+        read_latencies = []
+
+        def login(index):
+            body = json.dumps({'username': usernames[index % len(usernames)], 'password': BENCH_PASSWORD})
+            while not stop.is_set():
+                request = factory.post('/api/login/', body, content_type='application/json')
+                response = views.login_user(request)
+                with lock:
+                    counts['logins' if response.status_code == 200 else 'errors'] += 1
+
+        def read():
+            while not stop.is_set():
+                started = time.perf_counter()
+                response = views.home(factory.get('/api/products/'))
+                elapsed = time.perf_counter() - started
+                with lock:
+                    read_latencies.append(elapsed)
+                    counts['reads' if response.status_code == 200 else 'errors'] += 1
+
+        threads = [threading.Thread(target=login, args=(i,)) for i in range(options['logins'])]
+        threads += [threading.Thread(target=read) for _ in range(options['readers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        return dict(
+            counts, wall=wall,
+            p50_ms=percentile(read_latencies, 0.50) * 1000 if read_latencies else 0.0,
+            p99_ms=percentile(read_latencies, 0.99) * 1000 if read_latencies else 0.0,
+        )
@@ -0,0 +1,110 @@
+import random
+import resource
+import time
+from django.core.management.base import BaseCommand
+from shop.management.commands.bench_http import percentile
+from shop.search import InvertedIndex, search_backend, search_products, tokenize
+
+BRANDS = ['acme', 'voltra', 'nexon', 'orbix', 'helio', 'quanta', 'zenith', 'lumen', 'pulse', 'vertex']
+KINDS = ['laptop', 'phone', 'tablet', 'monitor', 'keyboard', 'mouse', 'headphones', 'speaker',
+         'camera', 'router', 'charger', 'cable', 'smartwatch', 'drone', 'projector', 'microphone']
+ADJECTIVES = ['wireless', 'portable', 'gaming', 'ultra', 'compact', 'pro', 'mini', 'smart',
+              'noise', 'cancelling', 'bluetooth', 'usb', 'fast', 'waterproof', 'ergonomic', 'hd']
+FILLER = ['with', 'and', 'for', 'the', 'battery', 'display', 'warranty', 'black', 'white',
+          'silver', 'edition', 'inch', 'hours', 'support', 'design', 'premium', 'lightweight']
+
+# Products re-indexed to time incremental maintenance
+UPDATES = 1000
+
+
+def synthetic_product(rng, product_id):
+    name = f"{rng.choice(BRANDS)} {rng.choice(ADJECTIVES)} {rng.choice(KINDS)} {rng.randint(100, 9999)}"
+    description = ' '.join(rng.choice(ADJECTIVES + FILLER + KINDS) for _ in range(rng.randint(8, 30)))
+    return name, description
+
+
+def synthetic_queries(rng, count):
+    queries = []
+    for _ in range(count):
+        words = [rng.choice(KINDS)] + rng.sample(ADJECTIVES + BRANDS, rng.randint(0, 2))
+        queries.append(' '.join(words))
+    return queries
+
+
+def max_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = ('Build the in-process search index over synthetic catalogs and time '
+            'BM25 queries and autocomplete; --db times the configured backend instead.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, nargs='+', default=[100_000, 1_000_000])
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--db', action='store_true',
+                            help='Query the products table through search_products() instead')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        queries = synthetic_queries(rng, options['queries'])
+        if options['db']:
+            self.stdout.write(f"Backend: {search_backend()}")
+            self.report('search', self.time_queries(
+                lambda query: search_products(query, ('id', 'name'), options['limit']), queries,
+            ))
+            self.report('autocomplete', self.time_queries(
+                lambda query: search_products(query[:4], ('id', 'name'), 10, prefix=True), queries,
+            ))
+            return
+
+        for count in options['products']:
+            self.stdout.write(f"--- {count} products")
+            index = InvertedIndex()
+            rss_before = max_rss_mb()
+            started = time.perf_counter()
+            for product_id in range(1, count + 1):
+                name, description = synthetic_product(rng, product_id)
+                index.add(product_id, f"{name} {description}")
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"build: {elapsed:.1f}s ({count / elapsed:.0f} docs/s), {len(index.postings)} terms, "
+                f"peak RSS +{max_rss_mb() - rss_before:.0f} MB"
+            )
+
+            self.report('search', self.time_queries(
+                lambda query: index.search(tokenize(query), options['limit']), queries,
+            ))
+
+            def complete(query):
+                terms = tokenize(query[:4])
+                return index.search(terms[:-1] + index.terms_with_prefix(terms[-1]), 10)
+
+            self.report('autocomplete', self.time_queries(complete, queries))
+
+            # Incremental maintenance, as done by the Product signals
+            started = time.perf_counter()
+            for product_id in range(1, UPDATES + 1):
+                name, description = synthetic_product(rng, product_id)
+                index.add(product_id, f"{name} {description}")
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"update: {elapsed * 1000 / UPDATES:.3f}ms per product")
+            del index
+
+    def time_queries(self, run, queries):
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            run(query)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    def report(self, name, latencies):
+        self.stdout.write(
+            f"{name}: p50={percentile(latencies, 0.50) * 1000:.2f}ms "
+            f"p95={percentile(latencies, 0.95) * 1000:.2f}ms "
+            f"p99={percentile(latencies, 0.99) * 1000:.2f}ms"
+        )
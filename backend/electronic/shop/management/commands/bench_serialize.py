@@ -0,0 +1,111 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse
+from django.utils import timezone
+from shop.models import User, Product, Order
+from shop.serializers import ENCODER, SELLER_ORDER, FastJsonResponse
+
+
+def product_rows(rng, count):
+    """Rows shaped like a `home` page."""
+    return [
+        {
+            'id': i,
+            'name': f'Product {i}',
+            'description': 'A fine product ' * rng.randint(1, 20),
+            'price': Decimal(rng.randint(100, 500000)) / 100,
+            'stock': rng.randint(0, 500),
+            'image_url': f'https://bucket.s3.amazonaws.com/media/products/{i:064x}.jpg',
+            'image_variants': {'thumb': f'https://bucket.s3.amazonaws.com/v/{i}/thumb.jpg'},
+            'seller_id': rng.randint(1, 100),
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def order_tuples(rng, count):
+    """`.values_list()` rows for the seller_orders schema."""
+    now = timezone.now()
+    return [
+        (i, rng.randint(1, 1000), f'Product {i}', rng.randint(1, 1000), f'buyer{i}',
+         rng.randint(1, 5), Decimal(rng.randint(100, 500000)) / 100, 'Street 1, City',
+         now - timedelta(seconds=i))
+        for i in range(1, count + 1)
+    ]
+
+
+def order_instances(rows):
+    """The same orders as model instances, as select_related() returned them."""
+    orders = []
+    for order_id, product_id, name, buyer_id, username, quantity, total, address, created_at in rows:
+        order = Order(id=order_id, quantity=quantity, total_price=total, address=address, created_at=created_at)
+        order.product = Product(id=product_id, name=name)
+        order.buyer = User(id=buyer_id, username=username)
+        orders.append(order)
+    return orders
+
+
+def hand_built(orders):
+    """How seller_orders built its rows before the schema."""
+    return [
+        {
+            'id': order.id,
+            'product': {'id': order.product.id, 'name': order.product.name},
+            'buyer': {'id': order.buyer.id, 'username': order.buyer.username},
+            'quantity': order.quantity,
+            'total_price': order.total_price,
+            'address': order.address,
+            'created_at': order.created_at,
+        }
+        for order in orders
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark of row building and JSON encoding for the list endpoints (objects/s, bytes/s).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200, help='Rows per response (one page)')
+        parser.add_argument('--seconds', type=float, default=1.0, help='Time spent on each case')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        rows = options['rows']
+        products = product_rows(rng, rows)
+        tuples = order_tuples(rng, rows)
+        orders = order_instances(tuples)
+        build = SELLER_ORDER.build
+        seller_orders = [build(row) for row in tuples]
+        self.seconds = options['seconds']
+
+        self.stdout.write(f"{rows} rows per response, fast encoder: {ENCODER}")
+        self.stdout.write("Encoding")
+        for name, payload in (('home', {'products': products}), ('seller_orders', {'orders': seller_orders})):
+            self.run(f"{name:14} JsonResponse", rows, lambda: JsonResponse(payload).content)
+            with mock.patch('shop.serializers.orjson', None):
+                self.run(f"{name:14} stdlib", rows, lambda: FastJsonResponse(payload).content)
+            if ENCODER == 'orjson':
+                self.run(f"{name:14} orjson", rows, lambda: FastJsonResponse(payload).content)
+
+        self.stdout.write("Row building (seller_orders)")
+        self.run("model instances", rows, lambda: hand_built(orders), count_bytes=False)
+        self.run("schema", rows, lambda: [build(row) for row in tuples], count_bytes=False)
+
+    def run(self, label, rows, call, count_bytes=True):
+        iterations = 0
+        started = time.perf_counter()
+        deadline = started + self.seconds
+        while time.perf_counter() < deadline:
+            result = call()
+            iterations += 1
+        elapsed = time.perf_counter() - started
+        line = f"  {label:30} {iterations * rows / elapsed:>12,.0f} objects/s"
+        if count_bytes:
+            size = len(result)
+            line += f" {iterations * size / elapsed / 1e6:>9.1f} MB/s ({size:,} bytes/response)"
+        self.stdout.write(line)
+
@@ -0,0 +1,117 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db.backends.signals import connection_created
+
+
+class Command(BaseCommand):
+    help = ('Compare settings profiles (DJANGO_ENV): worker start-up time, requests/s through the '
+            'WSGI handler, database connections opened and memory retained per request.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append',
+                            help='DJANGO_ENV value to run (repeatable); default development and production')
+        parser.add_argument('--sqlite', metavar='PATH',
+                            help='Run against this SQLite file instead of the configured database')
+        parser.add_argument('--path', action='append', help='GET path to request (repeatable); default the product list and one product')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per profile')
+        parser.add_argument('--products', type=int, default=200, help='Products created when the catalog is empty')
+        parser.add_argument('--child', action='store_true', help='Internal: run one profile in this process')
+
+    def handle(self, *args, **options):
+        if options['child']:
+            return self.child(options)
+
+        env = dict(os.environ)
+        if options['sqlite']:
+            env.update(DB_ENGINE='django.db.backends.sqlite3', DB_NAME=options['sqlite'])
+        # Fresh processes, so each profile pays its own start-up
+        manage = [sys.executable, sys.argv[0]]
+        subprocess.run(
+            manage + ['migrate', '-v0'], env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+        for profile in options['profile'] or ['development', 'production']:
+            command = manage + ['bench_settings', '--child', '--requests', str(options['requests']),
+                                '--products', str(options['products'])]
+            for path in options['path'] or []:
+                command += ['--path', path]
+            started = time.perf_counter()
+            process = subprocess.Popen(
+                command, env=dict(env, DJANGO_ENV=profile), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            )
+            # The child reports once it has served its first request
+            ready = process.stdout.readline()
+            startup = time.perf_counter() - started
+            output = process.stdout.read()
+            if process.wait() or not ready:
+                raise CommandError(f'{profile} run failed (exit {process.returncode})')
+            # Views may print; the result is the last line
+            result = json.loads(output.strip().splitlines()[-1])
+            self.stdout.write(
+                f"{profile:>12}: start-up {startup * 1000:6.0f} ms  {result['throughput']:8.1f} req/s  "
+                f"{result['connections']:5} connections opened  "
+                f"{result['memory_kb_per_request']:6.2f} KB/request retained  errors {result['errors']}"
+            )
+
+    def child(self, options):
+        from shop.models import User, Product
+
+        application = get_wsgi_application()
+        opened = [0]
+        connection_created.connect(lambda **kwargs: opened.__setitem__(0, opened[0] + 1), weak=False)
+
+        if not Product.objects.exists():
+            seller, _ = User.objects.get_or_create(username='bench_settings_seller', defaults={'is_seller': True})
+            Product.objects.bulk_create([
+                Product(seller=seller, name=f'Product {i}', description='Bench product', price='9.99', stock=100)
+                for i in range(options['products'])
+            ])
+
+        # The list is usually a cache hit; the product page always runs a query
+        product_id = Product.objects.order_by('id').values_list('id', flat=True).first()
+        paths = options['path'] or ['/api/products/', f'/api/product/?product_id={product_id}']
+        errors = self.request(application, paths[0])
+        self.stdout.write('ready')
+        self.stdout.flush()
+
+        opened[0] = 0
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+        for i in range(options['requests']):
+            errors += self.request(application, paths[i % len(paths)])
+        wall = time.perf_counter() - started
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(json.dumps({
+            'throughput': options['requests'] / wall,
+            'connections': opened[0],
+            'memory_kb_per_request': (after - before) / 1024 / options['requests'],
+            'errors': errors,
+        }))
+
+    def request(self, application, path):
+        """One GET through the WSGI handler, like a server worker: 1 if it failed."""
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+            'wsgi.url_scheme': 'http', 'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr,
+        }
+        statuses = []
+        response = application(environ, lambda status, headers: statuses.append(status))
+        try:
+            for _ in response:
+                pass
+        finally:
+            # Fires request_finished, which closes connections past CONN_MAX_AGE
+            response.close()
+        return int(int(statuses[0].split()[0]) >= 400)
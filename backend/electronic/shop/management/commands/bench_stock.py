@@ -0,0 +1,77 @@
+import threading
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+from django.test.utils import override_settings
+from shop.models import Product
+from shop.stock import reserve_stock, shard_stock, merge_stock_shards, available_stock, OutOfStock
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Hammer one product with concurrent reservations and check nothing is oversold.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--attempts', type=int, default=200, help='Reservations tried per thread')
+        parser.add_argument('--stock', type=int, default=1000)
+        parser.add_argument('--quantity', type=int, default=1)
+        parser.add_argument('--shards', type=int, default=0, help='Run in sharded hot-SKU mode with N shards')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] in ('', ':memory:'):
+            raise CommandError('Threads need a file or server database, not in-memory SQLite')
+
+        seller, _ = User.objects.get_or_create(username='bench_stock_seller', defaults={'is_seller': True})
+        product = Product.objects.create(
+            seller=seller, name='bench stock', description='', price=1, stock=options['stock'],
+        )
+        if options['shards']:
+            shard_stock(product.id, options['shards'])
+
+        counts = {'reserved': 0, 'out_of_stock': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def worker():
+            for _ in range(options['attempts']):
+                try:
+                    reserve_stock(product.id, options['quantity'])
+                    outcome = 'reserved'
+                except OutOfStock:
+                    outcome = 'out_of_stock'
+                except OperationalError:
+                    # e.g. SQLite "database is locked" under write contention
+                    outcome = 'errors'
+                with lock:
+                    counts[outcome] += 1
+            connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        with override_settings(STOCK_SHARDING=bool(options['shards'])):
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+        remaining = available_stock(product.id)
+        sold = counts['reserved'] * options['quantity']
+        if options['shards']:
+            merge_stock_shards(product.id)
+        product.delete()
+
+        attempts = options['threads'] * options['attempts']
+        self.stdout.write(
+            f"{attempts} attempts on {options['threads']} threads in {elapsed:.2f}s "
+            f"({attempts / elapsed:.0f} reservations/s)"
+        )
+        self.stdout.write(
+            f"reserved={counts['reserved']} out_of_stock={counts['out_of_stock']} "
+            f"errors={counts['errors']} sold={sold} remaining={remaining}"
+        )
+        if sold + remaining != options['stock'] or remaining < 0:
+            raise CommandError(f"Stock mismatch: started with {options['stock']}, sold {sold}, {remaining} left")
+        self.stdout.write(self.style.SUCCESS('No oversell'))
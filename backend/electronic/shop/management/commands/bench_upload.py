@@ -0,0 +1,102 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from electronic.settings import AWS_STORAGE_BUCKET_NAME
+from shop.aws import get_client, upload_to_s3, upload_fileobj_to_s3
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def upload_via_temp_file(image, object_name):
+    """The upload path add_product/edit_product used before streaming."""
+    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+        temp_file.write(image.read())
+        temp_path = temp_file.name
+    try:
+        return upload_to_s3(temp_path, object_name)
+    finally:
+        os.remove(temp_path)
+
+
+def upload_streamed(image, object_name):
+    return upload_fileobj_to_s3(image, object_name, image.content_type)
+
+
+UPLOADS = {'temp-file': upload_via_temp_file, 'streamed': upload_streamed}
+
+
+def max_rss_mb():
+    # ru_maxrss is in KiB on Linux, in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+class Command(BaseCommand):
+    help = 'Compare temp-file and streamed image uploads to S3 (throughput and peak memory).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=32, help='Size of the generated image')
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--create-bucket', action='store_true',
+                            help='Create the bucket first (for a fresh local stand-in)')
+        parser.add_argument('--child', choices=list(UPLOADS), help='Internal: run one upload in this process')
+        parser.add_argument('--run', type=int, default=0, help='Internal: run number, for the object name')
+
+    def handle(self, *args, **options):
+        if options['child']:
+            return self.child(options)
+        # Point AWS_ENDPOINT_URL at a local S3 stand-in (e.g. `moto_server`
+        # or MinIO) running in its own process; an in-process mock would
+        # count the stored objects in this process' memory.
+        if options['create_bucket']:
+            get_client('s3').create_bucket(Bucket=AWS_STORAGE_BUCKET_NAME)
+
+        # A fresh process per upload, so each peak RSS is that upload's alone
+        manage = [sys.executable, sys.argv[0]]
+        size = options['size_mb'] * 1024 * 1024
+        for label in UPLOADS:
+            elapsed = 0.0
+            peak = 0.0
+            for run in range(options['runs']):
+                process = subprocess.run(
+                    manage + ['bench_upload', '--child', label, '--run', str(run), '--size-mb', str(options['size_mb'])],
+                    stdout=subprocess.PIPE, text=True,
+                )
+                if process.returncode:
+                    raise CommandError(f'{label} upload failed (exit {process.returncode})')
+                # Uploads may print; the result is the last line
+                result = json.loads(process.stdout.strip().splitlines()[-1])
+                elapsed += result['seconds']
+                peak = max(peak, result['peak_mb'])
+
+            throughput = size * options['runs'] / elapsed / (1024 * 1024)
+            self.stdout.write(f"{label:>10}: {throughput:8.1f} MiB/s, peak memory {peak:6.1f} MiB")
+
+    def child(self, options):
+        size = options['size_mb'] * 1024 * 1024
+        object_name = f"media/products/bench-{options['child']}-{options['run']}.jpg"
+        # What Django hands a view for an upload above FILE_UPLOAD_MAX_MEMORY_SIZE
+        image = TemporaryUploadedFile('bench.jpg', 'image/jpeg', size, None)
+        for _ in range(0, size, CHUNK_SIZE):
+            image.write(os.urandom(CHUNK_SIZE))
+        image.seek(0)
+
+        # Above what the interpreter, Django and the S3 client already take
+        get_client('s3')
+        baseline = max_rss_mb()
+        started = time.perf_counter()
+        try:
+            if not UPLOADS[options['child']](image, object_name):
+                raise CommandError(f"{options['child']} upload failed")
+            seconds = time.perf_counter() - started
+            peak = max_rss_mb() - baseline
+        finally:
+            image.close()
+        get_client('s3').delete_object(Bucket=AWS_STORAGE_BUCKET_NAME, Key=object_name)
+        self.stdout.write(json.dumps({'seconds': seconds, 'peak_mb': peak}))
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from shop.aws import get_client
+from shop.outbox import dispatch_outbox_batch, SQS_BATCH_LIMIT
+
+
+class Command(BaseCommand):
+    help = 'Drain the notification outbox to SQS in batches of up to 10 messages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SQS_BATCH_LIMIT)
+        parser.add_argument('--once', action='store_true', help='Exit once the outbox has no due messages')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the outbox is empty')
+
+    def handle(self, *args, **options):
+        sqs_client = get_client('sqs')
+
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = dispatch_outbox_batch(sqs_client, options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if failed:
+                self.stderr.write(f'{failed} message(s) failed, will retry with backoff')
+            if sent or failed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(f'Sent {total_sent} message(s), {total_failed} failure(s)')
@@ -0,0 +1,40 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from shop.models import Order
+from shop.sales import rebuild_daily_sales
+
+
+class Command(BaseCommand):
+    help = 'Recompute the DailySales aggregates from orders, a few days per GROUP BY.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild (default: first order)')
+        parser.add_argument('--until', help='Last day to rebuild (default: today)')
+        parser.add_argument('--chunk-days', type=int, default=7, help='Days per GROUP BY scan')
+
+    def handle(self, *args, **options):
+        until = parse_date(options['until']) if options['until'] else timezone.localdate()
+        if options['since']:
+            since = parse_date(options['since'])
+        else:
+            first = Order.objects.aggregate(first=Min('created_at'))['first']
+            if first is None:
+                self.stdout.write('No orders')
+                return
+            since = timezone.localdate(first)
+        if since is None or until is None:
+            raise CommandError('Dates must be YYYY-MM-DD')
+
+        total = 0
+        start = since
+        while start <= until:
+            end = min(start + timedelta(days=options['chunk_days']), until + timedelta(days=1))
+            rows = rebuild_daily_sales(start, end)
+            total += rows
+            self.stdout.write(f'{start} .. {end - timedelta(days=1)}: {rows} row(s)')
+            start = end
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {total} aggregate row(s)'))
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+from shop.replicas import beat
+
+
+class Command(BaseCommand):
+    help = 'Write the replica heartbeat on the primary; replicas are lagging by the age of their copy.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Write one heartbeat and exit')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between heartbeats')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                beat()
+            except DatabaseError as e:
+                self.stderr.write(f'Heartbeat failed: {e}')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
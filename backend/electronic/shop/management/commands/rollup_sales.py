@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from shop.sales import fold_pending_sales
+
+
+class Command(BaseCommand):
+    help = 'Fold the sales queued by checkouts into the DailySales aggregates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--once', action='store_true', help='Exit once no sales are pending')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when nothing is pending')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            folded = fold_pending_sales(options['batch_size'])
+            total += folded
+            if folded:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(f'Folded {total} sale(s)')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from shop.benchmarks import DATASET_SIZES, BENCH_PREFIX, clear_dataset, dataset_counts, seed_dataset
+from shop.models import User
+
+
+class Command(BaseCommand):
+    help = 'Fill User, Product and Order with a reproducible benchmark dataset, with bulk inserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=sorted(DATASET_SIZES), default='10k', help='Number of orders')
+        parser.add_argument('--orders', type=int, help='Exact number of orders, instead of --size')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--days', type=int, default=90, help='Orders are spread over this many past days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--reset', action='store_true', help='Delete an existing bench dataset first')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=BENCH_PREFIX).exists():
+            if not options['reset']:
+                raise CommandError('A bench dataset exists; pass --reset to replace it')
+            self.stdout.write('Deleting the existing bench dataset')
+            clear_dataset(options['batch_size'])
+
+        orders = options['orders'] if options['orders'] is not None else DATASET_SIZES[options['size']]
+        seed_dataset(
+            orders, seed=options['seed'], days=options['days'], batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        counts = ', '.join(f'{count} {name}' for name, count in dataset_counts().items())
+        self.stdout.write(self.style.SUCCESS(f'Done: {counts}'))
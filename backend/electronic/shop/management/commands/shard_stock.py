@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from shop.models import Product
+from shop.stock import shard_stock, merge_stock_shards, available_stock
+
+
+class Command(BaseCommand):
+    help = "Split a product's stock into hot-SKU shard counters, or merge them back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int)
+        parser.add_argument('--shards', type=int, default=8, help='Number of shard counters')
+        parser.add_argument('--merge', action='store_true', help='Fold the shards back into Product.stock')
+
+    def handle(self, *args, **options):
+        product_id = options['product_id']
+        if not Product.objects.filter(id=product_id).exists():
+            raise CommandError(f'Product {product_id} does not exist')
+
+        if options['merge']:
+            merge_stock_shards(product_id)
+            self.stdout.write(f'Merged shards of product {product_id}')
+        else:
+            if options['shards'] < 1:
+                raise CommandError('--shards must be at least 1')
+            shard_stock(product_id, options['shards'])
+            self.stdout.write(f"Split product {product_id} into {options['shards']} shards")
+        self.stdout.write(f'Available stock: {available_stock(product_id)}')
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.3 on 2026-10-18 09:12
+
+from django.db import migrations
+
+# Must stay in sync with the expressions used by shop/search.py
+INDEXES = {
+    'mysql': (
+        "ALTER TABLE shop_product ADD FULLTEXT INDEX product_search_idx (name, description)",
+        "ALTER TABLE shop_product DROP INDEX product_search_idx",
+    ),
+    'postgresql': (
+        "CREATE INDEX product_search_idx ON shop_product USING GIN ("
+        "to_tsvector('english'::regconfig, "
+        "COALESCE((name)::text, '') || ' ' || COALESCE((description)::text, '')))",
+        "DROP INDEX product_search_idx",
+    ),
+}
+
+
+def create_index(apps, schema_editor):
+    statements = INDEXES.get(schema_editor.connection.vendor)
+    if statements:
+        schema_editor.execute(statements[0])
+
+
+def drop_index(apps, schema_editor):
+    statements = INDEXES.get(schema_editor.connection.vendor)
+    if statements:
+        schema_editor.execute(statements[1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_dailysales'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
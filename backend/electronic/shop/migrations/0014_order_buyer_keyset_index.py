@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_product_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['buyer', '-created_at', '-id'], name='order_buyer_created_id_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_buyer_created_idx',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_archivedorder'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['image_url'], name='product_image_url_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-18 09:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_pendingsale'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedReceipt',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='receipt', serialize=False, to='shop.archivedorder')),
+                ('body', models.JSONField()),
+                ('etag', models.CharField(max_length=66)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
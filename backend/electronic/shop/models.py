@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 # User Model (with Role-Based Access)
 class User(AbstractUser):
@@ -18,19 +19,182 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField(default=0)
     image_url = models.URLField(blank=True, null=True)
+    # Resized copies of image_url, e.g. {"thumb": url, "thumb_webp": url}
+    image_variants = models.JSONField(blank=True, default=dict)
+    # Bumped by every write, including the stock UPDATEs in shop/stock.py
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # seller_products / seller catalog pages, in id (cursor) order
+            models.Index(fields=['seller', 'id'], name='product_seller_id_idx'),
+            # In-stock listings; partial where the backend supports it
+            models.Index(fields=['id'], condition=models.Q(stock__gt=0), name='product_in_stock_idx'),
+            # Catalog sorted by price or stock, keyset on (column, id)
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['stock', 'id'], name='product_stock_id_idx'),
+            # delete_product checks whether another product shares the image
+            models.Index(fields=['image_url'], name='product_image_url_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+# Stock Shard Model (hot-SKU counters for flash sales)
+class StockShard(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shards')
+    shard = models.PositiveSmallIntegerField()
+    stock = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'shard')
+
+    def __str__(self):
+        return f"{self.product_id}#{self.shard}: {self.stock}"
+
+# Order History Manager (Order.history: recent orders, then the archive)
+class OrderHistoryManager(models.Manager):
+    def get_queryset(self):
+        from .archive import OrderHistoryQuerySet
+        return OrderHistoryQuerySet((super().get_queryset(), ArchivedOrder.objects.all()))
+
 # Order Model
 class Order(models.Model):
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='orders')
+    # Copied from product.seller when the order is written, so a seller's
+    # orders are one index range instead of a join through Product
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sales', null=True, db_index=False)
     quantity = models.PositiveIntegerField()
     address = models.TextField()
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = models.Manager()
+    # Order and ArchivedOrder as one queryset, for histories (shop/archive.py)
+    history = OrderHistoryManager()
+
+    class Meta:
+        indexes = [
+            # order_history validators: count and latest update of a buyer's orders
+            models.Index(fields=['buyer', 'updated_at'], name='order_buyer_updated_idx'),
+            # order_history and its export: a buyer's orders, newest first,
+            # keyset on (created_at, id)
+            models.Index(fields=['buyer', '-created_at', '-id'], name='order_buyer_created_id_idx'),
+            # seller_orders: orders of a seller's products, newest first
+            models.Index(fields=['product', '-created_at'], name='order_product_created_idx'),
+            # seller_orders feed: one seller, newest first, keyset on (created_at, id)
+            models.Index(fields=['seller', '-created_at', '-id'], name='order_seller_created_idx'),
+            # OrderAdmin date filter
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id} by {self.buyer.username}"
 
+
+# Archived Order Model (orders older than ORDER_ARCHIVE_AFTER_DAYS, moved
+# here in batches by `manage.py archive_orders`, see shop/archive.py)
+class ArchivedOrder(models.Model):
+    # The id the order had in Order
+    id = models.BigIntegerField(primary_key=True)
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders', db_index=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='archived_orders')
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_sales', null=True, db_index=False)
+    quantity = models.PositiveIntegerField()
+    address = models.TextField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # The same history ranges as Order's
+            models.Index(fields=['buyer', '-created_at', '-id'], name='archived_buyer_created_id_idx'),
+            models.Index(fields=['seller', '-created_at', '-id'], name='archived_seller_created_idx'),
+            models.Index(fields=['created_at'], name='archived_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.id}"
+
+
+# Daily Sales Model (per product per day, folded from PendingSale, see shop/sales.py)
+class DailySales(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_sales', db_index=False)
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='daily_sales_product_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', 'day'], name='daily_sales_seller_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.units} unit(s)"
+
+# Pending Sale Model (one per order, inserted at checkout and folded into
+# DailySales by the rollup_sales worker)
+class PendingSale(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2)
+    units = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['seller', 'day'], name='pending_sale_seller_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pending sale of {self.product_id} on {self.day}"
+
+# Receipt Model (rendered once per order, then served from here)
+class Receipt(models.Model):
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='receipt')
+    body = models.JSONField()
+    etag = models.CharField(max_length=66)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Receipt for order {self.order_id}"
+
+# Archived Receipt Model (receipts of archived orders, moved with them)
+class ArchivedReceipt(models.Model):
+    order = models.OneToOneField(ArchivedOrder, on_delete=models.CASCADE, primary_key=True, related_name='receipt')
+    body = models.JSONField()
+    etag = models.CharField(max_length=66)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Receipt for archived order {self.order_id}"
+
+# Outbox Model (seller notifications waiting to be sent to SQS)
+class OutboxMessage(models.Model):
+    body = models.TextField()
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['available_at', 'id'])]
+
+    def __str__(self):
+        return f"Outbox message {self.id}"
+
+# Replica Heartbeat Model (one row, written on the primary; its age on a
+# replica is that replica's lag, see shop/replicas.py)
+class ReplicaHeartbeat(models.Model):
+    beat_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Heartbeat at {self.beat_at}"
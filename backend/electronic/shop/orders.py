@@ -0,0 +1,64 @@
+'''
+    Order placement shared by the WSGI and ASGI views
+'''
+
+from functools import partial
+from django.db import transaction
+from .cache import bump_catalog_version
+from .models import Order
+from .outbox import enqueue_seller_notification
+from .receipts import schedule_receipt
+from .sales import record_sales
+from .stock import reserve_stock
+
+
+def create_order(buyer, product, quantity, address):
+    """
+    Reserve stock and write an order with its seller notification.
+
+    :param buyer: The User, or the ClaimsUser of the request
+    :param product: Product loaded with `select_related('seller')`
+    :raises OutOfStock: If the product has fewer than `quantity` units left
+    :return: The new Order
+    """
+    total_price = product.price * quantity
+    with transaction.atomic():
+        reserve_stock(product.id, quantity)
+        order = Order.objects.create(
+            buyer_id=buyer.id,
+            product=product,
+            seller_id=product.seller_id,
+            quantity=quantity,
+            address=address,
+            total_price=total_price,
+        )
+
+        # Queued with the order; sent to SQS by the dispatch_outbox worker
+        message_body = {
+            "order_id": order.id,
+            "product_name": product.name,
+            "quantity": quantity,
+            "total_price": total_price,
+            "seller_id": product.seller_id,
+            "buyer_username": buyer.username,
+            "seller_email": product.seller.email
+        }
+        enqueue_seller_notification(message_body)
+        record_sales([order])
+        transaction.on_commit(partial(schedule_receipt, order.id))
+    bump_catalog_version(product.seller_id)
+    return order
+
+
+def order_data(order, product):
+    """Response body for a placed order."""
+    return {
+        'id': order.id,
+        'product': {
+            'id': product.id,
+            'name': product.name,
+        },
+        'quantity': order.quantity,
+        'total_price': order.total_price,
+        'address': order.address,
+    }
@@ -0,0 +1,83 @@
+'''
+    Transactional outbox for seller notifications
+'''
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .aws import serialize_message, send_seller_notification_batch
+from .models import OutboxMessage
+
+SQS_BATCH_LIMIT = 10
+
+
+def enqueue_seller_notification(message_body):
+    """
+    Queue a seller notification in the outbox table.
+
+    Call this inside the transaction that writes the order: the message is
+    committed (or rolled back) together with it and sent later by the
+    `dispatch_outbox` command, so SQS is never on the checkout path.
+    """
+    return OutboxMessage.objects.create(body=serialize_message(message_body))
+
+
+def enqueue_seller_notifications(message_bodies):
+    """Queue several notifications with one INSERT."""
+    return OutboxMessage.objects.bulk_create([
+        OutboxMessage(body=serialize_message(message_body)) for message_body in message_bodies
+    ])
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before retrying a message that failed `attempts` times."""
+    base = getattr(settings, 'OUTBOX_BACKOFF_SECONDS', 2)
+    cap = getattr(settings, 'OUTBOX_BACKOFF_MAX_SECONDS', 300)
+    return min(cap, base * 2 ** (attempts - 1))
+
+
+def dispatch_outbox_batch(sqs_client=None, batch_size=SQS_BATCH_LIMIT):
+    """
+    Send one batch of due outbox messages with `send_message_batch`.
+
+    Claimed rows are locked with SKIP LOCKED where the backend supports it,
+    so several dispatchers can drain the table side by side. Sent messages
+    are deleted; failed ones are rescheduled with exponential backoff until
+    OUTBOX_MAX_ATTEMPTS, after which they stay in the table for inspection.
+
+    :return: Tuple of (number sent, number failed)
+    """
+    batch_size = min(batch_size, SQS_BATCH_LIMIT)
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects
+            .select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+            .filter(available_at__lte=timezone.now(), attempts__lt=max_attempts)
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        if not messages:
+            return 0, 0
+
+        try:
+            sent, failed = send_seller_notification_batch(
+                {message.id: message.body for message in messages}, sqs_client,
+            )
+        except Exception as e:
+            sent, failed = [], {str(message.id): str(e) for message in messages}
+
+        OutboxMessage.objects.filter(id__in=[int(message_id) for message_id in sent]).delete()
+
+        now = timezone.now()
+        for message in messages:
+            error = failed.get(str(message.id))
+            if error is None:
+                continue
+            message.attempts += 1
+            message.last_error = error
+            message.available_at = now + timedelta(seconds=backoff_delay(message.attempts))
+            message.save(update_fields=['attempts', 'last_error', 'available_at'])
+
+    return len(sent), len(failed)
@@ -0,0 +1,137 @@
+'''
+    Password hashing for login_user and register, off the request threads
+
+    A PBKDF2 hash keeps a core busy for hundreds of milliseconds. Hashes run
+    in a process pool of PASSWORD_HASH_WORKERS, so a burst of logins can
+    occupy at most that many cores, and no more than PASSWORD_HASH_CONCURRENCY
+    may be running or waiting at once: a request that gets no slot within
+    PASSWORD_HASH_WAIT seconds fails with HashingBusy instead of queueing.
+    With PASSWORD_HASH_WORKERS = 0 hashes run in the request thread, under
+    the same limit.
+'''
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, get_hasher, identify_hasher
+
+_executor = None
+_executor_pid = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    """No hashing slot became free within PASSWORD_HASH_WAIT seconds."""
+
+
+def get_executor():
+    """
+    The process pool (None when hashing inline) and the semaphore bounding
+    the hashes in flight, created lazily in each worker process.
+    """
+    global _executor, _executor_pid, _slots
+    with _executor_lock:
+        if _slots is None or _executor_pid != os.getpid():
+            workers = getattr(settings, 'PASSWORD_HASH_WORKERS', 2)
+            # Started like the image workers (shop/images.py), not forked
+            # from a web worker whose other threads may hold locks
+            methods = multiprocessing.get_all_start_methods()
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn'),
+                initializer=django.setup,
+            ) if workers else None
+            _slots = threading.BoundedSemaphore(getattr(settings, 'PASSWORD_HASH_CONCURRENCY', 8))
+            _executor_pid = os.getpid()
+    return _executor, _slots
+
+
+def reset_executor():
+    """Shut the pool down; the next hash starts a new one from the current settings."""
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = _slots = None
+
+
+def _encode(hasher, password, salt):
+    return hasher.encode(password, salt)
+
+
+def _verify(hasher, password, encoded):
+    return hasher.verify(password, encoded)
+
+
+def _run(function, *args):
+    executor, slots = get_executor()
+    if not slots.acquire(timeout=getattr(settings, 'PASSWORD_HASH_WAIT', 2)):
+        raise HashingBusy('Too many logins in progress, try again shortly')
+    try:
+        if executor is None:
+            return function(*args)
+        return executor.submit(function, *args).result()
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    """
+    `make_password` with the default hasher, run in the pool.
+
+    :raises HashingBusy: If every hashing slot is taken
+    """
+    hasher = get_hasher('default')
+    return _run(_encode, hasher, password, hasher.salt())
+
+
+def check_user_password(user, password):
+    """
+    `user.check_password`, run in the pool. Like Django, a hash made with
+    an older hasher or fewer iterations is replaced on success.
+
+    :raises HashingBusy: If every hashing slot is taken
+    """
+    encoded = user.password
+    if not encoded or encoded.startswith(UNUSABLE_PASSWORD_PREFIX):
+        return False
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    if not _run(_verify, hasher, password, encoded):
+        return False
+
+    default = get_hasher('default')
+    if hasher.algorithm != default.algorithm or default.must_update(encoded):
+        user.password = hash_password(password)
+        user.save(update_fields=['password'])
+    return True
+
+
+def authenticate_user(username, password):
+    """
+    The active user with these credentials, or None; replaces
+    `django.contrib.auth.authenticate` in login_user.
+
+    Attempts that can be refused without a hash are: no username or
+    password, no such user, an inactive user or an unusable password.
+    ModelBackend spends a dummy hash on an unknown username to hide which
+    usernames exist; this does not, as register already tells.
+
+    :raises HashingBusy: If every hashing slot is taken
+    """
+    if not username or not password:
+        return None
+    User = get_user_model()
+    user = User._default_manager.filter(**{User.USERNAME_FIELD: username}).first()
+    if user is None or not user.is_active:
+        return None
+    if not check_user_password(user, password):
+        return None
+    return user
@@ -0,0 +1,151 @@
+'''
+    Order receipts: rendered once, stored, and served with an ETag
+'''
+
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import IntegrityError, connection
+from .aws import get_client
+from .models import Order, ArchivedOrder, Receipt, ArchivedReceipt
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def receipt_payload(order):
+    """Fields a receipt is rendered from."""
+    return {
+        "order_id": order.id,
+        "product_name": order.product.name,
+        "quantity": order.quantity,
+        "total_price": f"${order.total_price:.2f}",  # Format as a currency string
+        "address": order.address,
+        "ordered_at": order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def render_receipt_locally(payload):
+    """
+    In-process renderer, used when no Lambda is configured or it fails.
+    """
+    lines = [
+        f"Receipt for order #{payload['order_id']}",
+        f"Ordered at: {payload['ordered_at']}",
+        f"Product: {payload['product_name']}",
+        f"Quantity: {payload['quantity']}",
+        f"Total: {payload['total_price']}",
+        f"Ship to: {payload['address']}",
+    ]
+    return dict(payload, receipt_text='\n'.join(lines))
+
+
+def render_receipt_with_lambda(payload):
+    """
+    Invoke the `make_receipt` Lambda and return its JSON body.
+
+    :raises RuntimeError: If the Lambda reports an error
+    """
+    response = get_client('lambda').invoke(
+        FunctionName=getattr(settings, 'RECEIPT_LAMBDA_FUNCTION', 'make_receipt'),
+        InvocationType="RequestResponse",
+        Payload=json.dumps(payload)
+    )
+    response_payload = json.loads(response['Payload'].read().decode('utf-8'))
+    if response_payload.get('statusCode') == 200:
+        return json.loads(response_payload['body'])
+    raise RuntimeError(response_payload.get('error', 'Failed to generate receipt'))
+
+
+def make_etag(body):
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+
+def render_receipt(order):
+    """
+    Render a receipt for an order.
+
+    :return: Tuple of (body, whether the body may be stored for good).
+        A local fallback after a Lambda failure is not stored, so the next
+        request tries the Lambda again.
+    """
+    payload = receipt_payload(order)
+    if getattr(settings, 'RECEIPT_RENDERER', 'lambda') != 'lambda':
+        return render_receipt_locally(payload), True
+    try:
+        return render_receipt_with_lambda(payload), True
+    except Exception:
+        logger.warning('Receipt Lambda failed for order %s, rendering locally', order.id, exc_info=True)
+        return render_receipt_locally(payload), False
+
+
+def receipt_model(order):
+    """Where the receipt of `order`, an Order or an ArchivedOrder, is stored."""
+    return ArchivedReceipt if isinstance(order, ArchivedOrder) else Receipt
+
+
+def stored_receipt(order_id, buyer_id):
+    """
+    The stored receipt of one of a buyer's orders, archived or not.
+
+    :return: Dict of body and etag, or None
+    """
+    for model in (Receipt, ArchivedReceipt):
+        receipt = model.objects.filter(order_id=order_id, order__buyer_id=buyer_id).values('body', 'etag').first()
+        if receipt:
+            return receipt
+    return None
+
+
+def get_or_create_receipt(order):
+    """
+    Return the stored receipt of an order, rendering it on first use.
+
+    :param order: An Order or an ArchivedOrder
+    :return: Tuple of (body, etag)
+    """
+    model = receipt_model(order)
+    receipt = model.objects.filter(order_id=order.id).values('body', 'etag').first()
+    if receipt:
+        return receipt['body'], receipt['etag']
+
+    body, cacheable = render_receipt(order)
+    etag = make_etag(body)
+    if cacheable:
+        try:
+            model.objects.create(order_id=order.id, body=body, etag=etag)
+        except IntegrityError:
+            # Rendered concurrently by another request; theirs is identical
+            pass
+    return body, etag
+
+
+def _pregenerate(order_id):
+    try:
+        order = Order.objects.select_related('product').get(id=order_id)
+        get_or_create_receipt(order)
+    except Exception:
+        logger.exception('Receipt pre-generation failed for order %s', order_id)
+    finally:
+        connection.close()
+
+
+def schedule_receipt(order_id):
+    """
+    Render an order's receipt in the background once its transaction commits.
+    """
+    global _executor
+    if not getattr(settings, 'RECEIPT_PREGENERATE', True):
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'RECEIPT_WORKERS', 4), thread_name_prefix='receipt',
+            )
+    _executor.submit(_pregenerate, order_id)
@@ -0,0 +1,237 @@
+'''
+    Read replicas: routing, read-your-writes stickiness and lag checks
+
+    Only views wrapped in `read_replica` read from a replica; everything
+    else, and every write, uses the primary ('default'). A user who wrote
+    reads from the primary for REPLICA_STICKY_SECONDS afterwards, so a new
+    order shows up in their history at once.
+
+    Lag is the age of the ReplicaHeartbeat row as the replica sees it. The
+    `replica_heartbeat` command rewrites it on the primary every second;
+    a replica more than REPLICA_MAX_LAG seconds behind, unreachable, or
+    without a heartbeat is left out until a later check finds it current.
+'''
+
+import logging
+import random
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from .cache import get_cache
+from .models import ReplicaHeartbeat
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'default'
+STICKY_KEY = 'shop:primary:{}'
+
+# Alias the current view reads from, None for the primary
+_read_alias = ContextVar('shop_read_alias', default=None)
+# Set by the router when the current request writes
+_wrote = ContextVar('shop_wrote', default=False)
+
+_health_lock = threading.Lock()
+# alias -> (monotonic time of the check, lag in seconds or None)
+_health = {}
+_stats_lock = threading.Lock()
+_stats = {'replica': 0, 'primary': 0, 'sticky': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def replica_lag(alias):
+    """
+    Seconds `alias` is behind the primary, from the heartbeat it has replicated.
+
+    :return: The lag, or None if it has no heartbeat or cannot be reached
+    """
+    try:
+        beat_at = ReplicaHeartbeat.objects.using(alias).values_list('beat_at', flat=True).first()
+    except DatabaseError as e:
+        logger.warning('Replica %s is unreachable: %s', alias, e)
+        return None
+    if beat_at is None:
+        return None
+    return max(0.0, (timezone.now() - beat_at).total_seconds())
+
+
+def beat():
+    """Write the heartbeat on the primary."""
+    ReplicaHeartbeat.objects.using(PRIMARY).update_or_create(id=1, defaults={'beat_at': timezone.now()})
+
+
+def replica_status():
+    """
+    The last measured lag of each replica (None: out of rotation, unknown
+    lag), and how many read views were served from a replica, from the
+    primary for lack of a current replica, or from the primary because the
+    user had just written ('sticky').
+    """
+    with _health_lock:
+        lags = {alias: _health.get(alias, (None, None))[1] for alias in replica_aliases()}
+    with _stats_lock:
+        return {'lag': lags, 'reads': dict(_stats)}
+
+
+def reset_replica_state():
+    """Forget the measured lags and the read counters of this process."""
+    with _health_lock:
+        _health.clear()
+    with _stats_lock:
+        _stats.update(replica=0, primary=0, sticky=0)
+
+
+def healthy_replicas():
+    """Replicas within REPLICA_MAX_LAG, each re-checked every REPLICA_CHECK_INTERVAL seconds."""
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG', 3)
+    interval = getattr(settings, 'REPLICA_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    healthy = []
+    for alias in replica_aliases():
+        with _health_lock:
+            checked_at, lag = _health.get(alias, (None, None))
+        if checked_at is None or now - checked_at >= interval:
+            lag = replica_lag(alias)
+            with _health_lock:
+                _health[alias] = (now, lag)
+        if lag is not None and lag <= max_lag:
+            healthy.append(alias)
+    return healthy
+
+
+def pin_to_primary(user_id):
+    """Send this user's replica reads to the primary for REPLICA_STICKY_SECONDS."""
+    get_cache().set(STICKY_KEY.format(user_id), 1, timeout=getattr(settings, 'REPLICA_STICKY_SECONDS', 10))
+
+
+def is_pinned(user):
+    return bool(user and user.is_authenticated and get_cache().get(STICKY_KEY.format(user.id)))
+
+
+def choose_read_alias(user=None):
+    """The replica a read view should use, or None for the primary."""
+    if not replica_aliases():
+        return None
+    if is_pinned(user):
+        _count('sticky')
+        return None
+    replicas = healthy_replicas()
+    if not replicas:
+        _count('primary')
+        return None
+    _count('replica')
+    return random.choice(replicas)
+
+
+@contextmanager
+def read_from_primary():
+    """Send the reads inside the block to the primary, even in a `read_replica` view."""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _stream_from(alias, content):
+    # Streamed exports query while the server iterates, after the view returned
+    iterator = iter(content)
+    while True:
+        token = _read_alias.set(alias)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _read_alias.reset(token)
+        yield chunk
+
+
+def read_replica(view):
+    """
+    Serve a read-only view from a current replica.
+
+    Place it below @api_view/@permission_classes, so the user is known,
+    and above @conditional, so the stamp queries go to the replica too.
+    Async views (shop/async_views.py) authenticate inside the view, so only
+    wrap public ones: their readers cannot be pinned to the primary.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            alias = await sync_to_async(choose_read_alias)()
+            # Copied into the threads sync_to_async runs the ORM in
+            token = _read_alias.set(alias)
+            try:
+                response = await view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+            if alias and getattr(response, 'streaming', False) and not response.is_async:
+                response.streaming_content = _stream_from(alias, response.streaming_content)
+            return response
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        alias = choose_read_alias(getattr(request, 'user', None))
+        token = _read_alias.set(alias)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+        if alias and getattr(response, 'streaming', False):
+            response.streaming_content = _stream_from(alias, response.streaming_content)
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    DATABASE_ROUTERS entry: reads inside `read_replica` views go to the
+    chosen replica, everything else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Pin users to the primary after a request of theirs wrote, for
+    read-your-writes. DRF puts the token's user on the Django request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            user = getattr(request, 'user', None)
+            if _wrote.get() and user is not None and user.is_authenticated:
+                pin_to_primary(user.id)
+        finally:
+            _wrote.reset(token)
+        return response
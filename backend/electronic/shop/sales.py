@@ -0,0 +1,199 @@
+'''
+    Per-product daily sales aggregates for seller dashboards
+
+    Checkouts never touch DailySales: each order adds a PendingSale row
+    (an INSERT, which does not contend like an UPDATE of the day's row),
+    and the `rollup_sales` worker folds them into DailySales in batches.
+    Dashboards add the sales still pending, so they are exact either way.
+'''
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import DailySales, Order, ArchivedOrder, PendingSale
+
+CENTS = Decimal('0.01')
+
+
+def record_sales(orders):
+    """
+    Queue orders for the daily aggregates with one INSERT.
+
+    Call inside the transaction that writes the orders, so their sales
+    commit or roll back with them.
+
+    :param orders: Orders with `seller_id` set
+    """
+    PendingSale.objects.bulk_create([
+        PendingSale(
+            product_id=order.product_id, seller_id=order.seller_id, day=timezone.localdate(order.created_at),
+            revenue=order.total_price, units=order.quantity,
+        )
+        for order in orders
+    ])
+
+
+def add_to_day(product_id, seller_id, day, revenue, units, orders):
+    """Add sales to a product's DailySales row, creating it if needed."""
+    increments = {
+        'revenue': F('revenue') + revenue,
+        'units': F('units') + units,
+        'orders': F('orders') + orders,
+    }
+    if DailySales.objects.filter(product_id=product_id, day=day).update(**increments):
+        return
+    try:
+        # Savepoint, so a concurrent insert of the same row does not
+        # break the surrounding transaction
+        with transaction.atomic():
+            DailySales.objects.create(
+                product_id=product_id, seller_id=seller_id, day=day, revenue=revenue, units=units, orders=orders,
+            )
+    except IntegrityError:
+        DailySales.objects.filter(product_id=product_id, day=day).update(**increments)
+
+
+def fold_pending_sales(batch_size=1000):
+    """
+    Fold up to `batch_size` pending sales into DailySales, oldest first,
+    with one UPDATE (or INSERT) per product and day.
+
+    Claimed rows are locked with SKIP LOCKED where the backend supports it,
+    so several workers can run side by side.
+
+    :return: Number of pending sales folded
+    """
+    with transaction.atomic():
+        pending = list(
+            PendingSale.objects
+            .select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+            .order_by('id')[:batch_size]
+        )
+        if not pending:
+            return 0
+        totals = {}
+        for sale in pending:
+            key = (sale.product_id, sale.day)
+            total = totals.setdefault(key, {'seller_id': sale.seller_id, 'revenue': 0, 'units': 0, 'orders': 0})
+            total['revenue'] += sale.revenue
+            total['units'] += sale.units
+            total['orders'] += 1
+        for (product_id, day), total in sorted(totals.items()):
+            add_to_day(product_id, day=day, **total)
+        PendingSale.objects.filter(id__in=[sale.id for sale in pending]).delete()
+    return len(pending)
+
+
+def rebuild_daily_sales(start, end):
+    """
+    Recompute the aggregates for days in [start, end) from the orders table
+    and its archive.
+
+    :return: Number of aggregate rows written
+    """
+    tz = timezone.get_current_timezone()
+    start_at = timezone.make_aware(datetime.combine(start, time.min), tz)
+    end_at = timezone.make_aware(datetime.combine(end, time.min), tz)
+    totals = {}
+    # A day may be partly archived
+    for model in (Order, ArchivedOrder):
+        rows = (
+            model.objects.filter(created_at__gte=start_at, created_at__lt=end_at)
+            .annotate(day=TruncDate('created_at', tzinfo=tz))
+            .values('product_id', 'product__seller_id', 'day')
+            .annotate(revenue=Sum('total_price'), units=Sum('quantity'), orders=Count('id'))
+            .order_by()
+        )
+        for row in rows:
+            key = (row['product_id'], row['day'])
+            if key in totals:
+                for name in ('revenue', 'units', 'orders'):
+                    totals[key][name] += row[name]
+            else:
+                totals[key] = row
+    with transaction.atomic():
+        # Pending sales of these days are counted from their orders
+        PendingSale.objects.filter(day__gte=start, day__lt=end).delete()
+        DailySales.objects.filter(day__gte=start, day__lt=end).delete()
+        created = DailySales.objects.bulk_create([
+            DailySales(
+                product_id=row['product_id'], seller_id=row['product__seller_id'], day=row['day'],
+                revenue=row['revenue'], units=row['units'], orders=row['orders'],
+            )
+            for row in totals.values()
+        ], batch_size=1000)
+    return len(created)
+
+
+def _money(value):
+    return (value or Decimal(0)).quantize(CENTS)
+
+
+def seller_dashboard(seller_id, start, end):
+    """
+    Totals, a daily series and the top products of a seller for [start, end].
+
+    Reads only aggregate and pending rows, so the cost depends on the number
+    of days and products in the range, never on the number of orders.
+    Revenue is a Decimal with two places, zero included.
+    """
+    sales = DailySales.objects.filter(seller_id=seller_id, day__gte=start, day__lte=end)
+    pending = PendingSale.objects.filter(seller_id=seller_id, day__gte=start, day__lte=end)
+    metrics = {'revenue': Sum('revenue'), 'units': Sum('units'), 'orders': Sum('orders')}
+    pending_metrics = {'revenue': Sum('revenue'), 'units': Sum('units'), 'orders': Count('id')}
+
+    series = {}
+    for rows in (
+        sales.values('day').annotate(**metrics).order_by(),
+        pending.values('day').annotate(**pending_metrics).order_by(),
+    ):
+        for row in rows:
+            day = series.setdefault(row['day'], {'revenue': 0, 'units': 0, 'orders': 0})
+            for name in day:
+                day[name] += row[name]
+
+    # A product in the top ten either is in the aggregates' top ten or has
+    # pending sales; only those need their totals combined
+    fields = ('product_id', 'product__name')
+    pending_products = {row['product_id']: row for row in pending.values(*fields).annotate(**pending_metrics).order_by()}
+    folded = {row['product_id']: row for row in sales.values(*fields).annotate(**metrics).order_by('-revenue')[:10]}
+    if pending_products:
+        others = sales.filter(product_id__in=list(pending_products)).values(*fields).annotate(**metrics).order_by()
+        folded.update((row['product_id'], row) for row in others)
+    products = {}
+    for rows in (folded.values(), pending_products.values()):
+        for row in rows:
+            product = products.setdefault(row['product_id'], {
+                'id': row['product_id'], 'name': row['product__name'], 'revenue': 0, 'units': 0, 'orders': 0,
+            })
+            for name in ('revenue', 'units', 'orders'):
+                product[name] += row[name]
+    top_products = sorted(products.values(), key=lambda product: (-product['revenue'], product['id']))[:10]
+
+    # Days without sales are reported as zeros so the series is continuous
+    days = []
+    day = start
+    while day <= end:
+        row = series.get(day, {})
+        days.append({
+            'day': day,
+            'revenue': _money(row.get('revenue')),
+            'units': row.get('units', 0),
+            'orders': row.get('orders', 0),
+        })
+        day += timedelta(days=1)
+
+    return {
+        'since': start,
+        'until': end,
+        'totals': {
+            'revenue': _money(sum((row['revenue'] for row in days), Decimal(0))),
+            'units': sum(row['units'] for row in days),
+            'orders': sum(row['orders'] for row in days),
+        },
+        'series': days,
+        'top_products': [dict(product, revenue=_money(product['revenue'])) for product in top_products],
+    }
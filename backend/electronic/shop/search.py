@@ -0,0 +1,248 @@
+'''
+    Product search over name and description
+
+    MySQL and PostgreSQL rank with their own full-text engines (the indexes
+    are created by migration 0012). Other databases, i.e. SQLite in
+    development, use an in-process inverted index ranked with BM25 that is
+    built on first use and kept current by the Product save/delete signals.
+'''
+
+import bisect
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+')
+# Prefix expansions considered for the last term of an autocomplete query
+PREFIX_EXPANSIONS = 20
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class InvertedIndex:
+    """
+    Term -> {product id: term frequency} postings with BM25 ranking.
+
+    The sorted term list serves prefix lookups for autocomplete. All
+    methods are thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.postings = {}
+        self.doc_lengths = {}
+        self.doc_terms = {}
+        self.total_length = 0
+        self._terms = None
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_id, text):
+        terms = Counter(tokenize(text))
+        with self._lock:
+            self.remove(doc_id)
+            for term, frequency in terms.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = {}
+                    self._terms = None
+                postings[doc_id] = frequency
+            length = sum(terms.values())
+            self.doc_lengths[doc_id] = length
+            # Kept as a tuple: far smaller than a set at 1M documents
+            self.doc_terms[doc_id] = tuple(terms)
+            self.total_length += length
+
+    def remove(self, doc_id):
+        with self._lock:
+            terms = self.doc_terms.pop(doc_id, None)
+            if terms is None:
+                return
+            for term in terms:
+                postings = self.postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self.postings[term]
+                    self._terms = None
+            self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def terms_with_prefix(self, prefix, limit=PREFIX_EXPANSIONS):
+        """
+        Indexed terms starting with `prefix`, most common first.
+        """
+        with self._lock:
+            if self._terms is None:
+                self._terms = sorted(self.postings)
+            terms = self._terms
+            start = bisect.bisect_left(terms, prefix)
+            end = bisect.bisect_left(terms, prefix + '\uffff', start)
+            matches = terms[start:end]
+            matches.sort(key=lambda term: len(self.postings[term]), reverse=True)
+            return matches[:limit]
+
+    def search(self, terms, limit=20):
+        """
+        Rank documents containing any of `terms` with BM25.
+
+        :return: List of (doc id, score), best first
+        """
+        with self._lock:
+            count = len(self.doc_lengths)
+            if not count:
+                return []
+            average_length = self.total_length / count
+            doc_lengths = self.doc_lengths
+            scores = {}
+            for term in set(terms):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[doc_id] / average_length)
+                    score = idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score
+        # Partial sort: common terms can match a large part of the catalog
+        return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def search_backend():
+    configured = getattr(settings, 'SEARCH_BACKEND', 'auto')
+    if configured != 'auto':
+        return configured
+    if connection.vendor in ('mysql', 'postgresql'):
+        return connection.vendor
+    return 'local'
+
+
+def product_text(name, description):
+    return f"{name} {description}"
+
+
+def get_index():
+    """
+    The process-wide inverted index, built from the products table on first use.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            index = InvertedIndex()
+            rows = Product.objects.values_list('id', 'name', 'description').order_by('id')
+            for product_id, name, description in rows.iterator(chunk_size=2000):
+                index.add(product_id, product_text(name, description))
+            _index = index
+    return _index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+@receiver(post_save, sender=Product)
+def _index_product(sender, instance, **kwargs):
+    # Nothing to keep current until someone searched in this process
+    if _index is not None:
+        _index.add(instance.id, product_text(instance.name, instance.description))
+
+
+@receiver(post_delete, sender=Product)
+def _unindex_product(sender, instance, **kwargs):
+    if _index is not None:
+        _index.remove(instance.id)
+
+
+def _ranked_products(ranked, fields):
+    """Load `fields` of ranked (id, score) pairs, keeping the ranking order."""
+    rows = Product.objects.filter(id__in=[doc_id for doc_id, _ in ranked]).values(*fields)
+    by_id = {row['id']: row for row in rows}
+    return [
+        dict(by_id[doc_id], score=round(score, 4))
+        for doc_id, score in ranked if doc_id in by_id
+    ]
+
+
+def _mysql_search(query, fields, limit, prefix):
+    terms = tokenize(query)
+    if prefix:
+        # Boolean mode: every word required, the last one as a prefix
+        against = ' '.join(f'+{term}' for term in terms) + '*'
+        mode = 'IN BOOLEAN MODE'
+    else:
+        against = ' '.join(terms)
+        mode = 'IN NATURAL LANGUAGE MODE'
+    ranked = Product.objects.raw(
+        f"SELECT id, MATCH(name, description) AGAINST (%s {mode}) AS score "
+        f"FROM shop_product WHERE MATCH(name, description) AGAINST (%s {mode}) "
+        f"ORDER BY score DESC, id LIMIT %s",
+        [against, against, limit],
+    )
+    return _ranked_products([(row.id, row.score) for row in ranked], fields)
+
+
+def _postgresql_search(query, fields, limit, prefix):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    terms = tokenize(query)
+    if prefix:
+        search_query = SearchQuery(' & '.join(terms) + ':*', config='english', search_type='raw')
+    else:
+        search_query = SearchQuery(' '.join(terms), config='english', search_type='plain')
+    # Same expression as the GIN index of migration 0012, so the planner uses it
+    vector = SearchVector('name', 'description', config='english')
+    rows = (
+        Product.objects.annotate(search=vector)
+        .filter(search=search_query)
+        .annotate(score=SearchRank(vector, search_query))
+        .order_by('-score', 'id')
+        .values(*fields, 'score')[:limit]
+    )
+    return [dict(row, score=round(row['score'], 4)) for row in rows]
+
+
+def _local_search(query, fields, limit, prefix):
+    terms = tokenize(query)
+    index = get_index()
+    if prefix:
+        terms = terms[:-1] + index.terms_with_prefix(terms[-1])
+    return _ranked_products(index.search(terms, limit), fields)
+
+
+_BACKENDS = {
+    'mysql': _mysql_search,
+    'postgresql': _postgresql_search,
+    'local': _local_search,
+}
+
+
+def search_products(query, fields, limit=20, prefix=False):
+    """
+    Products matching a free-text query, best match first.
+
+    :param query: The user's query
+    :param fields: Product fields to return; a `score` is added to each row
+    :param limit: Maximum number of results
+    :param prefix: Treat the last word as a prefix (autocomplete)
+    :return: List of product dicts
+    """
+    if not tokenize(query):
+        return []
+    return _BACKENDS[search_backend()](query, fields, limit, prefix)
@@ -0,0 +1,160 @@
+'''
+    Shared JSON encoding for API responses and queue messages
+
+    Decimals are written as strings ("9.99") in API responses, like
+    DjangoJSONEncoder did, and as numbers in SQS messages, which is what
+    their consumers expect. Datetimes are ISO 8601 with a "Z" for UTC.
+    orjson is used when installed, the C-accelerated stdlib encoder otherwise.
+'''
+
+import datetime
+import json
+from decimal import Decimal
+from operator import itemgetter
+from django.http import HttpResponse
+from django.utils.functional import Promise
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+ENCODER = 'orjson' if orjson else 'stdlib'
+
+
+def encode_datetime(value):
+    """ISO 8601, with "Z" for UTC as orjson writes it."""
+    text = value.isoformat()
+    return text[:-6] + 'Z' if text.endswith('+00:00') else text
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, Promise):
+        # Lazy translation strings
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _default_numeric(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return _default(value)
+
+
+def _stdlib_default(decimal_default):
+    def default(value):
+        if isinstance(value, datetime.datetime):
+            return encode_datetime(value)
+        if isinstance(value, (datetime.date, datetime.time)):
+            return value.isoformat()
+        return decimal_default(value)
+    return default
+
+
+# separators without spaces and no indent keep the stdlib on its C encoder
+_stdlib_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=_stdlib_default(_default))
+_stdlib_numeric_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=_stdlib_default(_default_numeric))
+
+
+def dumps(data, numeric_decimals=False):
+    """
+    Encode `data` as JSON.
+
+    :param numeric_decimals: Write Decimals as numbers instead of strings
+    :return: UTF-8 bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            data, default=_default_numeric if numeric_decimals else _default, option=orjson.OPT_UTC_Z,
+        )
+    encoder = _stdlib_numeric_encoder if numeric_decimals else _stdlib_encoder
+    return encoder.encode(data).encode('utf-8')
+
+
+class FastJsonResponse(HttpResponse):
+    """
+    JsonResponse encoded with `dumps`. Any JSON value may be sent, so there
+    is no `safe` flag.
+    """
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+class Schema:
+    """
+    A fixed mapping from ORM lookups to a (possibly nested) response dict.
+
+    Rows are read with `.values_list()`, so no model instances are built,
+    and turned into dicts by a function built once per schema:
+
+        ORDER = Schema({'id': 'id', 'product.name': 'product__name'})
+        ORDER.rows(Order.objects.all())  # [{'id': 1, 'product': {'name': ...}}]
+
+    :param fields: Mapping of output key to lookup; dots in a key nest it
+    """
+
+    def __init__(self, fields):
+        self.keys = tuple(fields)
+        self.lookups = tuple(fields.values())
+        self.build = self._compile()
+
+    def _compile(self):
+        tree = {}
+        for index, key in enumerate(self.keys):
+            *parents, leaf = key.split('.')
+            node = tree
+            for parent in parents:
+                node = node.setdefault(parent, {})
+            node[leaf] = index
+
+        def builder(node):
+            if all(not isinstance(value, dict) for value in node.values()):
+                keys = tuple(node)
+                if tuple(node.values()) == tuple(range(len(self.keys))):
+                    # Flat schema: the row is the values in key order
+                    return lambda row: dict(zip(keys, row))
+                get = itemgetter(*node.values())
+                if len(keys) == 1:
+                    return lambda row: {keys[0]: get(row)}
+                return lambda row: dict(zip(keys, get(row)))
+            parts = tuple(
+                (key, builder(value) if isinstance(value, dict) else itemgetter(value))
+                for key, value in node.items()
+            )
+            return lambda row: {key: part(row) for key, part in parts}
+
+        return builder(tree)
+
+    def rows(self, queryset):
+        """Evaluate `queryset` into a list of response dicts."""
+        build = self.build
+        return [build(row) for row in queryset.values_list(*self.lookups)]
+
+
+# order_history rows
+BUYER_ORDER = Schema({
+    'id': 'id',
+    'product.id': 'product_id',
+    'product.name': 'product__name',
+    'quantity': 'quantity',
+    'total_price': 'total_price',
+    'address': 'address',
+    'created_at': 'created_at',
+})
+
+# seller_orders rows
+SELLER_ORDER = Schema({
+    'id': 'id',
+    'product.id': 'product_id',
+    'product.name': 'product__name',
+    'buyer.id': 'buyer_id',
+    'buyer.username': 'buyer__username',
+    'quantity': 'quantity',
+    'total_price': 'total_price',
+    'address': 'address',
+    'created_at': 'created_at',
+})
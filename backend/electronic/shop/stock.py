@@ -0,0 +1,202 @@
+'''
+    Stock reservation helpers
+'''
+
+import random
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, When
+from django.utils import timezone
+from .cache import bump_catalog_version
+from .models import Product, StockShard
+
+
+class OutOfStock(Exception):
+    """Raised when a reservation asks for more units than are left."""
+
+
+def reserve_stock(product_id, quantity):
+    """
+    Take `quantity` units of a product in a single conditional UPDATE.
+
+    The database checks and decrements the stock in one statement
+    (`UPDATE ... SET stock = stock - n WHERE stock >= n`), so concurrent
+    checkouts can never oversell; only `stock` and `updated_at` are written.
+    With STOCK_SHARDING on, products that have stock shards are reserved
+    from a shard instead.
+
+    :param product_id: Product to reserve
+    :param quantity: Number of units, must be positive
+    :raises OutOfStock: If fewer than `quantity` units are left
+    """
+    if quantity <= 0:
+        raise ValueError('Quantity must be positive')
+
+    if getattr(settings, 'STOCK_SHARDING', False) and StockShard.objects.filter(product_id=product_id).exists():
+        reserve_sharded_stock(product_id, quantity)
+        return
+
+    updated = Product.objects.filter(id=product_id, stock__gte=quantity).update(
+        stock=F('stock') - quantity, updated_at=timezone.now(),
+    )
+    if not updated:
+        raise OutOfStock(f'Insufficient stock for product {product_id}')
+
+
+def reserve_stock_bulk(quantities):
+    """
+    Reserve several products at once for a multi-item checkout.
+
+    Must run inside `transaction.atomic()`. The rows are locked with one
+    SELECT ... FOR UPDATE (in id order, so concurrent carts cannot
+    deadlock), checked, and decremented with one UPDATE using CASE.
+    Sharded products are reserved from their shards, as by `reserve_stock`,
+    and their Product rows are neither locked nor written. Either every
+    item is reserved or none is.
+
+    :param quantities: Mapping of product id to quantity
+    :return: Mapping of product id to the locked Product
+    :raises Product.DoesNotExist: If a product id is unknown
+    :raises OutOfStock: If any product has too few units left
+    """
+    if any(quantity <= 0 for quantity in quantities.values()):
+        raise ValueError('Quantity must be positive')
+
+    sharded = sharded_product_ids(quantities)
+    plain = [product_id for product_id in quantities if product_id not in sharded]
+    locked = Product.objects.select_for_update().filter(id__in=plain).order_by('id')
+    products = {product.id: product for product in locked}
+    if sharded:
+        products.update(Product.objects.in_bulk(sharded))
+
+    missing = [product_id for product_id in quantities if product_id not in products]
+    if missing:
+        raise Product.DoesNotExist(f"Product(s) not found: {', '.join(map(str, missing))}")
+    short = [product_id for product_id in plain if products[product_id].stock < quantities[product_id]]
+    if short:
+        raise OutOfStock(f"Insufficient stock for product(s) {', '.join(map(str, short))}")
+
+    if plain:
+        Product.objects.filter(id__in=plain).update(stock=Case(
+            *[When(id=product_id, then=F('stock') - quantities[product_id]) for product_id in plain],
+            default=F('stock'),
+            output_field=IntegerField(),
+        ), updated_at=timezone.now())
+        for product_id in plain:
+            products[product_id].stock -= quantities[product_id]
+    # An OutOfStock here rolls back the caller's transaction, plain items included
+    for product_id in sorted(sharded):
+        reserve_sharded_stock(product_id, quantities[product_id])
+    return products
+
+
+# Sharded hot-SKU counters
+#
+# During a flash sale every checkout for the same product updates the same
+# row and queues on its lock. Splitting the stock over several StockShard rows
+# lets checkouts start at a random shard, so they mostly lock different rows.
+# While a product is sharded its Product.stock stays at 0 and the available
+# quantity is the sum of the shards: read views add the shard totals to the
+# rows they return (add_shard_stock) and filter on in_stock_condition().
+
+def shard_stock(product_id, shards):
+    """
+    Move a product's stock into `shards` counters.
+    """
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(id=product_id)
+        existing = StockShard.objects.filter(product_id=product_id).aggregate(total=Sum('stock'))['total'] or 0
+        total = product.stock + existing
+        StockShard.objects.filter(product_id=product_id).delete()
+        StockShard.objects.bulk_create([
+            StockShard(product_id=product_id, shard=i, stock=total // shards + (1 if i < total % shards else 0))
+            for i in range(shards)
+        ])
+        Product.objects.filter(id=product_id).update(stock=0, updated_at=timezone.now())
+    bump_catalog_version(product.seller_id)
+
+
+def merge_stock_shards(product_id):
+    """
+    Fold the shard counters back into Product.stock and drop them.
+    """
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(id=product_id)
+        remaining = StockShard.objects.filter(product_id=product_id).aggregate(total=Sum('stock'))['total'] or 0
+        StockShard.objects.filter(product_id=product_id).delete()
+        Product.objects.filter(id=product_id).update(stock=F('stock') + remaining, updated_at=timezone.now())
+    bump_catalog_version(product.seller_id)
+
+
+def reserve_sharded_stock(product_id, quantity):
+    """
+    Reserve from the first shard that can cover `quantity`, starting at a
+    random shard. An order is never split across shards, so a request can
+    be refused while the shards together still hold enough units; callers
+    see that as OutOfStock, the same as a real sell-out.
+    """
+    shards = list(StockShard.objects.filter(product_id=product_id).values_list('shard', flat=True))
+    if not shards:
+        raise OutOfStock(f'Insufficient stock for product {product_id}')
+    start = random.randrange(len(shards))
+    for shard in shards[start:] + shards[:start]:
+        updated = StockShard.objects.filter(
+            product_id=product_id, shard=shard, stock__gte=quantity,
+        ).update(stock=F('stock') - quantity)
+        if updated:
+            return
+    raise OutOfStock(f'Insufficient stock for product {product_id}')
+
+
+def available_stock(product_id):
+    """Units left for a product, including any stock shards."""
+    sharded = StockShard.objects.filter(product_id=product_id).aggregate(total=Sum('stock'))['total'] or 0
+    stock = Product.objects.filter(id=product_id).values_list('stock', flat=True).first() or 0
+    return stock + sharded
+
+
+def sharded_product_ids(product_ids):
+    """The ids among `product_ids` whose stock is held in shards."""
+    if not getattr(settings, 'STOCK_SHARDING', False) or not product_ids:
+        return set()
+    return set(
+        StockShard.objects.filter(product_id__in=list(product_ids))
+        .values_list('product_id', flat=True).distinct()
+    )
+
+
+def shard_totals(product_ids):
+    """Mapping of product id to units left in its shards, for sharded products."""
+    if not getattr(settings, 'STOCK_SHARDING', False) or not product_ids:
+        return {}
+    return dict(
+        StockShard.objects.filter(product_id__in=list(product_ids))
+        .values('product_id').annotate(total=Sum('stock')).values_list('product_id', 'total')
+    )
+
+
+def add_shard_stock(rows, id_key='id', stock_key='stock'):
+    """
+    Add the shard totals to the stock of product rows, in place.
+
+    One query for all rows, none while STOCK_SHARDING is off.
+
+    :param rows: Dicts, or lists with `id_key` and `stock_key` as positions
+    :return: `rows`
+    """
+    if not rows or not getattr(settings, 'STOCK_SHARDING', False):
+        return rows
+    if isinstance(rows[0], dict) and stock_key not in rows[0]:
+        return rows
+    totals = shard_totals([row[id_key] for row in rows])
+    for row in rows:
+        row[stock_key] += totals.get(row[id_key], 0)
+    return rows
+
+
+def in_stock_condition():
+    """Q for products with units left, in Product.stock or in their shards."""
+    condition = Q(stock__gt=0)
+    if getattr(settings, 'STOCK_SHARDING', False):
+        condition |= Q(id__in=StockShard.objects.filter(stock__gt=0).values('product_id'))
+    return condition
@@ -0,0 +1,1530 @@
+import csv
+import hashlib
+import io
+import json
+import threading
+import tracemalloc
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.utils import timezone
+from django.test import AsyncRequestFactory, TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from electronic.settings import AWS_STORAGE_BUCKET_NAME
+from .models import User, Product, Order, ArchivedOrder, Receipt, ArchivedReceipt, DailySales, ReplicaHeartbeat, OutboxMessage, PendingSale
+from .search import get_index, reset_index, search_backend
+from .authentication import ClaimsUser, auth_stats, tokens_for
+from .passwords import HashingBusy, get_executor as get_password_executor, reset_executor
+from .cache import bump_catalog_version, catalog_stamp
+from .replicas import ReplicaRouter, replica_status, reset_replica_state
+from .metrics import render_metrics, reset_metrics
+from .aws import client_stats, get_client, object_key_from_url, object_url, reset_clients, upload_fileobj_to_s3
+from .images import (
+    VARIANT_CACHE_CONTROL, _store_variants, get_executor as get_image_executor, render_variants, store_original,
+    variant_key,
+)
+from .benchmarks import build_routes, compare, run_benchmark, seed_dataset, stub_aws, url_names
+from .sales import fold_pending_sales, rebuild_daily_sales
+from .stock import available_stock, merge_stock_shards, shard_stock
+from .outbox import backoff_delay, dispatch_outbox_batch
+from . import async_views, serializers
+from .serializers import Schema, dumps
+
+# From requirements-dev.txt
+import boto3
+from moto import mock_aws
+
+
+def explain_full_scans(sql):
+    """
+    Return the shop tables a query reads with a full table scan.
+
+    Queries with a LIMIT are checked too: a LIMIT bounds the rows returned,
+    not the rows read to find them. The one exception is SQLite walking a
+    table in rowid order with no WHERE and no sort, which stops at the
+    LIMIT (MySQL reports that as an index read). Only SQLite and MySQL
+    plans are understood.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[-1] for row in cursor.fetchall()]
+            upper = sql.upper()
+            if ' LIMIT ' in upper and ' WHERE ' not in upper and not any('TEMP B-TREE' in d for d in details):
+                return []
+            return [
+                detail for detail in details
+                if detail.startswith('SCAN shop_') and 'USING' not in detail
+            ]
+        if connection.vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}')
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return [
+                row['table'] for row in rows
+                if row['type'] == 'ALL' and str(row['table']).startswith('shop_')
+            ]
+    return []
+
+
+class ShopTestCase(TestCase):
+    """
+    A seller and a buyer, an empty cache for every test, and API clients
+    authenticated as either.
+    """
+    # Read views check the replicas' lag, if any are configured
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'pw', is_seller=True)
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw', is_buyer=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def client_for(self, user=None):
+        """An API client, sending a token for `user` if given."""
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for(user).access_token}')
+        return client
+
+
+@override_settings(RECEIPT_RENDERER='local', RECEIPT_PREGENERATE=False, IMAGE_PROCESSING=False)
+class QueryPlanTests(ShopTestCase):
+    """
+    Every endpoint must run a fixed number of queries, whatever the number
+    of rows (no N+1), and none of them may scan a shop table in full.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_buyer = User.objects.create_user('other', 'other@example.com', 'pw', is_buyer=True)
+        cls.add_rows(5)
+
+    @classmethod
+    def add_rows(cls, count):
+        products = Product.objects.bulk_create([
+            Product(seller=cls.seller, name=f'Product {i}', description='', price='9.99', stock=1000)
+            for i in range(count)
+        ])
+        Order.objects.bulk_create([
+            Order(buyer=buyer, product=product, seller=cls.seller, quantity=1, address='Street 1', total_price='9.99')
+            for product in products
+            for buyer in (cls.buyer, cls.other_buyer)
+        ])
+
+    def endpoints(self):
+        product_id = Product.objects.order_by('id').values_list('id', flat=True).first()
+        order_id = Order.objects.filter(buyer=self.buyer).values_list('id', flat=True).first()
+        self.run_id = getattr(self, 'run_id', 0) + 1
+        # Deleted by the delete_product call
+        doomed = Product.objects.create(
+            seller=self.seller, name='Doomed', description='', price='1.00', stock=1,
+            image_url=f'https://bucket.s3.amazonaws.com/media/products/doomed{self.run_id}.png',
+        )
+        seller = self.client_for(self.seller)
+        buyer = self.client_for(self.buyer)
+        image = io.BytesIO(f'image {self.run_id}'.encode('utf-8'))
+        image.name = 'product.png'
+        return {
+            'home': lambda: APIClient().get('/api/products/'),
+            'home_page_2': lambda: APIClient().get(f'/api/products/?cursor={product_id}&fields=name,price'),
+            'home_filtered': lambda: APIClient().get(
+                f'/api/products/?sort=-price&min_price=1&in_stock=true&seller={self.seller.id}&facets=true',
+            ),
+            'product_detail': lambda: APIClient().get(f'/api/product/?product_id={product_id}'),
+            'seller_products': lambda: seller.get('/api/seller/products/'),
+            'seller_orders': lambda: seller.get('/api/seller/orders/'),
+            'seller_dashboard': lambda: seller.get('/api/seller/dashboard/'),
+            'order_history': lambda: buyer.get('/api/orders/'),
+            'get_user_info': lambda: buyer.get('/api/user/'),
+            'order_receipt': lambda: buyer.get(f'/api/orders/{order_id}/receipt/'),
+            'place_order': lambda: buyer.post(
+                '/api/order/', {'product_id': product_id, 'quantity': 1, 'address': 'Street 1'}, format='json',
+            ),
+            'place_bulk_order': lambda: buyer.post(
+                '/api/order/batch/',
+                {'items': [{'product_id': product_id, 'quantity': 1}], 'address': 'Street 1'},
+                format='json',
+            ),
+            'search': lambda: APIClient().get('/api/products/search/?q=product'),
+            'autocomplete': lambda: APIClient().get('/api/products/autocomplete/?q=prod'),
+            'add_product': lambda: seller.post(
+                '/api/seller/add/', {'name': 'New', 'description': '', 'price': '5.00', 'stock': '3', 'image': image},
+            ),
+            'edit_product': lambda: seller.put(
+                '/api/seller/edit/', {'product_id': product_id, 'description': 'Edited'}, format='json',
+            ),
+            'delete_product': lambda: seller.delete(
+                '/api/seller/delete/', {'product_id': doomed.id}, format='json',
+            ),
+            'register': lambda: APIClient().post(
+                '/api/register/', {'username': f'new{self.run_id}', 'password': 'pw', 'is_buyer': True}, format='json',
+            ),
+            'login': lambda: APIClient().post('/api/login/', {'username': 'buyer', 'password': 'pw'}, format='json'),
+        }
+
+    def measure(self):
+        # The local search index is built once per process, not per request
+        if search_backend() == 'local':
+            get_index()
+        statements = {}
+        for name, call in self.endpoints().items():
+            cache.clear()
+            Receipt.objects.all().delete()
+            DailySales.objects.all().delete()
+            PendingSale.objects.all().delete()
+            with stub_aws(), CaptureQueriesContext(connection) as queries:
+                response = call()
+            self.assertLess(response.status_code, 400, f'{name}: {response.content[:200]}')
+            statements[name] = [query['sql'] for query in queries.captured_queries]
+        return statements
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        small = self.measure()
+        self.add_rows(20)
+        large = self.measure()
+        for name in small:
+            with self.subTest(endpoint=name):
+                # Order pages read the archive only when Order cannot fill them,
+                # so more rows may mean one query less, never more
+                self.assertLessEqual(
+                    len(large[name]), len(small[name]),
+                    f'{name} ran {len(small[name])} queries with 5 products '
+                    f'and {len(large[name])} with 25 (N+1?)',
+                )
+
+    def test_full_scan_detection(self):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            self.skipTest(f'No plan checks for {connection.vendor}')
+        self.assertTrue(explain_full_scans("SELECT id FROM shop_order WHERE address = 'x'"))
+
+    def test_no_full_table_scans(self):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            self.skipTest(f'No plan checks for {connection.vendor}')
+        self.add_rows(20)
+        for name, statements in self.measure().items():
+            for sql in statements:
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                with self.subTest(endpoint=name, sql=sql[:120]):
+                    self.assertEqual(explain_full_scans(sql), [])
+
+
+
+class CatalogFilterTests(ShopTestCase):
+    """
+    Filters, sorts and facet counts of the product list.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_seller = User.objects.create_user('other', 'other@example.com', 'pw', is_seller=True)
+        prices = ['10.00', '10.00', '10.00', '75.00', '120.00', '120.00', '2000.00']
+        for i, price in enumerate(prices):
+            Product.objects.create(
+                seller=cls.seller if i % 2 else cls.other_seller,
+                name=f'Product {i}', description='', price=price, stock=i % 3,
+            )
+
+    def get(self, query):
+        response = APIClient().get(f'/api/products/?{query}')
+        self.assertEqual(response.status_code, 200, response.content[:200])
+        return response.json()
+
+    def walk(self, query):
+        """All pages of a listing, following next_cursor."""
+        rows, cursor = [], None
+        while True:
+            page = self.get(query + (f'&cursor={cursor}' if cursor else ''))
+            rows.extend(page['products'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return rows
+
+    def test_sorted_pages_cover_every_product_once(self):
+        for sort in ('price', '-price', 'stock', '-stock'):
+            with self.subTest(sort=sort):
+                rows = self.walk(f'sort={sort}&limit=2&fields=name')
+                expected = list(
+                    Product.objects.order_by(sort, '-id' if sort.startswith('-') else 'id').values_list('id', flat=True)
+                )
+                self.assertEqual([row['id'] for row in rows], expected)
+                self.assertEqual(set(rows[0]), {'id', 'name'})
+
+    def test_filters(self):
+        rows = self.walk(f'min_price=50&max_price=1000&in_stock=1&seller={self.seller.id}')
+        expected = Product.objects.filter(
+            price__gte=50, price__lte=1000, stock__gt=0, seller=self.seller,
+        ).order_by('id')
+        self.assertEqual([row['id'] for row in rows], [product.id for product in expected])
+
+    def test_invalid_prices_are_rejected(self):
+        for raw in ('abc', 'Infinity', '-inf', 'NaN', 'sNaN'):
+            with self.subTest(price=raw):
+                response = APIClient().get(f'/api/products/?min_price={raw}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('min_price', response.json()['error'])
+
+    def test_facet_counts(self):
+        facets = self.get('facets=true&limit=1')['facets']
+        self.assertEqual(facets['total'], 7)
+        self.assertEqual(facets['in_stock'], Product.objects.filter(stock__gt=0).count())
+        self.assertEqual(
+            [(bucket['range'], bucket['count']) for bucket in facets['price']],
+            [('0-50', 3), ('50-100', 1), ('100-250', 2), ('250-500', 0), ('500-1000', 0), ('1000+', 1)],
+        )
+        self.assertEqual(
+            [(seller['username'], seller['count']) for seller in facets['sellers']],
+            [('other', 4), ('seller', 3)],
+        )
+
+    def test_facets_follow_filters_and_writes(self):
+        self.assertEqual(self.get('facets=1&max_price=50')['facets']['total'], 3)
+        product = Product.objects.create(seller=self.seller, name='New', description='', price='5.00', stock=1)
+        bump_catalog_version(self.seller.id)
+        self.assertEqual(self.get('facets=1&max_price=50')['facets']['total'], 4)
+        product.delete()
+
+    def test_rejects_bad_parameters(self):
+        for query in ('sort=name', 'min_price=cheap', 'seller=x', 'sort=price&cursor=nope'):
+            with self.subTest(query=query):
+                self.assertEqual(APIClient().get(f'/api/products/?{query}').status_code, 400)
+
+
+@override_settings(STOCK_SHARDING=True, RECEIPT_RENDERER='local', RECEIPT_PREGENERATE=False)
+class StockShardingTests(ShopTestCase):
+    """
+    A sharded product sells through both checkouts and shows its summed
+    shard stock in the catalog.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.hot = Product.objects.create(seller=cls.seller, name='Hot', description='', price='5.00', stock=10)
+        cls.plain = Product.objects.create(seller=cls.seller, name='Plain', description='', price='2.00', stock=4)
+
+    def setUp(self):
+        super().setUp()
+        shard_stock(self.hot.id, 4)
+        self.client = self.client_for(self.buyer)
+
+    def bulk_order(self, hot, plain=1):
+        return self.client.post('/api/order/batch/', {
+            'items': [{'product_id': self.hot.id, 'quantity': hot}, {'product_id': self.plain.id, 'quantity': plain}],
+            'address': 'Street 1',
+        }, format='json')
+
+    def test_bulk_order_reserves_from_shards(self):
+        response = self.bulk_order(2)
+        self.assertEqual(response.status_code, 201, response.content[:200])
+        self.assertEqual(available_stock(self.hot.id), 8)
+        self.assertEqual(Product.objects.get(id=self.plain.id).stock, 3)
+
+    def test_short_shard_rolls_back_the_whole_cart(self):
+        # 10 units over 4 shards: no single shard holds 4
+        self.assertEqual(self.bulk_order(4).status_code, 409)
+        self.assertEqual(available_stock(self.hot.id), 10)
+        self.assertEqual(Product.objects.get(id=self.plain.id).stock, 4)
+
+    def test_catalog_shows_summed_shard_stock(self):
+        detail = APIClient().get(f'/api/product/?product_id={self.hot.id}').json()['product']
+        self.assertEqual(detail['stock'], 10)
+        listing = APIClient().get('/api/products/?in_stock=1').json()['products']
+        self.assertEqual({row['id']: row['stock'] for row in listing}, {self.hot.id: 10, self.plain.id: 4})
+        facets = APIClient().get('/api/products/?facets=1').json()['facets']
+        self.assertEqual(facets['in_stock'], 2)
+
+    def test_sharding_invalidates_the_catalog(self):
+        before = catalog_stamp(self.seller.id)[0]
+        shard_stock(self.plain.id, 2)
+        sharded = catalog_stamp(self.seller.id)[0]
+        self.assertNotEqual(sharded, before)
+        merge_stock_shards(self.plain.id)
+        self.assertNotEqual(catalog_stamp(self.seller.id)[0], sharded)
+        self.assertEqual(Product.objects.get(id=self.plain.id).stock, 4)
+
+
+@override_settings(RECEIPT_PREGENERATE=False)
+class CheckoutTests(ShopTestCase):
+    """
+    Single and bulk checkouts: stock, validation, the notifications they
+    queue, the catalog and dashboard they update, and the seller backfill.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.phone = Product.objects.create(seller=cls.seller, name='Phone', description='', price='9.99', stock=5)
+        cls.case = Product.objects.create(seller=cls.seller, name='Case', description='', price='2.50', stock=5)
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.buyer)
+
+    def stock(self, product):
+        return Product.objects.values_list('stock', flat=True).get(id=product.id)
+
+    def order(self, product, quantity):
+        return self.client.post(
+            '/api/order/', {'product_id': product.id, 'quantity': quantity, 'address': 'Street 1'}, format='json',
+        )
+
+    def bulk_order(self, items, address='Street 1'):
+        body = {'items': items} if address is None else {'items': items, 'address': address}
+        return self.client.post('/api/order/batch/', body, format='json')
+
+    def test_oversell_is_a_conflict(self):
+        self.assertEqual(self.order(self.phone, 6).status_code, 409)
+        response = self.bulk_order([
+            {'product_id': self.case.id, 'quantity': 1}, {'product_id': self.phone.id, 'quantity': 6},
+        ])
+        self.assertEqual(response.status_code, 409)
+        # Nothing of the cart was kept
+        self.assertEqual((self.stock(self.phone), self.stock(self.case)), (5, 5))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OutboxMessage.objects.exists())
+
+        self.assertEqual(self.order(self.phone, 5).status_code, 201)
+        self.assertEqual(self.order(self.phone, 1).status_code, 409)
+        self.assertEqual(self.stock(self.phone), 0)
+
+    def test_bulk_order_merges_repeated_products(self):
+        response = self.bulk_order([
+            {'product_id': self.phone.id, 'quantity': 1},
+            {'product_id': self.case.id, 'quantity': 1},
+            {'product_id': self.phone.id, 'quantity': 2},
+        ])
+        self.assertEqual(response.status_code, 201, response.content[:200])
+        orders = {row['product']['id']: row for row in response.json()['orders']}
+        self.assertEqual(
+            {product_id: (row['quantity'], row['total_price']) for product_id, row in orders.items()},
+            {self.phone.id: (3, '29.97'), self.case.id: (1, '2.50')},
+        )
+        self.assertEqual((self.stock(self.phone), self.stock(self.case)), (2, 4))
+        self.assertEqual(
+            sorted(Order.objects.values_list('id', 'seller_id')), sorted((row['id'], self.seller.id) for row in orders.values()),
+        )
+
+    def test_malformed_carts_are_bad_requests(self):
+        item = {'product_id': self.phone.id, 'quantity': 1}
+        for response, error in (
+            (self.bulk_order([item], address=None), 'address'),
+            (self.client.post('/api/order/batch/', {'items': [item], 'address': None}, format='json'), 'address'),
+            (self.bulk_order([item], address=' '), 'address'),
+            (self.bulk_order('phone'), 'items must be a list'),
+            (self.bulk_order(['phone']), 'items[0] must be an object'),
+            (self.bulk_order([{'product_id': self.phone.id}]), 'items[0].quantity'),
+            (self.bulk_order([{'product_id': self.phone.id, 'quantity': 'two'}]), 'items[0]'),
+            (self.bulk_order([item, {'product_id': self.case.id, 'quantity': -1}]), 'positive'),
+            (self.bulk_order([]), 'empty'),
+        ):
+            with self.subTest(error):
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(error, response.json()['error'])
+        self.assertEqual(self.bulk_order([{'product_id': 0, 'quantity': 1}]).status_code, 404)
+        self.assertFalse(Order.objects.exists())
+
+    def test_orders_queue_one_notification_each(self):
+        self.order(self.phone, 1)
+        self.bulk_order([{'product_id': self.phone.id, 'quantity': 1}, {'product_id': self.case.id, 'quantity': 2}])
+        bodies = [json.loads(body) for body in OutboxMessage.objects.order_by('id').values_list('body', flat=True)]
+        self.assertEqual(
+            sorted((body['order_id'], body['product_name'], body['quantity']) for body in bodies),
+            sorted((order.id, order.product.name, order.quantity) for order in Order.objects.select_related('product')),
+        )
+        self.assertEqual({(body['seller_email'], body['buyer_username']) for body in bodies}, {('seller@example.com', 'buyer')})
+
+    def test_writes_invalidate_the_cached_catalog(self):
+        def listed_stock():
+            return {row['id']: row['stock'] for row in APIClient().get('/api/products/').json()['products']}
+
+        self.assertEqual(listed_stock(), {self.phone.id: 5, self.case.id: 5})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order(self.phone, 2)
+        self.assertEqual(listed_stock(), {self.phone.id: 3, self.case.id: 5})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bulk_order([{'product_id': self.case.id, 'quantity': 1}])
+        self.assertEqual(listed_stock(), {self.phone.id: 3, self.case.id: 4})
+
+        seller = self.client_for(self.seller)
+        with self.captureOnCommitCallbacks(execute=True):
+            seller.put('/api/seller/edit/', {'product_id': self.case.id, 'stock': 9}, format='json')
+        self.assertEqual(listed_stock(), {self.phone.id: 3, self.case.id: 9})
+
+    def test_dashboard_counts_single_orders(self):
+        self.order(self.phone, 2)
+        seller = self.client_for(self.seller)
+        totals = seller.get('/api/seller/dashboard/').json()['totals']
+        self.assertEqual(totals, {'revenue': '19.98', 'units': 2, 'orders': 1})
+
+    def test_backfill_copies_the_product_seller(self):
+        legacy = Order.objects.bulk_create([
+            Order(buyer=self.buyer, product=product, quantity=1, address='Street 1', total_price='1.00')
+            for product in (self.phone, self.case, self.phone)
+        ])
+        self.assertEqual(Order.objects.filter(seller__isnull=True).count(), len(legacy))
+        output = io.StringIO()
+        call_command('backfill_order_seller', batch_size=2, sleep=0, stdout=output)
+        self.assertFalse(Order.objects.filter(seller__isnull=True).exists())
+        self.assertEqual(set(Order.objects.values_list('seller_id', flat=True)), {self.seller.id})
+        self.assertIn('Done: 3 order(s) updated', output.getvalue())
+
+
+@override_settings(RECEIPT_RENDERER='local', RECEIPT_PREGENERATE=False)
+class SalesRollupTests(ShopTestCase):
+    """
+    Checkouts queue their sales, the rollup folds them into DailySales, and
+    the dashboard counts both.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.phone = Product.objects.create(seller=cls.seller, name='Phone', description='', price='9.99', stock=100)
+        cls.case = Product.objects.create(seller=cls.seller, name='Case', description='', price='2.50', stock=100)
+
+    def checkout(self):
+        response = self.client_for(self.buyer).post('/api/order/batch/', {
+            'items': [{'product_id': self.phone.id, 'quantity': 1}, {'product_id': self.case.id, 'quantity': 2}],
+            'address': 'Street 1',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content[:200])
+
+    def dashboard(self):
+        response = self.client_for(self.seller).get('/api/seller/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_checkout_writes_no_aggregate_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.checkout()
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertFalse([sql for sql in statements if 'shop_dailysales' in sql])
+        self.assertEqual(len([sql for sql in statements if sql.startswith('INSERT') and 'shop_pendingsale' in sql]), 1)
+        self.assertEqual(PendingSale.objects.count(), 2)
+
+    def test_dashboard_counts_pending_and_folded_sales(self):
+        self.checkout()
+        pending = self.dashboard()
+        self.assertEqual(pending['totals'], {'revenue': '14.99', 'units': 3, 'orders': 2})
+
+        self.assertEqual(fold_pending_sales(), 2)
+        self.assertFalse(PendingSale.objects.exists())
+        self.checkout()
+        dashboard = self.dashboard()
+        self.assertEqual(dashboard['totals'], {'revenue': '29.98', 'units': 6, 'orders': 4})
+        self.assertEqual(
+            [(row['name'], row['revenue'], row['orders']) for row in dashboard['top_products']],
+            [('Phone', '19.98', 2), ('Case', '10.00', 2)],
+        )
+        self.assertEqual(fold_pending_sales(), 2)
+        self.assertEqual(self.dashboard(), dashboard)
+        self.assertEqual(DailySales.objects.get(product=self.phone).orders, 2)
+
+    def test_revenue_has_one_type_and_two_places(self):
+        self.checkout()
+        fold_pending_sales()
+        revenues = {row['revenue'] for row in self.dashboard()['series']}
+        self.assertEqual(revenues, {'0.00', '14.99'})
+
+
+class SerializerTests(TestCase):
+    """
+    orjson and the stdlib fallback must write the same bytes.
+    """
+
+    payload = {
+        'price': Decimal('9.90'),
+        'created_at': datetime(2024, 5, 1, 12, 30, 15, 250000, tzinfo=dt_timezone.utc),
+        'day': date(2024, 5, 1),
+        'nested': [{'name': 'Café', 'stock': 3, 'ok': True, 'none': None}],
+    }
+
+    def test_encoders_agree(self):
+        expected = (
+            b'{"price":"9.90","created_at":"2024-05-01T12:30:15.250000Z","day":"2024-05-01",'
+            b'"nested":[{"name":"Caf\xc3\xa9","stock":3,"ok":true,"none":null}]}'
+        )
+        with mock.patch('shop.serializers.orjson', None):
+            self.assertEqual(dumps(self.payload), expected)
+        if serializers.orjson is not None:
+            self.assertEqual(dumps(self.payload), expected)
+
+    def test_numeric_decimals(self):
+        with mock.patch('shop.serializers.orjson', None):
+            self.assertEqual(dumps({'total': Decimal('19.80')}, numeric_decimals=True), b'{"total":19.8}')
+        self.assertEqual(dumps({'total': Decimal('19.80')}, numeric_decimals=True), b'{"total":19.8}')
+
+    def test_schema_nests_dotted_keys(self):
+        schema = Schema({'id': 'id', 'product.id': 'product_id', 'product.name': 'product__name'})
+        self.assertEqual(schema.build((1, 2, 'Phone')), {'id': 1, 'product': {'id': 2, 'name': 'Phone'}})
+
+    def test_schema_shapes(self):
+        self.assertEqual(Schema({'id': 'id', 'name': 'name'}).build((1, 'Phone')), {'id': 1, 'name': 'Phone'})
+        self.assertEqual(
+            Schema({'a.b.c': 'x', 'a.d': 'y', 'e': 'z'}).build((1, 2, 3)), {'a': {'b': {'c': 1}, 'd': 2}, 'e': 3},
+        )
+        self.assertEqual(Schema({'seller.id': 'seller_id'}).build((7,)), {'seller': {'id': 7}})
+        # Keys are data, never code
+        self.assertEqual(Schema({"x'}), __import__('os')#": 'id'}).build((1,)), {"x'}), __import__('os')#": 1})
+
+
+# Row number 0..10**digits-1 from a cross join of digit tables, per backend
+ROW_TIMESTAMP_SQL = {
+    'sqlite': "datetime('2024-01-01', '+' || ({n}) || ' seconds')",
+    'mysql': "TIMESTAMPADD(SECOND, {n}, '2024-01-01')",
+    'postgresql': "TIMESTAMP '2024-01-01' + ({n}) * INTERVAL '1 second'",
+}
+
+
+def insert_orders(count_digits, buyer, product):
+    """Insert 10**count_digits orders with distinct timestamps in one statement."""
+    digits = ' UNION ALL '.join(f'SELECT {d} AS d' for d in range(10))
+    tables = ' CROSS JOIN '.join(f'({digits}) d{i}' for i in range(count_digits))
+    number = ' + '.join(f'{10 ** i} * d{i}.d' for i in range(count_digits))
+    created_at = ROW_TIMESTAMP_SQL[connection.vendor].format(n=number)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO shop_order "
+            f"(buyer_id, product_id, seller_id, quantity, address, total_price, created_at, updated_at) "
+            f"SELECT %s, %s, %s, 1, 'Street 1', 9.99, {created_at}, {created_at} FROM {tables}",
+            [buyer.id, product.id, product.seller_id],
+        )
+
+
+@override_settings(EXPORT_CHUNK_SIZE=100)
+class ExportTests(ShopTestCase):
+    """
+    NDJSON / CSV streaming of the order and product lists.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product = Product.objects.create(seller=cls.seller, name='Cable, USB', description='', price='9.99', stock=1)
+
+    def skip_unless_supported(self):
+        if connection.vendor not in ROW_TIMESTAMP_SQL:
+            self.skipTest(f'No row generator for {connection.vendor}')
+
+    def test_exports_every_row_once(self):
+        self.skip_unless_supported()
+        insert_orders(3, self.buyer, self.product)
+        response = self.client_for(self.buyer).get('/api/orders/?export=ndjson')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).splitlines()
+        ids = [json.loads(line)['id'] for line in lines]
+        self.assertEqual(ids, list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+        response = self.client_for(self.seller).get('/api/seller/orders/?export=csv')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(rows[0][:3], ['id', 'product.id', 'product.name'])
+        self.assertEqual(len(rows), 1001)
+        self.assertEqual(rows[1][2], 'Cable, USB')
+
+    def test_first_chunk_needs_one_query(self):
+        self.skip_unless_supported()
+        insert_orders(3, self.buyer, self.product)
+        response = self.client_for(self.buyer).get('/api/orders/?export=ndjson')
+        with CaptureQueriesContext(connection) as queries:
+            first = next(iter(response.streaming_content))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(first.count(b'\n'), 100)
+
+    @tag('slow')
+    def test_memory_stays_bounded_on_a_million_rows(self):
+        self.skip_unless_supported()
+        insert_orders(6, self.buyer, self.product)
+        with override_settings(EXPORT_CHUNK_SIZE=2000):
+            response = self.client_for(self.buyer).get('/api/orders/?export=ndjson')
+        tracemalloc.start()
+        try:
+            rows = sum(chunk.count(b'\n') for chunk in response.streaming_content)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(rows, 1_000_000)
+        # One 2000-row chunk is about 1 MB; the whole export would be ~150 MB
+        self.assertLess(peak, 16 * 1024 * 1024)
+
+
+class ConditionalRequestTests(ShopTestCase):
+    """
+    Read endpoints answer 304 from their stamps, without building the body.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product = Product.objects.create(seller=cls.seller, name='Phone', description='', price='9.99', stock=10)
+        Order.objects.create(
+            buyer=cls.buyer, product=cls.product, seller=cls.seller, quantity=1, address='Street 1', total_price='9.99',
+        )
+
+    def revalidate(self, client, url, response):
+        """Repeat a request with its validators; return (response, queries run)."""
+        headers = {'HTTP_IF_NONE_MATCH': response['ETag']}
+        with CaptureQueriesContext(connection) as queries:
+            again = client.get(url, **headers)
+        return again, len(queries)
+
+    def test_catalog_is_revalidated_without_queries(self):
+        client = self.client_for()
+        first = client.get('/api/products/?limit=5')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('public', first['Cache-Control'])
+        again, queries = self.revalidate(client, '/api/products/?limit=5', first)
+        self.assertEqual((again.status_code, queries), (304, 0))
+
+        bump_catalog_version(self.seller.id)
+        changed = client.get('/api/products/?limit=5', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        self.assertIn('Last-Modified', changed)
+
+    def test_product_detail_follows_updated_at(self):
+        client = self.client_for()
+        url = f'/api/product/?product_id={self.product.id}'
+        first = client.get(url)
+        again, queries = self.revalidate(client, url, first)
+        self.assertEqual((again.status_code, queries), (304, 1))
+        since = client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+        Product.objects.filter(id=self.product.id).update(updated_at=timezone.now() + timedelta(seconds=5))
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_saving_a_product_changes_the_etags(self):
+        client = self.client_for()
+        listing = client.get('/api/products/')
+        detail = client.get(f'/api/product/?product_id={self.product.id}')
+        # As ProductAdmin saves it
+        self.product.price = Decimal('8.99')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        again = client.get('/api/products/', HTTP_IF_NONE_MATCH=listing['ETag'])
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()['products'][0]['price'], '8.99')
+        self.assertEqual(
+            client.get(f'/api/product/?product_id={self.product.id}', HTTP_IF_NONE_MATCH=detail['ETag']).status_code, 200,
+        )
+
+    @override_settings(RECEIPT_RENDERER='local', RECEIPT_PREGENERATE=False)
+    def test_receipt_if_none_match_compares_whole_tags(self):
+        client = self.client_for(self.buyer)
+        url = f'/api/orders/{Order.objects.get().id}/receipt/'
+        etag = client.get(url)['ETag']
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=f'"other", {etag}').status_code, 304)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH='*').status_code, 304)
+        # Neither a tag containing it nor a piece of it
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=f'"x{etag[1:-1]}x"').status_code, 200)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag[:20]).status_code, 200)
+
+    @override_settings(RECEIPT_RENDERER='local', RECEIPT_PREGENERATE=False)
+    def test_receipt_is_revalidated(self):
+        client = self.client_for(self.buyer)
+        url = f'/api/orders/{Order.objects.get().id}/receipt/'
+        first = client.get(url)
+        self.assertEqual(first.status_code, 200)
+        again, _ = self.revalidate(client, url, first)
+        self.assertEqual((again.status_code, again['ETag'], again.content), (304, first['ETag'], b''))
+
+    @override_settings(RECEIPT_RENDERER='local', RECEIPT_PREGENERATE=False)
+    async def test_async_receipt_is_revalidated(self):
+        order_id = (await Order.objects.aget()).id
+        headers = {'Authorization': f'Bearer {tokens_for(self.buyer).access_token}'}
+        first = await async_views.get_order_receipt(AsyncRequestFactory().get('/', headers=headers), order_id)
+        self.assertEqual(first.status_code, 200)
+        headers['If-None-Match'] = first['ETag']
+        again = await async_views.get_order_receipt(AsyncRequestFactory().get('/', headers=headers), order_id)
+        self.assertEqual((again.status_code, again['ETag']), (304, first['ETag']))
+
+    def test_receipt_failure_is_logged(self):
+        url = f'/api/orders/{Order.objects.get().id}/receipt/'
+        with mock.patch('shop.views.get_or_create_receipt', side_effect=RuntimeError('Lambda down')):
+            with self.assertLogs('shop.views', 'ERROR') as logs:
+                response = self.client_for(self.buyer).get(url)
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('Lambda down', logs.output[0])
+
+    @override_settings(RECEIPT_RENDERER='lambda')
+    def test_lambda_failure_is_logged_and_not_stored(self):
+        url = f'/api/orders/{Order.objects.get().id}/receipt/'
+        with mock.patch('shop.receipts.render_receipt_with_lambda', side_effect=RuntimeError('Lambda down')):
+            with self.assertLogs('shop.receipts', 'WARNING') as logs:
+                response = self.client_for(self.buyer).get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('rendering locally', logs.output[0])
+        self.assertIn('Lambda down', logs.output[0])
+        self.assertFalse(Receipt.objects.exists())
+
+    def test_malformed_product_id_is_a_bad_request(self):
+        for query in ('product_id=abc', 'product_id=1.5', ''):
+            with self.subTest(query=query):
+                response = self.client_for().get(f'/api/product/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('product_id', response.json()['error'])
+
+    async def test_async_malformed_product_id(self):
+        response = await async_views.product_detail(AsyncRequestFactory().get('/api/product/?product_id=abc'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_evicted_version_never_comes_back(self):
+        seen = {catalog_stamp()[0]}
+        for _ in range(3):
+            bump_catalog_version()
+            seen.add(catalog_stamp()[0])
+            # Evicted, then read or bumped again
+            cache.delete('shop:catalog:v')
+            self.assertNotIn(catalog_stamp()[0], seen)
+            seen.add(catalog_stamp()[0])
+            cache.delete('shop:catalog:v')
+            bump_catalog_version()
+            self.assertNotIn(catalog_stamp()[0], seen)
+            seen.add(catalog_stamp()[0])
+
+    def test_order_history_is_private(self):
+        client = self.client_for(self.buyer)
+        first = client.get('/api/orders/')
+        self.assertIn('private', first['Cache-Control'])
+        self.assertIn('Authorization', first['Vary'])
+        again, queries = self.revalidate(client, '/api/orders/', first)
+        # Only the count/max stamp; the user comes from the token
+        self.assertEqual((again.status_code, queries), (304, 1))
+
+        Order.objects.create(
+            buyer=self.buyer, product=self.product, seller=self.seller, quantity=1, address='Street 1', total_price='9.99',
+        )
+        self.assertEqual(client.get('/api/orders/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_errors_carry_no_validators(self):
+        response = self.client_for(self.seller).get('/api/orders/')
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('ETag', response)
+
+    async def test_async_home(self):
+        request = AsyncRequestFactory().get('/api/products/')
+        first = await async_views.home(request)
+        request = AsyncRequestFactory().get('/api/products/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual((await async_views.home(request)).status_code, 304)
+
+class ClaimsAuthenticationTests(ShopTestCase):
+    """
+    Tokens from login_user carry the roles, so requests skip the user query.
+    """
+
+    def user_queries(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/user/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['username'], 'buyer')
+        return [query['sql'] for query in queries.captured_queries if 'shop_user' in query['sql']]
+
+    def test_login_token_needs_no_user_query(self):
+        response = self.client.post(
+            '/api/login/', json.dumps({'username': 'buyer', 'password': 'pw'}), content_type='application/json',
+        )
+        before = auth_stats()['stateless']
+        self.assertEqual(self.user_queries(response.json()['access_token']), [])
+        self.assertEqual(auth_stats()['stateless'], before + 1)
+
+    def test_token_without_claims_reads_the_user(self):
+        self.assertEqual(len(self.user_queries(RefreshToken.for_user(self.buyer).access_token)), 1)
+
+    def test_other_attributes_come_from_the_user_cache(self):
+        before = auth_stats()
+        token = tokens_for(self.buyer).access_token
+        self.assertEqual(ClaimsUser(token).email, 'buyer@example.com')
+        with self.assertNumQueries(0):
+            self.assertEqual(ClaimsUser(token).email, 'buyer@example.com')
+        after = auth_stats()
+        self.assertEqual((after['misses'] - before['misses'], after['hits'] - before['hits']), (1, 1))
+
+        # Saving the user drops the cached row
+        User.objects.filter(id=self.buyer.id).update(email='new@example.com')
+        self.buyer.refresh_from_db()
+        self.buyer.save()
+        self.assertEqual(ClaimsUser(token).email, 'new@example.com')
+
+
+@override_settings(PASSWORD_HASH_WORKERS=1, LOGIN_IP_BUCKET=None, LOGIN_USERNAME_BUCKET=None)
+class LoginTests(TestCase):
+    """
+    Passwords are hashed in the process pool, and attempts are shed by the
+    token buckets before any hash is spent.
+    """
+
+    def setUp(self):
+        cache.clear()
+        reset_executor()
+        self.addCleanup(reset_executor)
+
+    def post(self, url, **data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_register_and_login_through_the_pool(self):
+        response = self.post('/api/register/', username='buyer', password='s3cret', is_buyer=True)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(username='buyer').check_password('s3cret'))
+        self.assertEqual(self.post('/api/login/', username='buyer', password='s3cret').status_code, 200)
+        self.assertEqual(self.post('/api/login/', username='buyer', password='wrong').status_code, 401)
+
+    def test_pool_workers_are_not_forked(self):
+        executor, _ = get_password_executor()
+        self.assertIn(executor._mp_context.get_start_method(), ('forkserver', 'spawn'))
+
+    def test_non_string_username_is_rejected(self):
+        with mock.patch('shop.views.login_retry_after') as retry_after:
+            response = self.post('/api/login/', username=['buyer'], password='pw')
+        self.assertEqual(response.status_code, 400)
+        retry_after.assert_not_called()
+
+    def test_unknown_user_spends_no_hash(self):
+        with mock.patch('shop.passwords._run') as run:
+            response = self.post('/api/login/', username='nobody', password='pw')
+        self.assertEqual(response.status_code, 401)
+        run.assert_not_called()
+
+    @override_settings(LOGIN_USERNAME_BUCKET=(2, 0.01))
+    def test_username_bucket_sheds_attempts(self):
+        with mock.patch('shop.passwords._run') as run:
+            statuses = [self.post('/api/login/', username='Buyer', password='pw').status_code for _ in range(2)]
+            response = self.post('/api/login/', username='buyer', password='pw')
+        self.assertEqual(statuses, [401, 401])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '100')
+        run.assert_not_called()
+
+    def test_busy_pool_answers_503(self):
+        User.objects.create_user('buyer', 'buyer@example.com', 'pw', is_buyer=True)
+        with mock.patch('shop.passwords._run', side_effect=HashingBusy('busy')):
+            response = self.post('/api/login/', username='buyer', password='pw')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+class RecordingRouter(ReplicaRouter):
+    """ReplicaRouter that notes the database each read went to."""
+    reads = []
+
+    def db_for_read(self, model, **hints):
+        alias = super().db_for_read(model, **hints)
+        self.reads.append((model, alias))
+        return alias
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica_test'], DATABASE_ROUTERS=['shop.tests.RecordingRouter'],
+    MIDDLEWARE=[name for name in settings.MIDDLEWARE if name != 'shop.replicas.PrimaryStickinessMiddleware']
+    + ['shop.replicas.PrimaryStickinessMiddleware'],
+    REPLICA_CHECK_INTERVAL=0, RECEIPT_RENDERER='local', RECEIPT_PREGENERATE=False, IMAGE_PROCESSING=False,
+)
+class ReplicaRoutingTests(ShopTestCase):
+    """
+    Read views use a current replica; writers and lagging replicas fall back
+    to the primary. The replica is a test mirror: another alias for the
+    primary's connection, so it sees the test's rows and RecordingRouter
+    tells the two apart.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product = Product.objects.create(seller=cls.seller, name='Phone', description='', price='9.99', stock=10)
+
+    def setUp(self):
+        super().setUp()
+        connections['replica_test'] = connections['default']
+        self.addCleanup(connections.__delitem__, 'replica_test')
+        reset_replica_state()
+        self.addCleanup(reset_replica_state)
+        self.set_lag(0)
+        RecordingRouter.reads = []
+
+    def set_lag(self, seconds):
+        ReplicaHeartbeat.objects.update_or_create(id=1, defaults={'beat_at': timezone.now() - timedelta(seconds=seconds)})
+
+    def read_from(self, model):
+        """Databases `model` was read from since the last call."""
+        aliases = {alias for read_model, alias in RecordingRouter.reads if read_model is model}
+        RecordingRouter.reads = []
+        return aliases
+
+    def test_read_views_use_the_replica(self):
+        response = APIClient().get(f'/api/product/?product_id={self.product.id}')
+        self.assertEqual(response.json()['product']['name'], 'Phone')
+        self.assertEqual(self.read_from(Product), {'replica_test'})
+        self.assertEqual(replica_status()['reads']['replica'], 1)
+        self.assertLess(replica_status()['lag']['replica_test'], 1)
+
+        # Views not marked read-only stay on the primary
+        client = self.client_for(self.seller)
+        response = client.delete('/api/seller/delete/', {'product_id': self.product.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.read_from(Product), {'default'})
+
+    def test_lagging_replica_leaves_rotation(self):
+        self.set_lag(60)
+        APIClient().get(f'/api/product/?product_id={self.product.id}')
+        self.assertEqual(self.read_from(Product), {'default'})
+        self.assertGreaterEqual(replica_status()['lag']['replica_test'], 60)
+
+        ReplicaHeartbeat.objects.all().delete()
+        APIClient().get('/api/products/')
+        self.assertEqual(self.read_from(Product), {'default'})
+        self.assertIsNone(replica_status()['lag']['replica_test'])
+        self.assertEqual(replica_status()['reads']['primary'], 2)
+
+    def test_unreachable_replica_is_logged(self):
+        with mock.patch.object(ReplicaHeartbeat.objects, 'using', side_effect=DatabaseError('connection refused')):
+            with self.assertLogs('shop.replicas', 'WARNING') as logs:
+                APIClient().get(f'/api/product/?product_id={self.product.id}')
+        self.assertEqual(self.read_from(Product), {'default'})
+        self.assertIn('Replica replica_test is unreachable: connection refused', logs.output[0])
+
+    def test_writer_reads_own_orders_from_primary(self):
+        client = self.client_for(self.buyer)
+        response = client.post(
+            '/api/order/', {'product_id': self.product.id, 'quantity': 1, 'address': 'Street 1'}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.read_from(Order)
+        # The order may not have reached the replica, but the buyer is pinned to the primary
+        self.assertEqual(len(client.get('/api/orders/').json()), 1)
+        self.assertEqual(self.read_from(Order), {'default'})
+        self.assertEqual(replica_status()['reads']['sticky'], 1)
+
+        cache.delete(f'shop:primary:{self.buyer.id}')
+        client.get('/api/orders/')
+        self.assertEqual(self.read_from(Order), {'replica_test'})
+
+    def test_catalog_just_written_is_built_from_primary(self):
+        bump_catalog_version(self.seller.id)
+        names = [product['name'] for product in APIClient().get('/api/products/').json()['products']]
+        self.assertEqual(names, ['Phone'])
+        self.assertEqual(self.read_from(Product), {'default'})
+
+    async def test_async_read_views_use_the_replica(self):
+        response = await async_views.product_detail(
+            AsyncRequestFactory().get(f'/api/product/?product_id={self.product.id}'),
+        )
+        self.assertEqual(response.status_code, 200)
+        response = await async_views.home(AsyncRequestFactory().get('/api/products/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.read_from(Product), {'replica_test'})
+
+        await sync_to_async(bump_catalog_version)(self.seller.id)
+        await async_views.home(AsyncRequestFactory().get('/api/products/'))
+        self.assertEqual(self.read_from(Product), {'default'})
+
+
+@override_settings(RECEIPT_RENDERER='local', RECEIPT_PREGENERATE=False)
+class ArchiveTests(ShopTestCase):
+    """
+    Orders moved to the archive still show up in histories, exports,
+    seller pages, receipts and rebuilt aggregates.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product = Product.objects.create(seller=cls.seller, name='Phone', description='', price='9.99', stock=10)
+        orders = Order.objects.bulk_create([
+            Order(buyer=cls.buyer, product=cls.product, seller=cls.seller, quantity=1,
+                  address='Street 1', total_price='9.99')
+            for _ in range(5)
+        ])
+        # Two orders from two years ago, three recent ones
+        now = timezone.now()
+        for age, order in zip((800, 700, 3, 2, 1), orders):
+            Order.objects.filter(id=order.id).update(created_at=now - timedelta(days=age))
+        cls.old_ids = [orders[1].id, orders[0].id]
+        cls.recent_ids = [orders[4].id, orders[3].id, orders[2].id]
+
+    def setUp(self):
+        super().setUp()
+        call_command('archive_orders', batch_size=1, sleep=0, stdout=io.StringIO())
+
+    def test_old_orders_are_moved(self):
+        self.assertEqual(sorted(Order.objects.values_list('id', flat=True)), sorted(self.recent_ids))
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('id', flat=True)), sorted(self.old_ids))
+        archived = ArchivedOrder.objects.get(id=self.old_ids[0])
+        self.assertEqual((archived.seller_id, archived.address), (self.seller.id, 'Street 1'))
+
+    def test_order_history_includes_archive(self):
+        client = self.client_for(self.buyer)
+        ids = [row['id'] for row in client.get('/api/orders/').json()]
+        self.assertEqual(ids, self.recent_ids + self.old_ids)
+
+        response = client.get('/api/orders/?export=ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], self.recent_ids + self.old_ids)
+
+    def test_seller_pages_continue_into_archive(self):
+        client = self.client_for(self.seller)
+        ids, cursor = [], ''
+        while True:
+            page = client.get(f'/api/seller/orders/?limit=2{cursor}').json()
+            ids += [row['id'] for row in page['orders']]
+            if not page['next_cursor']:
+                break
+            cursor = f"&cursor={page['next_cursor']}"
+        self.assertEqual(ids, self.recent_ids + self.old_ids)
+
+    def test_receipt_of_archived_order(self):
+        client = self.client_for(self.buyer)
+        response = client.get(f'/api/orders/{self.old_ids[0]}/receipt/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['order_id'], self.old_ids[0])
+        self.assertEqual(client.get(f'/api/orders/{self.old_ids[0]}/receipt/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertFalse(Receipt.objects.exists())
+
+        other = User.objects.create_user('other', 'other@example.com', 'pw', is_buyer=True)
+        self.assertEqual(self.client_for(other).get(f'/api/orders/{self.old_ids[0]}/receipt/').status_code, 404)
+
+    def test_stored_receipt_moves_with_order(self):
+        order = Order.objects.create(
+            buyer=self.buyer, product=self.product, seller=self.seller, quantity=1, address='Street 1', total_price='9.99',
+        )
+        client = self.client_for(self.buyer)
+        etag = client.get(f'/api/orders/{order.id}/receipt/')['ETag']
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(days=900))
+        call_command('archive_orders', batch_size=10, sleep=0, stdout=io.StringIO())
+
+        self.assertFalse(Receipt.objects.filter(order_id=order.id).exists())
+        self.assertEqual(ArchivedReceipt.objects.get(order_id=order.id).etag, etag)
+        # Served as stored, not rendered again
+        with mock.patch('shop.receipts.render_receipt') as render:
+            response = client.get(f'/api/orders/{order.id}/receipt/')
+        render.assert_not_called()
+        self.assertEqual(response['ETag'], etag)
+
+    def test_history_manager_spans_archive(self):
+        orders = Order.history.filter(buyer=self.buyer).order_by('-created_at', '-id')
+        self.assertEqual([order.id for order in orders], self.recent_ids + self.old_ids)
+        # Slices read the archive only where Order runs out
+        self.assertEqual(list(orders.values_list('id', flat=True)[2:4]), self.recent_ids[2:] + self.old_ids[:1])
+        self.assertEqual((orders.count(), Order.objects.filter(buyer=self.buyer).count()), (5, 3))
+        self.assertTrue(Order.history.filter(id=self.old_ids[0]).exists())
+        self.assertIsInstance(Order.history.get(id=self.old_ids[0]), ArchivedOrder)
+        with self.assertRaises(Order.DoesNotExist):
+            Order.history.get(id=0)
+        with self.assertRaises(TypeError):
+            orders[:2].filter(quantity=1)
+
+    def test_rebuild_counts_archived_orders(self):
+        today = timezone.localdate()
+        rebuild_daily_sales(today - timedelta(days=1000), today + timedelta(days=1))
+        self.assertEqual(sum(DailySales.objects.values_list('orders', flat=True)), 5)
+
+
+@override_settings(METRICS_SAMPLE_RATE=1.0, METRICS_ALLOWED_NETWORKS=['127.0.0.1/32'])
+class MetricsTests(ShopTestCase):
+    """
+    Sampled requests show up per URL name at /api/metrics/, with their
+    queries; AWS calls are timed per operation.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product = Product.objects.create(seller=cls.seller, name='Phone', description='', price='9.99', stock=10)
+
+    def setUp(self):
+        super().setUp()
+        reset_metrics()
+
+    def test_requests_are_recorded_per_url_name(self):
+        client = APIClient()
+        client.get(f'/api/product/?product_id={self.product.id}')
+        client.get(f'/api/product/?product_id={self.product.id}')
+        client.get('/api/product/?product_id=0')
+        response = client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode('utf-8')
+        self.assertIn('shop_request_duration_seconds_count{view="product_detail"} 3', text)
+        self.assertIn('shop_request_duration_seconds_bucket{view="product_detail",le="+Inf"} 3', text)
+        self.assertIn('shop_responses_total{view="product_detail",status="2xx"} 2', text)
+        self.assertIn('shop_responses_total{view="product_detail",status="4xx"} 1', text)
+        queries = [line for line in text.splitlines() if line.startswith('shop_db_queries_total{view="product_detail"}')]
+        self.assertEqual(len(queries), 1)
+        self.assertGreater(int(queries[0].split()[-1]), 0)
+
+    def test_sampling_off_records_nothing(self):
+        with override_settings(METRICS_SAMPLE_RATE=0.0):
+            APIClient().get(f'/api/product/?product_id={self.product.id}')
+        self.assertNotIn('view="product_detail"', render_metrics())
+
+    def test_scrapes_from_other_networks_are_refused(self):
+        self.assertEqual(APIClient().get('/api/metrics/', REMOTE_ADDR='203.0.113.7').status_code, 403)
+
+    def test_aws_calls_are_timed(self):
+        from botocore.stub import Stubber
+        client = get_client('sqs', 'us-east-1')
+        with Stubber(client) as stubber:
+            stubber.add_response('list_queues', {'QueueUrls': []})
+            client.list_queues()
+        # Outside a request, so without a view
+        self.assertIn('shop_aws_call_duration_seconds_count{view="",operation="sqs.ListQueues"} 1', render_metrics())
+
+
+class BenchmarkTests(ShopTestCase):
+    """
+    The seeded dataset and the endpoint benchmark on a tiny scale: every
+    route runs without errors, against stubbed AWS.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # The seeded dataset brings its own users
+        seed_dataset(200, days=30)
+
+    def test_dataset_is_spread_over_the_window(self):
+        self.assertEqual(Order.objects.count(), 200)
+        self.assertEqual(Product.objects.count(), 20)
+        self.assertEqual(User.objects.filter(is_buyer=True).count(), 10)
+        oldest = Order.objects.order_by('created_at').values_list('created_at', flat=True).first()
+        self.assertLess(oldest, timezone.now() - timedelta(days=7))
+        self.assertEqual(sum(DailySales.objects.values_list('orders', flat=True)), 200)
+
+    def test_every_route_is_covered(self):
+        self.assertEqual({route.name for route in build_routes(1)}, url_names())
+
+    def test_inprocess_run(self):
+        with mock.patch('builtins.print'):
+            report = run_benchmark('inprocess', count=2)
+        self.assertEqual(set(report['routes']), url_names())
+        for name, result in report['routes'].items():
+            with self.subTest(route=name):
+                self.assertEqual(result['errors'], 0)
+                self.assertEqual(result['requests'], 2)
+                self.assertIsNotNone(result['queries_per_request'])
+        self.assertEqual(compare(report, report), [])
+
+        slower = json.loads(json.dumps(report))
+        slower['routes']['home'].update(p95_ms=report['routes']['home']['p95_ms'] * 2 + 5)
+        slower['routes']['order_history']['queries_per_request'] += 1
+        regressions = compare(slower, report)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('home: p95'))
+
+
+@override_settings(SEARCH_BACKEND='local')
+class LocalSearchTests(ShopTestCase):
+    """
+    The in-process BM25 index used when the database has no full-text search.
+    """
+
+    def setUp(self):
+        super().setUp()
+        reset_index()
+        self.addCleanup(reset_index)
+
+    def add(self, name, description=''):
+        return Product.objects.create(seller=self.seller, name=name, description=description, price='1.00', stock=1)
+
+    def names(self, url):
+        response = APIClient().get(url)
+        self.assertEqual(response.status_code, 200, response.content[:200])
+        payload = response.json()
+        return [row['name'] for row in payload.get('products', payload.get('suggestions'))]
+
+    def test_ranks_rarer_and_denser_matches_first(self):
+        self.add('USB cable', 'usb usb cable for phones')
+        self.add('Phone charger', 'fast charger with usb cable')
+        self.add('Laptop stand')
+        self.assertEqual(self.names('/api/products/search/?q=usb+cable'), ['USB cable', 'Phone charger'])
+
+    def test_index_follows_saves_and_deletes(self):
+        product = self.add('Wireless mouse')
+        self.assertEqual(self.names('/api/products/search/?q=mouse'), ['Wireless mouse'])
+        product.name = 'Wireless keyboard'
+        product.save()
+        product.refresh_from_db()
+        cache.clear()
+        self.assertEqual(self.names('/api/products/search/?q=mouse'), [])
+        self.assertEqual(self.names('/api/products/search/?q=keyboard'), ['Wireless keyboard'])
+        product.delete()
+        cache.clear()
+        self.assertEqual(self.names('/api/products/search/?q=keyboard'), [])
+
+    def test_autocomplete_expands_the_last_word(self):
+        self.add('Gaming headphones')
+        self.add('Gaming headset')
+        self.add('Office headphones')
+        names = self.names('/api/products/autocomplete/?q=gaming+head')
+        self.assertEqual(sorted(names[:2]), ['Gaming headphones', 'Gaming headset'])
+        self.assertEqual(names[2:], ['Office headphones'])
+
+
+@override_settings(OUTBOX_BACKOFF_SECONDS=2, OUTBOX_BACKOFF_MAX_SECONDS=300, OUTBOX_MAX_ATTEMPTS=3)
+class OutboxTests(TestCase):
+    """
+    dispatch_outbox_batch against an SQS queue mocked by moto: full
+    batches, entries SQS reports as Failed, and their retries.
+    """
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.sqs = boto3.client('sqs', region_name='us-east-1')
+        self.queue_url = self.sqs.create_queue(QueueName='seller-notifications')['QueueUrl']
+        patcher = mock.patch('shop.aws.SQS_QUEUE_URL', self.queue_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enqueue(self, count):
+        OutboxMessage.objects.bulk_create([OutboxMessage(body=f'{{"order": {i}}}') for i in range(count)])
+        # bulk_create leaves ids unset on MySQL
+        return list(OutboxMessage.objects.order_by('id'))
+
+    def received(self):
+        bodies = []
+        while True:
+            messages = self.sqs.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=10).get('Messages', [])
+            if not messages:
+                return sorted(bodies)
+            bodies += [message['Body'] for message in messages]
+
+    def failing(self, ids):
+        """Let SQS report the entries with these outbox ids as Failed."""
+        send_message_batch = self.sqs.send_message_batch
+
+        def send(QueueUrl, Entries):
+            response = send_message_batch(QueueUrl=QueueUrl, Entries=[
+                entry for entry in Entries if int(entry['Id']) not in ids
+            ])
+            response['Failed'] = [
+                {'Id': entry['Id'], 'SenderFault': False, 'Code': 'InternalError', 'Message': 'Try again'}
+                for entry in Entries if int(entry['Id']) in ids
+            ]
+            return response
+        return mock.patch.object(self.sqs, 'send_message_batch', side_effect=send)
+
+    def test_full_batch_is_sent_and_deleted(self):
+        self.enqueue(12)
+        self.assertEqual(dispatch_outbox_batch(self.sqs), (10, 0))
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+        self.assertEqual(dispatch_outbox_batch(self.sqs), (2, 0))
+        self.assertEqual(dispatch_outbox_batch(self.sqs), (0, 0))
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertEqual(self.received(), sorted(f'{{"order": {i}}}' for i in range(12)))
+
+    def test_failed_entries_are_rescheduled_with_backoff(self):
+        messages = self.enqueue(4)
+        failed_id = messages[1].id
+        before = timezone.now()
+        with self.failing({failed_id}):
+            self.assertEqual(dispatch_outbox_batch(self.sqs), (3, 1))
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.id, failed_id)
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(message.last_error, 'Try again')
+        self.assertGreaterEqual(message.available_at, before + timedelta(seconds=backoff_delay(1)))
+        self.assertEqual(len(self.received()), 3)
+        # Not due yet
+        self.assertEqual(dispatch_outbox_batch(self.sqs), (0, 0))
+
+    def test_retry_succeeds_once_due(self):
+        message = self.enqueue(1)[0]
+        with self.failing({message.id}):
+            self.assertEqual(dispatch_outbox_batch(self.sqs), (0, 1))
+        OutboxMessage.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+        with self.failing({message.id}):
+            self.assertEqual(dispatch_outbox_batch(self.sqs), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 2)
+        self.assertGreaterEqual(message.available_at - timezone.now(), timedelta(seconds=backoff_delay(2) - 1))
+
+        OutboxMessage.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(dispatch_outbox_batch(self.sqs), (1, 0))
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertEqual(self.received(), ['{"order": 0}'])
+
+    def test_gives_up_after_max_attempts(self):
+        message = self.enqueue(1)[0]
+        for _ in range(3):
+            OutboxMessage.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+            with self.failing({message.id}):
+                self.assertEqual(dispatch_outbox_batch(self.sqs), (0, 1))
+        OutboxMessage.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+        # Left in the table for inspection
+        self.assertEqual(dispatch_outbox_batch(self.sqs), (0, 0))
+        self.assertEqual(OutboxMessage.objects.get().attempts, 3)
+
+    def test_unreachable_queue_fails_the_whole_batch(self):
+        self.enqueue(3)
+        with mock.patch('shop.aws.SQS_QUEUE_URL', self.queue_url + '-missing'):
+            self.assertEqual(dispatch_outbox_batch(self.sqs), (0, 3))
+        self.assertEqual(list(OutboxMessage.objects.values_list('attempts', flat=True)), [1, 1, 1])
+
+
+class ClientRegistryTests(TestCase):
+    """
+    One boto3 client per (service, region), shared by the process and
+    rebuilt after a fork.
+    """
+
+    def setUp(self):
+        reset_clients()
+        self.addCleanup(reset_clients)
+
+    def test_clients_are_shared_per_service_and_region(self):
+        s3 = get_client('s3')
+        self.assertIs(get_client('s3'), s3)
+        self.assertIsNot(get_client('s3', 'eu-west-1'), s3)
+        self.assertIsNot(get_client('sqs'), s3)
+        self.assertEqual(client_stats(), {'created': 3, 'reused': 1, 'cached': 3})
+
+    def test_child_process_drops_inherited_clients(self):
+        s3 = get_client('s3')
+        # As a forked child sees it: the registry belongs to another pid
+        with mock.patch('shop.aws._clients_pid', -1):
+            child_s3 = get_client('s3')
+        self.assertIsNot(child_s3, s3)
+        self.assertEqual(client_stats(), {'created': 1, 'reused': 0, 'cached': 1})
+
+
+class CountingBytesIO(io.BytesIO):
+    """BytesIO that counts the bytes read from it."""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+class ImageStoreTests(TestCase):
+    """
+    store_original and the variants against an S3 bucket mocked by moto:
+    one read of the upload, content-addressed keys, no staging objects left
+    behind, and variants resized and encoded per format.
+    """
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        # Clients cached before the mock started would reach the network
+        reset_clients()
+        self.addCleanup(reset_clients)
+        self.s3 = get_client('s3')
+        self.s3.create_bucket(Bucket=AWS_STORAGE_BUCKET_NAME)
+
+    def keys(self):
+        return [item['Key'] for item in self.s3.list_objects_v2(Bucket=AWS_STORAGE_BUCKET_NAME).get('Contents', [])]
+
+    def test_upload_is_read_once_and_stored_by_content(self):
+        data = b'image bytes' * 1000
+        image = SimpleUploadedFile('photo.JPG', b'', 'image/jpeg')
+        image.file = CountingBytesIO(data)
+        url, digest = store_original(image)
+        self.assertEqual(image.file.bytes_read, len(data))
+        self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+        self.assertTrue(url.endswith(f'media/products/{digest}.jpg'))
+        self.assertEqual(self.keys(), [f'media/products/{digest}.jpg'])
+        stored = self.s3.get_object(Bucket=AWS_STORAGE_BUCKET_NAME, Key=f'media/products/{digest}.jpg')
+        self.assertEqual((stored['Body'].read(), stored['ContentType']), (data, 'image/jpeg'))
+
+        # The same content from another seller shares the object
+        self.assertEqual(store_original(SimpleUploadedFile('other.jpg', data, 'image/jpeg')), (url, digest))
+        self.assertEqual(self.keys(), [f'media/products/{digest}.jpg'])
+
+    def upload_image(self, size, mode='RGB', image_format='JPEG', name='photo.jpg'):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new(mode, size, 'red').save(buffer, image_format)
+        url, digest = store_original(SimpleUploadedFile(name, buffer.getvalue(), f'image/{image_format.lower()}'))
+        return object_key_from_url(url), digest
+
+    def open_variant(self, key):
+        from PIL import Image
+        stored = self.s3.get_object(Bucket=AWS_STORAGE_BUCKET_NAME, Key=key)
+        self.assertEqual(stored['CacheControl'], VARIANT_CACHE_CONTROL)
+        return Image.open(io.BytesIO(stored['Body'].read())), stored['ContentType']
+
+    def test_variants_are_resized_in_each_format(self):
+        object_name, digest = self.upload_image((1200, 900))
+        urls = render_variants(object_name, digest, {'thumb': 200, 'medium': 800}, webp=True)
+        expected = {
+            'thumb': (200, 150, 'jpg', 'JPEG'), 'thumb_webp': (200, 150, 'webp', 'WEBP'),
+            'medium': (800, 600, 'jpg', 'JPEG'), 'medium_webp': (800, 600, 'webp', 'WEBP'),
+        }
+        self.assertEqual(set(urls), set(expected))
+        for variant, (width, height, extension, image_format) in expected.items():
+            with self.subTest(variant=variant):
+                key = variant_key(digest, variant.removesuffix('_webp'), extension)
+                self.assertEqual(urls[variant], object_url(key))
+                image, content_type = self.open_variant(key)
+                self.assertEqual((image.size, image.format), ((width, height), image_format))
+                self.assertEqual(content_type, f'image/{image_format.lower()}')
+
+    def test_transparent_variants_stay_png(self):
+        object_name, digest = self.upload_image((400, 400), 'RGBA', 'PNG', 'logo.png')
+        urls = render_variants(object_name, digest, {'thumb': 200}, webp=False)
+        self.assertEqual(urls, {'thumb': object_url(variant_key(digest, 'thumb', 'png'))})
+        image, content_type = self.open_variant(variant_key(digest, 'thumb', 'png'))
+        self.assertEqual((image.size, image.format, image.mode, content_type), ((200, 200), 'PNG', 'RGBA', 'image/png'))
+
+    def test_variants_are_stored_on_the_product(self):
+        seller = User.objects.create_user('seller', 'seller@example.com', 'pw', is_seller=True)
+        product = Product.objects.create(
+            seller=seller, name='Phone', description='', price='9.99', stock=1, image_url='https://example.com/a.jpg',
+        )
+        done = Future()
+        done.set_result({'thumb': 'https://example.com/thumb.jpg'})
+        version = catalog_stamp(seller.id)[0]
+        _store_variants(product.id, seller.id, product.image_url, threading.get_ident(), done)
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {'thumb': 'https://example.com/thumb.jpg'})
+        self.assertNotEqual(catalog_stamp(seller.id)[0], version)
+
+        # Variants of an image the product no longer has are dropped
+        stale = Future()
+        stale.set_result({'thumb': 'https://example.com/old-thumb.jpg'})
+        _store_variants(product.id, seller.id, 'https://example.com/old.jpg', threading.get_ident(), stale)
+        failed = Future()
+        failed.set_exception(OSError('cannot identify image file'))
+        with self.assertLogs('shop.images', 'ERROR') as logs:
+            _store_variants(product.id, seller.id, product.image_url, threading.get_ident(), failed)
+        self.assertIn(f'Image processing failed for product {product.id}', logs.output[0])
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {'thumb': 'https://example.com/thumb.jpg'})
+
+    def test_failed_upload_is_logged(self):
+        self.s3.delete_bucket(Bucket=AWS_STORAGE_BUCKET_NAME)
+        with self.assertLogs('shop.aws', 'ERROR') as logs:
+            self.assertIsNone(upload_fileobj_to_s3(io.BytesIO(b'data'), 'media/products/lost.jpg'))
+        self.assertIn('Upload of media/products/lost.jpg failed', logs.output[0])
+        self.assertIn('Traceback', logs.output[0])
+
+    def test_image_workers_are_not_forked(self):
+        with mock.patch('shop.images._executor', None), override_settings(IMAGE_PROCESS_WORKERS=1):
+            executor = get_image_executor()
+        self.addCleanup(executor.shutdown)
+        self.assertIn(executor._mp_context.get_start_method(), ('forkserver', 'spawn'))
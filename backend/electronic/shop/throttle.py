@@ -0,0 +1,67 @@
+'''
+    Token buckets that shed excess login and registration attempts
+
+    Buckets live in the shared cache, so every worker draws from the same
+    ones. A bucket is read and written back without a lock: two attempts
+    arriving together may both take its last token, which is close enough
+    for load shedding.
+'''
+
+import hashlib
+import time
+from django.conf import settings
+from .cache import get_cache
+
+BUCKET_KEY = 'shop:bucket:{}:{}'
+
+
+def take_token(scope, key, capacity, rate):
+    """
+    Take one token from the bucket of `key` in `scope`.
+
+    :param capacity: Tokens a full bucket holds, i.e. the burst allowed
+    :param rate: Tokens added back per second
+    :return: 0 if a token was taken, else the seconds until one is available
+    """
+    cache = get_cache()
+    # Usernames may hold characters memcached keys cannot
+    cache_key = BUCKET_KEY.format(scope, hashlib.md5(str(key).encode('utf-8')).hexdigest())
+    now = time.time()
+    tokens, updated_at = cache.get(cache_key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated_at) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+    # Expires once it would have refilled anyway
+    cache.set(cache_key, (tokens - 1, now), timeout=int(capacity / rate) + 1)
+    return 0
+
+
+def client_ip(request):
+    """
+    The client address; with USE_X_FORWARDED_FOR, the one the proxy in
+    front appended to X-Forwarded-For.
+    """
+    if getattr(settings, 'USE_X_FORWARDED_FOR', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def login_retry_after(request, username=None):
+    """
+    Charge a login or registration attempt to the LOGIN_IP_BUCKET of the
+    client and, for logins, the LOGIN_USERNAME_BUCKET of the account.
+    A bucket setting of None turns that limit off.
+
+    :return: 0 if the attempt may go ahead, else seconds to wait
+    """
+    buckets = [('ip', client_ip(request), getattr(settings, 'LOGIN_IP_BUCKET', None))]
+    if username:
+        buckets.append(('username', username.lower(), getattr(settings, 'LOGIN_USERNAME_BUCKET', None)))
+    for scope, key, bucket in buckets:
+        if bucket:
+            wait = take_token(scope, key, *bucket)
+            if wait:
+                return wait
+    return 0
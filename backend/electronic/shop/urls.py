@@ -1,19 +1,30 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_VIEWS:
+    from . import async_views as hot_views
+else:
+    hot_views = views
+
 urlpatterns = [
-    path('products/', views.home, name='home'),
-    path('product/', views.product_detail, name='product_detail'),
+    path('products/', hot_views.home, name='home'),
+    path('product/', hot_views.product_detail, name='product_detail'),
+    path('products/search/', views.search, name='search'),
+    path('products/autocomplete/', views.autocomplete, name='autocomplete'),
     path('seller/products/', views.seller_products, name='seller_products'),
     path('seller/add/', views.add_product, name='add_product'),
     path('seller/delete/', views.delete_product, name='delete_product'),
-    path('order/', views.place_order, name='place_order'),
+    path('order/', hot_views.place_order, name='place_order'),
+    path('order/batch/', views.place_bulk_order, name='place_bulk_order'),
     path('orders/', views.order_history, name='order_history'),
     path('register/', views.register, name='register'),
     path('user/', views.get_user_info, name='get_user_info'),
     path('login/', views.login_user, name='login'),
     path('seller/edit/', views.edit_product, name='edit_product'),
     path('seller/orders/', views.seller_orders, name='seller_order'),
-    path('orders/<int:order_id>/receipt/', views.get_order_receipt, name='order-receipt'),
+    path('seller/dashboard/', views.seller_sales_dashboard, name='seller_dashboard'),
+    path('orders/<int:order_id>/receipt/', hot_views.get_order_receipt, name='order-receipt'),
+    path('metrics/', views.metrics, name='metrics'),
 
 ]
@@ -1,21 +1,54 @@
-import os
+import base64
+import binascii
 import json
-import tempfile
-import boto3
+import logging
+import math
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
-from django.contrib.auth import get_user_model, authenticate
+from django.http import HttpResponse, JsonResponse, HttpResponseNotModified
+from django.contrib.auth import get_user_model
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.http import JsonResponse
 from .models import Product
 from electronic.settings import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_STORAGE_BUCKET_NAME, AWS_REGION_NAME, SNS_TOPIC_ARN, SQS_QUEUE_URL
-from .aws import send_seller_notification, upload_to_s3, delete_from_s3, subscribe_seller_to_sns
+from .aws import object_key_from_url, delete_from_s3, subscribe_seller_to_sns
 from .models import Product, Order
+from .cache import cached_payload, bump_catalog_version
+from .stock import add_shard_stock, in_stock_condition, reserve_stock_bulk, OutOfStock
+from .orders import create_order, order_data
+from .outbox import enqueue_seller_notifications
+from .images import store_original, schedule_variants
+from .receipts import get_or_create_receipt, stored_receipt, schedule_receipt
+from .sales import record_sales, seller_dashboard
+from .search import search_products
+from .facets import cached_facets
+from .serializers import FastJsonResponse, Schema, BUYER_ORDER, SELLER_ORDER
+from .exports import EXPORT_FORMATS, export_response, keyset_after
+from .authentication import tokens_for
+from .replicas import read_replica
+from .passwords import HashingBusy, authenticate_user, hash_password
+from .throttle import client_ip, login_retry_after
+from .metrics import metrics_allowed, render_metrics
+from .conditional import (
+    conditional, catalog_etag, catalog_last_modified, seller_catalog_etag, seller_catalog_last_modified,
+    product_etag, product_last_modified, order_history_etag, order_history_last_modified, etag_matches,
+)
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+def too_many_attempts(retry_after, message='Too many attempts, try again later', status=429):
+    response = JsonResponse({'error': message}, status=status)
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
 
 # Register API
 @csrf_exempt
@@ -29,6 +62,10 @@ def register(request):
             is_seller = data.get('is_seller', False)  # Default to False if not provided
             is_buyer = data.get('is_buyer', False)    # Default to False if not provided
 
+            retry_after = login_retry_after(request)
+            if retry_after:
+                return too_many_attempts(retry_after)
+
             # Check if user already exists
             if User.objects.filter(username=username).exists():
                 return JsonResponse({'error': 'Username already taken'}, status=400)
@@ -37,11 +74,11 @@ def register(request):
             if not (is_seller or is_buyer):
                 return JsonResponse({'error': 'User must be either a buyer or a seller.'}, status=400)
 
-            # Create the user with roles
-            user = User.objects.create_user(
-                username=username,
-                password=password,
-                email=email,
+            # Create the user with roles; the password is hashed in the pool
+            user = User(
+                username=User.normalize_username(username),
+                password=hash_password(password),
+                email=User.objects.normalize_email(email),
                 is_seller=is_seller,
                 is_buyer=is_buyer,
             )
@@ -54,6 +91,8 @@ def register(request):
             return JsonResponse({'message': 'User registered successfully'}, status=201)
         except KeyError as e:
             return JsonResponse({'error': f'Missing field: {str(e)}'}, status=400)
+        except HashingBusy as e:
+            return too_many_attempts(1, str(e), status=503)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
     return JsonResponse({'error': 'Invalid method'}, status=405)
@@ -67,11 +106,17 @@ def login_user(request):
             data = json.loads(request.body)
             username = data.get('username')
             password = data.get('password')
+            if username is not None and not isinstance(username, str):
+                return JsonResponse({'error': 'Username must be a string'}, status=400)
+
+            retry_after = login_retry_after(request, username)
+            if retry_after:
+                return too_many_attempts(retry_after)
 
-            user = authenticate(username=username, password=password)
+            user = authenticate_user(username, password)
             if user is not None:
-                # Generate JWT tokens
-                refresh = RefreshToken.for_user(user)
+                # Generate JWT tokens; they carry the roles (shop/authentication.py)
+                refresh = tokens_for(user)
                 return JsonResponse({
                     'message': 'Login successful',
                     'username': user.username,
@@ -82,6 +127,8 @@ def login_user(request):
                 }, status=200)
             else:
                 return JsonResponse({'error': 'Invalid username or password'}, status=401)
+        except HashingBusy as e:
+            return too_many_attempts(1, str(e), status=503)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
     return JsonResponse({'error': 'Invalid method'}, status=405)
@@ -97,58 +144,403 @@ def get_user_info(request):
         'is_buyer': user.is_buyer,
     })
 
+# Catalog fields clients may request through `?fields=`
+PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'stock', 'image_url', 'image_variants', 'seller_id')
+PRODUCT_PAGE_SIZE = 50
+PRODUCT_PAGE_SIZE_MAX = 200
+# Catalog sorts; each is served by an index on (column, id)
+PRODUCT_SORTS = ('id', 'price', '-price', 'stock', '-stock')
+SEARCH_RESULTS_MAX = 50
+AUTOCOMPLETE_RESULTS = 10
+DASHBOARD_MAX_DAYS = 366
+
+
+def parse_product_fields(raw):
+    """
+    Turn a `fields=a,b,c` query value into a tuple of model columns.
+
+    Unknown names are rejected so the projection can be passed straight to
+    `.values()`. `id` is always included because it is the pagination cursor.
+    """
+    if not raw:
+        return PRODUCT_FIELDS
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return tuple(dict.fromkeys(fields))
+
+
+def parse_product_id(request):
+    """The `product_id` query parameter as an int; raises ValueError if missing or malformed."""
+    raw = request.GET.get('product_id')
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid product_id: {raw}')
+
+
+def parse_cart(data):
+    """
+    Read a bulk order body: an `address` and a non-empty `items` list of
+    {"product_id", "quantity"} objects.
+
+    :return: Tuple of (address, quantities), with repeated products merged
+        into one quantity per product id
+    :raises ValueError: With the message for the client
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    address = data.get('address')
+    if not isinstance(address, str) or not address.strip():
+        raise ValueError('Missing field: address')
+    items = data.get('items')
+    if not isinstance(items, list):
+        raise ValueError('items must be a list of {"product_id", "quantity"} objects')
+    if not items:
+        raise ValueError('Cart is empty')
+    quantities = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f'items[{index}] must be an object')
+        try:
+            product_id, quantity = int(item['product_id']), int(item['quantity'])
+        except KeyError as e:
+            raise ValueError(f'Missing field: items[{index}].{e.args[0]}')
+        except (TypeError, ValueError):
+            raise ValueError(f'items[{index}]: product_id and quantity must be integers')
+        if quantity <= 0:
+            raise ValueError('Quantity must be positive')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return address, quantities
+
+
+def parse_limit(request):
+    limit = int(request.GET.get('limit', PRODUCT_PAGE_SIZE))
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, PRODUCT_PAGE_SIZE_MAX)
+
+
+def parse_page_params(request, sort='id'):
+    """
+    Read the keyset cursor and page size from the query string.
+
+    Pages in id order take the last id as cursor; other sorts use an opaque
+    cursor holding the last (sort value, id) pair.
+    """
+    cursor = request.GET.get('cursor')
+    if not cursor:
+        cursor = None
+    elif sort == 'id':
+        cursor = int(cursor)
+    else:
+        cursor = decode_sort_cursor(cursor)
+    return cursor, parse_limit(request)
+
+
+def parse_product_filters(request):
+    """
+    Read the catalog filters and sort order from the query string.
+
+    :return: Tuple of (filters, sort); `filters` only holds the filters
+        that were given, normalized so they can be used as cache params.
+    """
+    filters = {}
+    for name in ('min_price', 'max_price'):
+        raw = request.GET.get(name)
+        if raw:
+            try:
+                value = Decimal(raw)
+            except InvalidOperation:
+                raise ValueError(f'Invalid {name}: {raw}')
+            # Infinity and NaN parse, but no column can be compared with them
+            if not value.is_finite():
+                raise ValueError(f'Invalid {name}: {raw}')
+            filters[name] = str(value)
+    sellers = request.GET.get('seller')
+    if sellers:
+        try:
+            filters['seller'] = ','.join(str(seller_id) for seller_id in sorted({int(v) for v in sellers.split(',')}))
+        except ValueError:
+            raise ValueError(f'Invalid seller: {sellers}')
+    in_stock = request.GET.get('in_stock', '').lower()
+    if in_stock in ('1', 'true'):
+        filters['in_stock'] = True
+
+    sort = request.GET.get('sort') or 'id'
+    if sort not in PRODUCT_SORTS:
+        raise ValueError(f"Unknown sort: {sort} (use one of {', '.join(PRODUCT_SORTS)})")
+    return filters, sort
+
+
+def filter_products(queryset, filters):
+    """Apply filters returned by `parse_product_filters`."""
+    if 'min_price' in filters:
+        queryset = queryset.filter(price__gte=filters['min_price'])
+    if 'max_price' in filters:
+        queryset = queryset.filter(price__lte=filters['max_price'])
+    if 'seller' in filters:
+        queryset = queryset.filter(seller_id__in=filters['seller'].split(','))
+    if filters.get('in_stock'):
+        queryset = queryset.filter(in_stock_condition())
+    return queryset
+
+
+def parse_export_format(request):
+    """
+    Read `?export=ndjson|csv`, which streams the whole list instead of a page.
+
+    (Not `format`, which DRF reserves for content negotiation.)
+    """
+    export_format = request.GET.get('export')
+    if not export_format:
+        return None
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format} (use one of {', '.join(EXPORT_FORMATS)})")
+    return export_format
+
+
+def encode_sort_cursor(row, sort):
+    """Opaque cursor pointing just after `row` in a `sort`-ordered page."""
+    field = sort.lstrip('-')
+    raw = json.dumps([str(row[field]), row['id']])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_sort_cursor(cursor):
+    """Inverse of `encode_sort_cursor`; raises ValueError if malformed."""
+    try:
+        value, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return Decimal(value), int(product_id)
+    except (TypeError, ValueError, InvalidOperation, binascii.Error):
+        raise ValueError('Invalid cursor')
+
+
+def encode_order_cursor(created_at, order_id):
+    """Opaque cursor pointing just after an order in a newest-first feed."""
+    raw = json.dumps([created_at.isoformat(), order_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_order_cursor(cursor):
+    """Inverse of `encode_order_cursor`; raises ValueError if malformed."""
+    if not cursor:
+        return None
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        created_at = parse_datetime(created_at)
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError('Invalid cursor')
+    if created_at is None:
+        raise ValueError('Invalid cursor')
+    return created_at, int(order_id)
+
+
+def parse_date_param(raw, name, end=False):
+    """
+    Parse a `since`/`until` filter given as an ISO date or datetime.
+
+    A bare date covers the whole day, so as an `end` bound it means the
+    following midnight.
+    """
+    if not raw:
+        return None
+    value = parse_datetime(raw)
+    if value is None:
+        day = parse_date(raw)
+        if day is None:
+            raise ValueError(f'Invalid {name}: {raw}')
+        value = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def sorted_page_queryset(queryset, sort, cursor):
+    """
+    Order `queryset` by `sort` (ties broken by id) and skip to `cursor`.
+    """
+    if sort == 'id':
+        if cursor is not None:
+            queryset = queryset.filter(id__gt=cursor)
+        return queryset.order_by('id')
+
+    field = sort.lstrip('-')
+    descending = sort.startswith('-')
+    if cursor is not None:
+        queryset = queryset.filter(keyset_after((field, 'id'), cursor, descending))
+    # Both columns in the same direction, so (field, id) indexes serve either
+    return queryset.order_by(sort, '-id' if descending else 'id')
+
+
+def trim_page(rows, fields, sort, limit):
+    """
+    Cut the extra look-ahead row off a page and build the next cursor.
+
+    :return: Tuple of (rows, next cursor or None)
+    """
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]['id'] if sort == 'id' else encode_sort_cursor(rows[-1], sort)
+    field = sort.lstrip('-')
+    if field not in fields:
+        # Only fetched to build the cursor
+        for row in rows:
+            del row[field]
+    return rows, next_cursor
+
+
+def page_fields(fields, sort):
+    """Columns to read for a page: the requested ones plus the sort key."""
+    field = sort.lstrip('-')
+    return fields if field in fields else fields + (field,)
+
+
+def keyset_page(queryset, fields, cursor, limit, sort='id'):
+    """
+    Fetch one page of rows ordered by `sort`, starting after `cursor`.
+
+    One extra row is read to know whether a next page exists, so the cost
+    of a request depends on `limit` only, never on the table size.
+    """
+    queryset = sorted_page_queryset(queryset, sort, cursor)
+    rows = list(queryset.values(*page_fields(fields, sort))[:limit + 1])
+    return trim_page(rows, fields, sort, limit)
+
+
+def product_export_transform(fields):
+    """Chunk transform adding shard stock to exported products, if `stock` is exported."""
+    if 'stock' not in fields:
+        return None
+    id_index, stock_index = fields.index('id'), fields.index('stock')
+    return lambda rows: add_shard_stock([list(row) for row in rows], id_index, stock_index)
+
+
 # Home Page (Product List)
 @api_view(['GET'])
+@read_replica
+@conditional(catalog_etag, catalog_last_modified)
 def home(request):
-    products = Product.objects.all()
-    product_list = [
-        {
+    try:
+        fields = parse_product_fields(request.GET.get('fields'))
+        filters, sort = parse_product_filters(request)
+        cursor, limit = parse_page_params(request, sort)
+        export_format = parse_export_format(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if export_format:
+        fields = page_fields(fields, sort)
+        ordering = ('id',) if sort == 'id' else (sort, '-id' if sort.startswith('-') else 'id')
+        return export_response(
+            filter_products(Product.objects.all(), filters),
+            Schema({field: field for field in fields}), ordering, export_format, 'products',
+            transform=product_export_transform(fields),
+        )
+
+    def build():
+        queryset = filter_products(Product.objects.all(), filters)
+        product_list, next_cursor = keyset_page(queryset, fields, cursor, limit, sort)
+        return {'products': add_shard_stock(product_list), 'next_cursor': next_cursor}
+
+    params = dict(filters, fields=','.join(fields), sort=sort, cursor=request.GET.get('cursor'), limit=limit)
+    payload = cached_payload('home', build, params)
+    if request.GET.get('facets', '').lower() in ('1', 'true'):
+        queryset = filter_products(Product.objects.all(), filters)
+        payload = dict(payload, facets=cached_facets(queryset, filters))
+    return FastJsonResponse(payload)
+
+# Product Detail API
+@api_view(['GET'])
+@read_replica
+@conditional(product_etag, product_last_modified)
+def product_detail(request):
+    try:
+        product_id = parse_product_id(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    def build():
+        product = get_object_or_404(Product, id=product_id)
+        product_data = {
             'id': product.id,
             'name': product.name,
             'description': product.description,
             'price': product.price,
             'stock': product.stock,
             'image_url': product.image_url,
-            'seller_id': product.seller.id,
-        } for product in products
-    ]
-    return JsonResponse({'products': product_list})
+            'image_variants': product.image_variants,
+            'seller_id': product.seller_id,
+        }
+        add_shard_stock([product_data])
+        return {'product': product_data}
 
-# Product Detail API
+    return FastJsonResponse(cached_payload('product_detail', build, {'product_id': product_id}))
+
+# Product Search
 @api_view(['GET'])
-def product_detail(request):
-    print(request)
-    product_id = request.product_id
-    product = get_object_or_404(Product, id=product_id)
-    product_data = {
-        'id': product.id,
-        'name': product.name,
-        'description': product.description,
-        'price': product.price,
-        'stock': product.stock,
-        'image_url': product.image_url,
-        'seller_id': product.seller.id,
-    }
-    return JsonResponse({'product': product_data})
+@read_replica
+@conditional(catalog_etag, catalog_last_modified)
+def search(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'Missing query: q'}, status=400)
+    try:
+        fields = parse_product_fields(request.GET.get('fields'))
+        limit = min(parse_limit(request), SEARCH_RESULTS_MAX)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    def build():
+        return {'products': add_shard_stock(search_products(query, fields, limit))}
+
+    params = {'q': query.lower(), 'fields': ','.join(fields), 'limit': limit}
+    return FastJsonResponse(cached_payload('search', build, params))
+
+# Search-as-you-type suggestions
+@api_view(['GET'])
+@read_replica
+@conditional(catalog_etag, catalog_last_modified)
+def autocomplete(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'suggestions': []})
+
+    def build():
+        rows = search_products(query, ('id', 'name'), AUTOCOMPLETE_RESULTS, prefix=True)
+        return {'suggestions': [{'id': row['id'], 'name': row['name']} for row in rows]}
+
+    return FastJsonResponse(cached_payload('autocomplete', build, {'q': query.lower()}))
 
 # Seller Product Management
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_replica
+@conditional(seller_catalog_etag, seller_catalog_last_modified, private=True)
 def seller_products(request):
     if not request.user.is_seller:
         return JsonResponse({'error': 'Unauthorized'}, status=403)
-    products = Product.objects.filter(seller=request.user)
-    product_list = [
-        {
-            'id': product.id,
-            'name': product.name,
-            'description': product.description,
-            'price': product.price,
-            'stock': product.stock,
-            'image_url': product.image_url,
-        } for product in products
-    ]
-    return JsonResponse({'products': product_list})
+
+    def build():
+        products = Product.objects.filter(seller_id=request.user.id)
+        product_list = [
+            {
+                'id': product.id,
+                'name': product.name,
+                'description': product.description,
+                'price': product.price,
+                'stock': product.stock,
+                'image_url': product.image_url,
+                'image_variants': product.image_variants,
+            } for product in products
+        ]
+        return {'products': add_shard_stock(product_list)}
+
+    return FastJsonResponse(cached_payload('seller_products', build, seller_id=request.user.id))
 
 # Add Product API (Protected)
 @api_view(['POST'])
@@ -165,17 +557,8 @@ def add_product(request):
             if not image:
                 return JsonResponse({"error": "No image file provided"}, status=400)
 
-            # Use a temporary file
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                temp_file.write(image.read())
-                temp_path = temp_file.name
-
-            # Define object name and upload to S3
-            object_name = f"media/products/{image.name}"
-            file_url = upload_to_s3(temp_path, object_name)
-
-            # Clean up temporary file
-            os.remove(temp_path)
+            # Stream the upload to S3 under a content-addressed key
+            file_url, digest = store_original(image)
 
             if file_url:
                 # Save product to the database
@@ -185,8 +568,9 @@ def add_product(request):
                     price=price,
                     stock=stock,
                     image_url=file_url,
-                    seller=request.user,
+                    seller_id=request.user.id,
                 )
+                schedule_variants(product, digest)
                 return JsonResponse({"message": "Product added successfully", "product_id": product.id})
             else:
                 return JsonResponse({"error": "Failed to upload image"}, status=500)
@@ -208,12 +592,13 @@ def delete_product(request):
         data = json.loads(request.body)
         product_id = data.get('product_id')
 
-        product = Product.objects.get(id=product_id, seller=request.user)
+        product = Product.objects.get(id=product_id, seller_id=request.user.id)
 
-        # Delete the image from S3
-        if product.image_url:
-            object_name = product.image_url.split("/")[-1]  # Extract the S3 key
-            delete_from_s3(f"media/products/{object_name}")
+        # Delete the image and its variants from S3 unless another product shares them
+        if product.image_url and not Product.objects.filter(image_url=product.image_url).exclude(id=product.id).exists():
+            delete_from_s3(object_key_from_url(product.image_url))
+            for variant_url in product.image_variants.values():
+                delete_from_s3(object_key_from_url(variant_url))
 
         product.delete()
         return JsonResponse({'message': 'Product deleted successfully'}, status=200)
@@ -227,9 +612,8 @@ def delete_product(request):
 def edit_product(request):
     try:
         # Extract product_id and validate the seller
-        print(request.data)
         product_id = request.data.get('product_id')
-        product = Product.objects.get(id=product_id, seller=request.user)
+        product = Product.objects.get(id=product_id, seller_id=request.user.id)
 
         # Update product details
         product.name = request.data.get('name', product.name)
@@ -241,25 +625,19 @@ def edit_product(request):
         if 'image' in request.FILES:
             image = request.FILES['image']
 
-            # Save the file temporarily
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                temp_file.write(image.read())
-                temp_path = temp_file.name
-
-            # Define object name and upload to S3
-            object_name = f"media/products/{image.name}"
-            file_url = upload_to_s3(temp_path, object_name)
-
-            # Clean up temporary file
-            os.remove(temp_path)
+            # Stream the upload to S3 under a content-addressed key
+            file_url, digest = store_original(image)
 
             if file_url:
-                # Update the product's image URL
+                # Update the product's image URL; variants are rebuilt in the background
                 product.image_url = file_url
+                product.image_variants = {}
             else:
                 return JsonResponse({"error": "Failed to upload image"}, status=500)
 
         product.save()
+        if 'image' in request.FILES:
+            schedule_variants(product, digest)
         return JsonResponse({'message': 'Product updated successfully'}, status=200)
     except Product.DoesNotExist:
         return JsonResponse({'error': 'Product not found or unauthorized'}, status=404)
@@ -282,49 +660,102 @@ def place_order(request):
         quantity = int(data.get('quantity'))
         address = data.get('address')
 
+        if quantity <= 0:
+            return JsonResponse({'error': 'Quantity must be positive'}, status=400)
+
         # Validate product existence
-        product = get_object_or_404(Product, id=product_id)
+        product = get_object_or_404(Product.objects.select_related('seller'), id=product_id)
 
-        # Calculate total price and create order
-        total_price = product.price * quantity
-        order = Order.objects.create(
-            buyer=request.user,
-            product=product,
-            quantity=quantity,
-            address=address,
-            total_price=total_price,
-        )
+        # Reserve the stock and create the order together
+        order = create_order(request.user, product, quantity, address)
+        return FastJsonResponse({'order': order_data(order, product)}, status=201)
 
-        # Reduce product stock and save
-        product.stock -= quantity
-        product.save()
+    except OutOfStock as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except KeyError as e:
+        return JsonResponse({'error': f'Missing field: {str(e)}'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
 
-        message_body = {
-            "order_id": order.id,
-            "product_name": product.name,
-            "quantity": quantity,
-            "total_price": total_price,
-            "seller_id": product.seller.id,
-            "buyer_username": request.user.username,
-            "seller_email": product.seller.email
-        }
 
-        send_seller_notification(message_body)
-        # Prepare response data
-        order_data = {
-            'id': order.id,
-            'product': {
-                'id': product.id,
-                'name': product.name,
-            },
-            'quantity': order.quantity,
-            'total_price': order.total_price,
-            'address': order.address,
-        }
-        return JsonResponse({'order': order_data}, status=201)
+# Place Bulk Order API (Protected)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def place_bulk_order(request):
+    """Place one order per cart item, all in a single transaction."""
+    if not request.user.is_buyer:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
 
-    except KeyError as e:
-        return JsonResponse({'error': f'Missing field: {str(e)}'}, status=400)
+    try:
+        # Repeated products are merged so each row is locked and updated once
+        address, quantities = parse_cart(request.data)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        with transaction.atomic():
+            if not connection.features.can_return_rows_from_bulk_insert:
+                # Serialize this buyer's carts so the ids of the rows inserted
+                # below can be read back (MySQL does not return them).
+                list(User.objects.select_for_update().filter(id=request.user.id).values_list('id'))
+
+            products = reserve_stock_bulk(quantities)
+            orders = Order.objects.bulk_create([
+                Order(
+                    buyer_id=request.user.id,
+                    product=products[product_id],
+                    seller_id=products[product_id].seller_id,
+                    quantity=quantity,
+                    address=address,
+                    total_price=products[product_id].price * quantity,
+                )
+                for product_id, quantity in quantities.items()
+            ])
+            if orders and orders[0].id is None:
+                ids = Order.objects.filter(buyer_id=request.user.id).order_by('-id').values_list('id', flat=True)[:len(orders)]
+                for order, order_id in zip(orders, sorted(ids)):
+                    order.id = order_id
+
+            seller_ids = {product.seller_id for product in products.values()}
+            sellers = User.objects.only('id', 'email').in_bulk(seller_ids)
+            enqueue_seller_notifications([
+                {
+                    "order_id": order.id,
+                    "product_name": products[order.product_id].name,
+                    "quantity": order.quantity,
+                    "total_price": order.total_price,
+                    "seller_id": products[order.product_id].seller_id,
+                    "buyer_username": request.user.username,
+                    "seller_email": sellers[products[order.product_id].seller_id].email,
+                }
+                for order in orders
+            ])
+            record_sales(orders)
+            for order in orders:
+                transaction.on_commit(partial(schedule_receipt, order.id))
+
+        for seller_id in seller_ids:
+            bump_catalog_version(seller_id)
+
+        order_list = [
+            {
+                'id': order.id,
+                'product': {
+                    'id': order.product_id,
+                    'name': products[order.product_id].name,
+                },
+                'quantity': order.quantity,
+                'total_price': order.total_price,
+                'address': order.address,
+            }
+            for order in orders
+        ]
+        return FastJsonResponse({'orders': order_list}, status=201)
+
+    except Product.DoesNotExist as e:
+        return JsonResponse({'error': str(e)}, status=404)
+    except OutOfStock as e:
+        return JsonResponse({'error': str(e)}, status=409)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -332,107 +763,113 @@ def place_order(request):
 # View Order History API (Protected)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_replica
+@conditional(order_history_etag, order_history_last_modified, private=True)
 def order_history(request):
     if not request.user.is_buyer:
         return JsonResponse({'error': 'Unauthorized'}, status=403)
 
-    orders = Order.objects.filter(buyer=request.user).select_related('product')
-    order_list = [
-        {
-            'id': order.id,
-            'product': {
-                'id': order.product.id,
-                'name': order.product.name,
-            },
-            'quantity': order.quantity,
-            'total_price': order.total_price,
-            'address': order.address,
-            'created_at': order.created_at,
-        }
-        for order in orders
-    ]
-    return JsonResponse(order_list, safe=False)
+    try:
+        export_format = parse_export_format(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    orders = Order.history.filter(buyer_id=request.user.id)
+    if export_format:
+        return export_response(orders, BUYER_ORDER, ('-created_at', '-id'), export_format, 'orders')
+    return FastJsonResponse(BUYER_ORDER.rows(orders.order_by('-created_at', '-id')))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_replica
 def seller_orders(request):
     if not request.user.is_seller:
         return JsonResponse({'error': 'Unauthorized'}, status=403)
 
-    # Get products belonging to the logged-in seller
-    seller_products = Product.objects.filter(seller=request.user)
-
-    # Get orders for those products
-    orders = Order.objects.filter(product__in=seller_products).select_related('product', 'buyer')
-
-    # Serialize the data
-    order_list = [
-        {
-            'id': order.id,
-            'product': {
-                'id': order.product.id,
-                'name': order.product.name,
-            },
-            'buyer': {
-                'id': order.buyer.id,
-                'username': order.buyer.username,
-            },
-            'quantity': order.quantity,
-            'total_price': order.total_price,
-            'address': order.address,
-            'created_at': order.created_at,
-        }
-        for order in orders
-    ]
-    return JsonResponse({'orders': order_list}, safe=False)
+    try:
+        cursor = decode_order_cursor(request.GET.get('cursor'))
+        since = parse_date_param(request.GET.get('since'), 'since')
+        until = parse_date_param(request.GET.get('until'), 'until', end=True)
+        limit = parse_limit(request)
+        export_format = parse_export_format(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # One range of order_seller_created_idx (archived_seller_created_idx): this seller, newest first
+    orders = Order.history.filter(seller_id=request.user.id)
+    if since:
+        orders = orders.filter(created_at__gte=since)
+    if until:
+        orders = orders.filter(created_at__lt=until)
+    if export_format:
+        # The whole range, whatever cursor and limit say
+        return export_response(orders, SELLER_ORDER, ('-created_at', '-id'), export_format, 'sales')
+    if cursor:
+        orders = orders.filter(keyset_after(('created_at', 'id'), cursor, descending=True))
+    # Pages run on from the newest orders into the archive
+    order_list = SELLER_ORDER.rows(orders.order_by('-created_at', '-id')[:limit + 1])
+
+    next_cursor = None
+    if len(order_list) > limit:
+        order_list = order_list[:limit]
+        next_cursor = encode_order_cursor(order_list[-1]['created_at'], order_list[-1]['id'])
+
+    return FastJsonResponse({'orders': order_list, 'next_cursor': next_cursor})
+
+# Seller Dashboard API (Protected)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@read_replica
+def seller_sales_dashboard(request):
+    if not request.user.is_seller:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+
+    try:
+        today = timezone.localdate()
+        since = parse_date(request.GET.get('since', '')) or today - timedelta(days=29)
+        until = parse_date(request.GET.get('until', '')) or today
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if since > until:
+        return JsonResponse({'error': 'since must not be after until'}, status=400)
+    if (until - since).days >= DASHBOARD_MAX_DAYS:
+        return JsonResponse({'error': f'Range is limited to {DASHBOARD_MAX_DAYS} days'}, status=400)
+
+    return FastJsonResponse(seller_dashboard(request.user.id, since, until))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_order_receipt(request, order_id):
     """Fetch and generate a receipt for a specific order."""
     try:
-        # Ensure the order belongs to the logged-in user
-        order = Order.objects.get(id=order_id, buyer=request.user)
-
-        # Prepare the payload for the Lambda function
-        payload = {
-            "order_id": order.id,
-            "product_name": order.product.name,
-            "quantity": order.quantity,
-            "total_price": f"${order.total_price:.2f}",  # Format as a currency string
-            "address": order.address,
-            "ordered_at": order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-        }
-
-        # Set up the AWS Lambda client
-        lambda_client = boto3.client('lambda',
-                                     aws_access_key_id=AWS_ACCESS_KEY_ID,
-                                     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-                                     region_name=AWS_REGION_NAME
-                                     )
-
-        # Invoke the Lambda function synchronously
-        response = lambda_client.invoke(
-            FunctionName="make_receipt",
-            InvocationType="RequestResponse",
-            Payload=json.dumps(payload)
-        )
+        # Receipts never change, so a stored one answers without touching the order
+        receipt = stored_receipt(order_id, request.user.id)
+        if receipt:
+            body, etag = receipt['body'], receipt['etag']
+        else:
+            # Ensure the order belongs to the logged-in user
+            order = Order.history.select_related('product').get(id=order_id, buyer_id=request.user.id)
+            body, etag = get_or_create_receipt(order)
 
-        # Process the Lambda response
-        response_payload = json.loads(response['Payload'].read().decode('utf-8'))
-        print(response_payload)
-        
-        # Check if the Lambda function executed successfully
-        if 'statusCode' in response_payload and response_payload['statusCode'] == 200:
-            return JsonResponse(json.loads(response_payload['body']), safe=False)
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
         else:
-            # Handle cases where the Lambda function returns an error
-            return JsonResponse({
-                'error': response_payload.get('error', 'Failed to generate receipt')
-            }, status=500)
+            response = FastJsonResponse(body)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=86400'
+        return response
 
     except Order.DoesNotExist:
         return JsonResponse({'error': 'Order not found'}, status=404)
     except Exception as e:
-        print(e)
+        logger.exception('Receipt of order %s failed', order_id)
         return JsonResponse({'error': str(e)}, status=500)
+
+
+# Metrics (Prometheus text, scraped from METRICS_ALLOWED_NETWORKS only)
+def metrics(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid method'}, status=405)
+    if not metrics_allowed(client_ip(request)):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
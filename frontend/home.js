@@ -40,21 +40,27 @@ async function setGreeting() {
 }
 
 // Fetch and Display Products
-async function loadProducts() {
+// The API returns a page at a time; next_cursor is null on the last page
+let nextProductCursor = null;
+
+async function loadProducts(cursor = null) {
     const fullOrigin = window.location.origin;
     const apiUrl = "http://electronic-shop-env.eba-t639vept.us-east-1.elasticbeanstalk.com";
     const productList = document.getElementById('product-list');
+    const loadMoreButton = document.getElementById('load-more-products');
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
     try {
-        const response = await fetch(`${apiUrl}:8000/api/products/`);
+        const response = await fetch(`${apiUrl}:8000/api/products/${query}`);
         if (response.ok) {
             const data = await response.json();
 
-            if (data.products.length === 0) {
+            if (!cursor) {
+                productList.innerHTML = ''; // Clear any existing products
+            }
+            if (!cursor && data.products.length === 0) {
                 productList.innerHTML = '<p>No products available.</p>';
-                return;
             }
 
-            productList.innerHTML = ''; // Clear any existing products
             data.products.forEach(product => {
                 const productCard = `
                     <div class="product-card">
@@ -67,6 +73,9 @@ async function loadProducts() {
                 `;
                 productList.innerHTML += productCard;
             });
+
+            nextProductCursor = data.next_cursor;
+            loadMoreButton.style.display = nextProductCursor ? 'block' : 'none';
         } else {
             productList.innerHTML = '<p>Failed to load products. Please try again later.</p>';
             console.error('Failed to fetch products');
@@ -77,6 +86,11 @@ async function loadProducts() {
     }
 }
 
+// Load More Button: fetch the page after the last one shown
+document.getElementById('load-more-products').addEventListener('click', () => {
+    loadProducts(nextProductCursor);
+});
+
 // Buy Now Button Handler
 function buyNow(productId, productName, productPrice) {
     const queryString = `checkout.html?id=${productId}&name=${encodeURIComponent(productName)}&price=${productPrice}`;
@@ -100,14 +100,19 @@ async function loadProducts() {
 
 
 // Fetch and display order history
-async function loadOrderHistory() {
+// Orders come a page at a time, newest first; next_cursor is null on the last page
+let nextOrderCursor = null;
+
+async function loadOrderHistory(cursor = null) {
     const fullOrigin = window.location.origin;
     const apiUrl = "http://electronic-shop-env.eba-t639vept.us-east-1.elasticbeanstalk.com";
     const token = localStorage.getItem('access_token');
     const orderList = document.getElementById('order-list');
+    const loadMoreButton = document.getElementById('load-more-orders');
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
 
     try {
-        const response = await fetch(`${apiUrl}:8000/api/seller/orders/`, {
+        const response = await fetch(`${apiUrl}:8000/api/seller/orders/${query}`, {
             method: 'GET',
             headers: {
                 'Content-Type': 'application/json',
@@ -121,13 +126,14 @@ async function loadOrderHistory() {
             // Adjust for API response format
             const orders = Array.isArray(data) ? data : data.orders;
 
-            if (!orders || orders.length === 0) {
+            if (!cursor) {
+                orderList.innerHTML = '';
+            }
+            if (!cursor && (!orders || orders.length === 0)) {
                 orderList.innerHTML = '<p>No orders have been placed for your products yet.</p>';
-                return;
             }
 
-            orderList.innerHTML = '';
-            orders.forEach(order => {
+            (orders || []).forEach(order => {
                 const orderCard = `
                     <div class="order-card">
                         <h3>Order #${order.id}</h3>
@@ -141,6 +147,11 @@ async function loadOrderHistory() {
                 `;
                 orderList.innerHTML += orderCard;
             });
+
+            nextOrderCursor = Array.isArray(data) ? null : data.next_cursor;
+            if (loadMoreButton) {
+                loadMoreButton.style.display = nextOrderCursor ? 'block' : 'none';
+            }
         } else {
             console.error('Failed to fetch orders');
             orderList.innerHTML = '<p class="error-message">Failed to load orders. Please try again later.</p>';
@@ -151,6 +162,11 @@ async function loadOrderHistory() {
     }
 }
 
+// Load more orders: fetch the page after the last one shown
+function loadMoreOrders() {
+    loadOrderHistory(nextOrderCursor);
+}
+
 
 // Logout function
 function logout() {